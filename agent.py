@@ -1,5 +1,12 @@
 import os
-from typing import List, Dict
+import time
+import asyncio
+import threading
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, List, Dict, Iterator, Optional, Tuple
+
+import httpx
+import numpy as np
 
 from dotenv import load_dotenv, find_dotenv
 load_dotenv(find_dotenv(), override=True)
@@ -8,11 +15,46 @@ print("[DBG] OPENAI_API_KEY prefix:", (os.getenv("OPENAI_API_KEY") or "")[:12])
 
 from datapizza.agents import Agent
 from datapizza.clients.openai import OpenAIClient
+from openai import AsyncOpenAI
 from datapizza.tools import tool
 # Rich tracing disabled for RAM on Render/local.
 # from datapizza.tracing import ContextTracing
 
-from retriever import get_retriever
+from caching import SemanticCache, normalize_query
+from context_builder import build_context, chunk_header
+from metrics import ANSWERS, CONTEXT_TOKENS, current_timings, record_llm_usage, record_stage, stage
+from relevance import canned_reply, gate_enabled, is_relevant
+from retriever import Retriever, get_retriever
+
+# How a chat turn is answered:
+# - "prefetch" (default): retrieve first, put the chunks in the prompt, one LLM call.
+# - "agent": tool-calling agent that decides when to call get_candidate_context
+#   (at least two sequential LLM calls per question).
+CHAT_MODE = os.environ.get("CHAT_MODE", "prefetch").strip().lower()
+
+RETRIEVAL_TOP_K = 3
+
+# HTTP pool shared by every request (keep-alive connections to the OpenAI API).
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", "200"))
+LLM_MAX_KEEPALIVE = int(os.environ.get("LLM_MAX_KEEPALIVE", "50"))
+LLM_TIMEOUT_S = float(os.environ.get("LLM_TIMEOUT_S", "60"))
+# Any OpenAI-compatible endpoint, e.g. the local stub_llm.py for load tests (unset = OpenAI)
+LLM_BASE_URL = os.environ.get("OPENAI_BASE_URL", "").strip() or None
+
+# Near-duplicate questions reuse a stored answer (no LLM call).
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", "256"))
+ANSWER_CACHE_TTL_S = float(os.environ.get("ANSWER_CACHE_TTL_S", "3600"))
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("ANSWER_CACHE_THRESHOLD", "0.95"))
+
+_ANSWER_CACHE = SemanticCache(
+    max_size=ANSWER_CACHE_SIZE,
+    ttl_s=ANSWER_CACHE_TTL_S,
+    threshold=ANSWER_CACHE_THRESHOLD,
+)
+
+# ---- App-scoped LLM client (built once, shared by all requests) ----
+_LLM_CLIENT_SINGLETON: Optional[OpenAIClient] = None
+_LLM_CLIENT_LOCK = threading.Lock()
 
 SYSTEM_PROMPT = """
 You are the personal AI assistant of Francesco Colasurdo.
@@ -33,58 +75,550 @@ Rules:
 """.strip()
 
 
+class RetrievalContext:
+    """
+    Per-request record of what the retriever returned to the agent.
+
+    - Every call of get_candidate_context appends its chunks here.
+    - answer_question builds `sources` from it, so the sources are exactly
+      the chunks the LLM saw and retrieval is never re-run just for the API.
+    - `retriever` pins the index version for the whole request (a hot reload
+      swaps the singleton, the tool keeps using this instance).
+    - `context_tokens` sums the context tokens sent to the LLM (see context_builder.py).
+    - `prefetch()` hands over chunks already retrieved for a query (the relevance gate's),
+      so a tool call for that same query does not retrieve again.
+    """
+
+    def __init__(self, retriever: Optional[Retriever] = None) -> None:
+        self.calls: List[Dict[str, Any]] = []
+        self.retriever = retriever
+        self.context_tokens = 0
+        self._prefetched: Dict[str, List[Dict[str, Any]]] = {}
+
+    def prefetch(self, query: str, chunks: List[Dict[str, Any]]) -> None:
+        self._prefetched[normalize_query(query)] = chunks
+
+    def take_prefetched(self, query: str) -> Optional[List[Dict[str, Any]]]:
+        """Chunks prefetched for this query (once), None if the tool must retrieve."""
+        return self._prefetched.pop(normalize_query(query), None)
+
+    def record(self, query: str, chunks: List[Dict[str, Any]], context_tokens: int = 0) -> None:
+        self.calls.append({"query": query, "chunks": chunks})
+        self.context_tokens += context_tokens
+
+    def sources(self) -> List[Dict[str, Any]]:
+        """
+        Returns the chunks seen across all tool calls, de-duplicated by chunk_id
+        (first-seen order, best score kept).
+        """
+        by_id: Dict[str, Dict[str, Any]] = {}
+        for call in self.calls:
+            for c in call["chunks"]:
+                prev = by_id.get(c["chunk_id"])
+                if prev is None:
+                    by_id[c["chunk_id"]] = {
+                        "source": c["source"],
+                        "chunk_id": c["chunk_id"],
+                        "score": c["score"],
+                    }
+                elif c["score"] > prev["score"]:
+                    prev["score"] = c["score"]
+        return list(by_id.values())
+
+
+# Context of the request currently being answered (None outside answer_question).
+_RETRIEVAL_CONTEXT: ContextVar[Optional[RetrievalContext]] = ContextVar(
+    "retrieval_context", default=None
+)
+
+
 @tool(
     name="get_candidate_context",
     description="Retrieve verified information about Francesco's actual skills, thesis work, and project responsibilities."
 )
 def get_candidate_context(question: str) -> str:
     """
-    Retrieve relevant knowledge chunks from vectors.json via cached Retriever.
+    Retrieve relevant knowledge chunks from the index via cached Retriever.
     """
-    retriever = get_retriever(vectors_path="vectors.json")
-    top_chunks = retriever.retrieve(question, top_k=3)
+    ctx = _RETRIEVAL_CONTEXT.get()
+    retriever = ctx.retriever if ctx is not None and ctx.retriever is not None else get_retriever()
+    with stage("tool"):
+        top_chunks = ctx.take_prefetched(question) if ctx is not None else None
+        if top_chunks is None:
+            top_chunks = retriever.retrieve(question, top_k=RETRIEVAL_TOP_K)
+        context, included, report = build_context(question, top_chunks)
+    CONTEXT_TOKENS.inc(report["tokens"])
 
-    parts: List[str] = []
-    for c in top_chunks:
-        parts.append(
-            f"[SOURCE: {c['source']} / {c['chunk_id']} | SCORE: {c['score']:.4f}]\n{c['text']}"
-        )
-    return "\n\n".join(parts)
+    if ctx is not None:
+        # Only the chunks that made it into the budget count as sources
+        ctx.record(question, included, report["tokens"])
+
+    return context
+
+
+@tool(
+    name="get_candidate_context",
+    description="Retrieve verified information about Francesco's actual skills, thesis work, and project responsibilities."
+)
+async def a_get_candidate_context(question: str) -> str:
+    """
+    Async twin of get_candidate_context for Agent.a_run: retrieval is CPU-bound,
+    so it runs in a worker thread instead of blocking the event loop.
+    (asyncio.to_thread copies the ContextVar, so the RetrievalContext still records.)
+    """
+    return await asyncio.to_thread(get_candidate_context, question)
+
+
+def format_context(chunks: List[Dict[str, Any]]) -> str:
+    """
+    Renders whole chunks, no token budget (debugging / comparisons with build_context).
+    """
+    return "\n\n".join(f"{chunk_header(c)}\n{c['text']}" for c in chunks)
+
+
+def build_prompt(user_question: str, context: str) -> str:
+    """
+    User message for the "prefetch" mode: the candidate context (already assembled
+    within the token budget by build_context) goes straight into the prompt, so the
+    model can answer without a tool-calling round trip.
+    """
+    return (
+        "Candidate context (retrieved from my documents):\n"
+        f"{context}\n\n"
+        f"Question: {user_question}"
+    )
 
 
 def build_llm_client() -> OpenAIClient:
+    """
+    Builds an OpenAIClient whose sync and async transports use pooled,
+    keep-alive HTTP connections. Prefer get_llm_client(), which builds it once.
+    """
     api_key = os.environ.get("OPENAI_API_KEY", "").strip()
     if not api_key:
         raise RuntimeError(
             "Missing OPENAI_API_KEY in environment. Set it before running the agent."
         )
-    return OpenAIClient(api_key=api_key, model="gpt-4o-mini")
+    limits = httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE,
+    )
+    timeout = httpx.Timeout(LLM_TIMEOUT_S, connect=5.0)
+    client = OpenAIClient(
+        api_key=api_key,
+        model="gpt-4o-mini",
+        base_url=LLM_BASE_URL,
+        timeout=timeout,
+        http_client=httpx.Client(limits=limits, timeout=timeout),
+    )
+    # datapizza builds its AsyncOpenAI lazily without an http_client argument:
+    # set it up front so async calls share one pooled AsyncClient as well.
+    client.a_client = AsyncOpenAI(
+        api_key=api_key,
+        base_url=LLM_BASE_URL,
+        timeout=timeout,
+        http_client=httpx.AsyncClient(limits=limits, timeout=timeout),
+    )
+    return client
+
+
+def get_llm_client() -> OpenAIClient:
+    global _LLM_CLIENT_SINGLETON
+    if _LLM_CLIENT_SINGLETON is None:
+        with _LLM_CLIENT_LOCK:
+            if _LLM_CLIENT_SINGLETON is None:
+                _LLM_CLIENT_SINGLETON = build_llm_client()
+    return _LLM_CLIENT_SINGLETON
+
 
+async def close_llm_client() -> None:
+    """Closes the pooled connections of the shared client (app shutdown)."""
+    global _LLM_CLIENT_SINGLETON
+    client, _LLM_CLIENT_SINGLETON = _LLM_CLIENT_SINGLETON, None
+    if client is None:
+        return
+    if client.a_client is not None:
+        await client.a_client.close()
+    if client.client is not None:
+        client.client.close()
 
-def build_agent() -> Agent:
-    client = build_llm_client()
+
+def build_agent(async_tools: bool = False) -> Agent:
+    # The Agent is cheap and keeps per-run memory, so it is built per request;
+    # the expensive part (the HTTP client) is shared.
     agent = Agent(
         name="cv-assistant",
-        client=client,
+        client=get_llm_client(),
         system_prompt=SYSTEM_PROMPT,
-        tools=[get_candidate_context],
+        tools=[a_get_candidate_context if async_tools else get_candidate_context],
     )
     return agent
 
 
+def _context_for_prompt(
+    user_question: str, retriever: Retriever, top_chunks: List[Dict[str, Any]]
+) -> Tuple[str, RetrievalContext]:
+    """Assembles the retrieved chunks into the context text within CONTEXT_TOKEN_BUDGET."""
+    with stage("context"):
+        context, included, report = build_context(user_question, top_chunks)
+    CONTEXT_TOKENS.inc(report["tokens"])
+
+    ctx = RetrievalContext(retriever)
+    ctx.record(user_question, included, report["tokens"])
+    return context, ctx
+
+
+def _pre_retrieve() -> bool:
+    # Prefetch mode always needs the chunks; agent mode only for the relevance gate.
+    return CHAT_MODE != "agent" or gate_enabled()
+
+
 def answer_question(user_question: str) -> Dict[str, object]:
+    retriever = get_retriever()
+    # Same embedding the retriever uses next (served from its LRU), so no extra encode.
+    query_vec = _answer_cache_key(retriever, user_question)
+    cached = _lookup_answer(query_vec, retriever.index_version)
+    if cached is not None:
+        return {**cached, "question": user_question}
+
+    # Relevance gate: nothing in the index covers the question -> canned reply, no LLM.
+    # With the gate off, agent mode leaves retrieval to the tool (the LLM may rephrase
+    # the query, so chunks retrieved here would often be fetched a second time).
+    top_chunks = None
+    if _pre_retrieve():
+        top_chunks = retriever.retrieve(user_question, top_k=RETRIEVAL_TOP_K)
+        if not is_relevant(top_chunks):
+            return _gated_answer(user_question)
+
+    if CHAT_MODE == "agent":
+        result = _answer_with_agent(user_question, retriever, top_chunks)
+    else:
+        result = _answer_with_prefetch(user_question, retriever, top_chunks)
+
+    _cache_answer(query_vec, retriever.index_version, result["answer"], result["sources"])
+    return result
+
+
+def _gated_answer(user_question: str) -> Dict[str, object]:
+    ANSWERS.inc(outcome="gated")
+    return {
+        "answer": canned_reply(user_question),
+        "sources": [],
+        "question": user_question,
+        "context_tokens": 0,
+        "gated": True,
+    }
+
+
+def _answer_cache_key(retriever, user_question: str) -> Optional[np.ndarray]:
+    # While the embedding model is still loading (degraded startup) there is no
+    # query vector: skip the semantic cache rather than block on the model.
+    if not retriever.dense_available():
+        return None
+    with stage("embed"):
+        return retriever.embed_query(user_question)
+
+
+async def _a_answer_cache_key(retriever, user_question: str) -> Optional[np.ndarray]:
+    # Awaits the embedding batcher on the event loop (no worker thread while encoding)
+    if not retriever.dense_available():
+        return None
+    with stage("embed"):
+        return await retriever.a_embed_query(user_question)
+
+
+def _lookup_answer(query_vec: Optional[np.ndarray], index_version: str) -> Optional[Dict[str, Any]]:
+    if query_vec is None:
+        return None
+    cached = _ANSWER_CACHE.lookup(query_vec, version=index_version)
+    if cached is not None:
+        ANSWERS.inc(outcome="cached")
+    return cached
+
+
+def _record_llm_answer(response: Any) -> None:
+    # Token usage as reported by the API (absent on some streamed responses)
+    record_llm_usage(response)
+    ANSWERS.inc(outcome="llm")
+
+
+def _cache_answer(query_vec, index_version: str, answer: str, sources: List[Dict[str, Any]]) -> None:
+    if answer and query_vec is not None:
+        _ANSWER_CACHE.store(query_vec, {"answer": answer, "sources": sources}, version=index_version)
+
+
+def answer_cache_stats() -> Dict[str, Any]:
+    return _ANSWER_CACHE.stats()
+
+
+def _answer_with_prefetch(
+    user_question: str, retriever: Retriever, top_chunks: List[Dict[str, Any]]
+) -> Dict[str, object]:
+    """
+    Single-completion path: retrieval already done (by the relevance gate),
+    one LLM call with the context inline.
+    """
+    context, ctx = _context_for_prompt(user_question, retriever, top_chunks)
+
+    with stage("llm"):
+        response = get_llm_client().invoke(
+            input=build_prompt(user_question, context),
+            system_prompt=SYSTEM_PROMPT,
+        )
+    _record_llm_answer(response)
+
+    return {
+        "answer": response.text,
+        "sources": ctx.sources(),
+        "question": user_question,
+        "context_tokens": ctx.context_tokens,
+    }
+
+
+def stream_answer(user_question: str) -> Iterator[Dict[str, Any]]:
+    """
+    Streaming variant of the "prefetch" path (retrieve first, one completion).
+
+    Yields events in this order:
+    - {"event": "sources", "data": [...]}           as soon as retrieval finishes
+    - {"event": "token", "data": "<text delta>"}    for every streamed delta
+    - {"event": "done", "data": {"timings_ms": {...}, "context_tokens": n}}
+    A question rejected by the relevance gate (relevance.py) gets the canned reply
+    as a single token event, no sources and "gated": true in done.
+
+    Streaming always uses pre-retrieval, whatever CHAT_MODE is: the sources must be
+    known before the first token, which the tool-calling agent cannot guarantee.
+    """
+    t_start = time.perf_counter()
+
+    retriever = get_retriever()
+    query_vec = _answer_cache_key(retriever, user_question)
+    cached = _lookup_answer(query_vec, retriever.index_version)
+    if cached is not None:
+        yield from _cached_events(cached, t_start)
+        return
+
+    top_chunks = retriever.retrieve(user_question, top_k=RETRIEVAL_TOP_K)
+    t_retrieved = time.perf_counter()
+    if not is_relevant(top_chunks):
+        yield from _gated_events(user_question, t_start, t_retrieved)
+        return
+    context, ctx = _context_for_prompt(user_question, retriever, top_chunks)
+    sources = ctx.sources()
+    yield {"event": "sources", "data": sources}
+
+    t_llm = time.perf_counter()
+    t_first_token = None
+    deltas: List[str] = []
+    final = None
+    # The whole stream is the "llm" stage, so a failure mid-stream is attributed to it
+    with stage("llm"):
+        for chunk in get_llm_client().stream_invoke(
+            input=build_prompt(user_question, context),
+            system_prompt=SYSTEM_PROMPT,
+        ):
+            if not chunk.delta:
+                # The final ClientResponse carries the full text again, not a delta.
+                final = chunk
+                continue
+            if t_first_token is None:
+                t_first_token = time.perf_counter()
+                record_stage("llm_first_token", (t_first_token - t_llm) * 1000.0)
+            deltas.append(chunk.delta)
+            yield {"event": "token", "data": chunk.delta}
+    t_end = time.perf_counter()
+    _record_llm_answer(final)
+
+    _cache_answer(query_vec, retriever.index_version, "".join(deltas), sources)
+    yield _done_event(t_start, t_retrieved, t_first_token, t_end, ctx.context_tokens)
+
+
+async def a_stream_answer(user_question: str) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Async twin of stream_answer: same events, the LLM stream is awaited on the
+    shared AsyncOpenAI pool and retrieval runs in a worker thread.
+    """
+    t_start = time.perf_counter()
+
+    retriever = get_retriever()
+    query_vec = await _a_answer_cache_key(retriever, user_question)
+    cached = _lookup_answer(query_vec, retriever.index_version)
+    if cached is not None:
+        for ev in _cached_events(cached, t_start):
+            yield ev
+        return
+
+    top_chunks = await asyncio.to_thread(retriever.retrieve, user_question, RETRIEVAL_TOP_K)
+    t_retrieved = time.perf_counter()
+    if not is_relevant(top_chunks):
+        for ev in _gated_events(user_question, t_start, t_retrieved):
+            yield ev
+        return
+    context, ctx = _context_for_prompt(user_question, retriever, top_chunks)
+    sources = ctx.sources()
+    yield {"event": "sources", "data": sources}
+
+    t_llm = time.perf_counter()
+    t_first_token = None
+    deltas: List[str] = []
+    final = None
+    with stage("llm"):
+        async for chunk in get_llm_client().a_stream_invoke(
+            input=build_prompt(user_question, context),
+            system_prompt=SYSTEM_PROMPT,
+        ):
+            if not chunk.delta:
+                final = chunk
+                continue
+            if t_first_token is None:
+                t_first_token = time.perf_counter()
+                record_stage("llm_first_token", (t_first_token - t_llm) * 1000.0)
+            deltas.append(chunk.delta)
+            yield {"event": "token", "data": chunk.delta}
+    t_end = time.perf_counter()
+    _record_llm_answer(final)
+
+    _cache_answer(query_vec, retriever.index_version, "".join(deltas), sources)
+    yield _done_event(t_start, t_retrieved, t_first_token, t_end, ctx.context_tokens)
+
+
+def _cached_events(cached: Dict[str, Any], t_start: float) -> Iterator[Dict[str, Any]]:
+    # A cache hit replays the stored answer as a single token event.
+    t_hit = time.perf_counter()
+    yield {"event": "sources", "data": cached["sources"]}
+    yield {"event": "token", "data": cached["answer"]}
+    done = _done_event(t_start, t_hit, t_hit, t_hit)
+    done["data"]["cached"] = True
+    yield done
+
+
+def _gated_events(user_question: str, t_start: float, t_retrieved: float) -> Iterator[Dict[str, Any]]:
+    # The relevance gate answers with the canned reply as a single token event.
+    gated = _gated_answer(user_question)
+    yield {"event": "sources", "data": gated["sources"]}
+    yield {"event": "token", "data": gated["answer"]}
+    done = _done_event(t_start, t_retrieved, t_retrieved, t_retrieved)
+    done["data"]["gated"] = True
+    yield done
+
+
+def _done_event(
+    t_start: float,
+    t_retrieved: float,
+    t_first_token: Optional[float],
+    t_end: float,
+    context_tokens: int = 0,
+) -> Dict[str, Any]:
+    timings = {
+        "retrieval": (t_retrieved - t_start) * 1000.0,
+        "first_token": ((t_first_token or t_end) - t_start) * 1000.0,
+        "llm": (t_end - t_retrieved) * 1000.0,
+        "total": (t_end - t_start) * 1000.0,
+    }
+    data: Dict[str, Any] = {
+        "timings_ms": {k: round(v, 1) for k, v in timings.items()},
+        "context_tokens": context_tokens,
+    }
+    # Per-stage breakdown (embed, dense, sparse, ...): the Server-Timing header of a
+    # stream is sent before these stages run
+    request_timings = current_timings()
+    if request_timings is not None:
+        data["stages_ms"] = {k: v for k, v in request_timings.as_dict().items() if k != "total"}
+    return {"event": "done", "data": data}
+
+
+def _answer_with_agent(
+    user_question: str, retriever: Retriever, top_chunks: Optional[List[Dict[str, Any]]] = None
+) -> Dict[str, object]:
     agent = build_agent()
 
-    # senza tracing "ricco"
-    agent_response = agent.run(user_question)
+    # The tool records its results here, so retrieval runs once per tool call; the
+    # chunks the relevance gate already retrieved serve the tool call for the question.
+    ctx = RetrievalContext(retriever)
+    if top_chunks is not None:
+        ctx.prefetch(user_question, top_chunks)
+    token = _RETRIEVAL_CONTEXT.set(ctx)
+    try:
+        # senza tracing "ricco"
+        with stage("agent"):
+            agent_response = agent.run(user_question)
+    finally:
+        _RETRIEVAL_CONTEXT.reset(token)
+    _record_llm_answer(agent_response)
     final_answer_text = getattr(agent_response, "text", str(agent_response))
 
-    retriever = get_retriever(vectors_path="vectors.json")
-    top_chunks = retriever.retrieve(user_question, top_k=3)
+    sources = ctx.sources()
+
+    return {
+        "answer": final_answer_text,
+        "sources": sources,
+        "question": user_question,
+        "context_tokens": ctx.context_tokens,
+    }
+
+
+async def a_answer_question(user_question: str) -> Dict[str, object]:
+    """
+    Async twin of answer_question: awaits the LLM on the shared connection pool
+    instead of holding a worker thread for the whole call.
+    """
+    retriever = get_retriever()
+    query_vec = await _a_answer_cache_key(retriever, user_question)
+    cached = _lookup_answer(query_vec, retriever.index_version)
+    if cached is not None:
+        return {**cached, "question": user_question}
+
+    top_chunks = None
+    if _pre_retrieve():
+        top_chunks = await asyncio.to_thread(retriever.retrieve, user_question, RETRIEVAL_TOP_K)
+        if not is_relevant(top_chunks):
+            return _gated_answer(user_question)
+
+    if CHAT_MODE == "agent":
+        result = await _a_answer_with_agent(user_question, retriever, top_chunks)
+    else:
+        result = await _a_answer_with_prefetch(user_question, retriever, top_chunks)
 
-    sources = [
-        {"source": c["source"], "chunk_id": c["chunk_id"], "score": c["score"]}
-        for c in top_chunks
-    ]
+    _cache_answer(query_vec, retriever.index_version, result["answer"], result["sources"])
+    return result
 
-    return {"answer": final_answer_text, "sources": sources, "question": user_question}
+
+async def _a_answer_with_agent(
+    user_question: str, retriever: Retriever, top_chunks: Optional[List[Dict[str, Any]]] = None
+) -> Dict[str, object]:
+    agent = build_agent(async_tools=True)
+    ctx = RetrievalContext(retriever)
+    if top_chunks is not None:
+        ctx.prefetch(user_question, top_chunks)
+    token = _RETRIEVAL_CONTEXT.set(ctx)
+    try:
+        with stage("agent"):
+            agent_response = await agent.a_run(user_question)
+    finally:
+        _RETRIEVAL_CONTEXT.reset(token)
+    _record_llm_answer(agent_response)
+    final_answer_text = getattr(agent_response, "text", str(agent_response))
+    return {
+        "answer": final_answer_text,
+        "sources": ctx.sources(),
+        "question": user_question,
+        "context_tokens": ctx.context_tokens,
+    }
+
+
+async def _a_answer_with_prefetch(
+    user_question: str, retriever: Retriever, top_chunks: List[Dict[str, Any]]
+) -> Dict[str, object]:
+    context, ctx = _context_for_prompt(user_question, retriever, top_chunks)
+    with stage("llm"):
+        response = await get_llm_client().a_invoke(
+            input=build_prompt(user_question, context),
+            system_prompt=SYSTEM_PROMPT,
+        )
+    _record_llm_answer(response)
+    return {
+        "answer": response.text,
+        "sources": ctx.sources(),
+        "question": user_question,
+        "context_tokens": ctx.context_tokens,
+    }
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+# benchmark.py
+#
+# Retrieval micro-benchmarks over synthetic corpora + JSON reports that can be compared
+# between commits (loadtest.py writes its reports in the same format).
+#
+# For every corpus size (default 22 = this CV, 1k, 10k, 100k chunks) it:
+# 1. generates a synthetic markdown corpus (Zipf-distributed words, one section per
+#    chunk) and random unit embeddings (the embedding model is not involved: its cost is
+#    measured by `onnx_encoder.py parity` / the batcher stats, and it would dominate);
+# 2. times the index build phases: chunk (chunker.py over the documents), store
+#    (VectorStoreWriter), dense_indexes (int8/float16 copies, IVF from 1,024 chunks),
+#    sparse (build_tfidf: TF-IDF + BM25 + vocab parity check), load (Retriever init);
+# 3. times the query path per call, with the query embeddings already in the LRU:
+#    retrieve, _sparse_search_ids, the dense backends (exact/int8/float16/ivf),
+#    _rrf_scores on the dense + sparse candidate lists, and retrieve_many (one batch).
+#
+# Usage:
+#   python benchmark.py micro                              # -> bench_results/micro-<commit>.json
+#   python benchmark.py micro --sizes 22,1000 --queries 100 --out before.json
+#   python benchmark.py compare before.json after.json     # exit 1 on a >15% regression
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+RESULTS_DIR = Path(os.environ.get("BENCH_RESULTS_DIR", "bench_results"))
+DEFAULT_SIZES = "22,1000,10000,100000"
+# all-MiniLM-L6-v2 dimension
+SYNTHETIC_DIM = 384
+# Configuration that changes the numbers, recorded with every report
+_CONFIG_ENV = (
+    "DENSE_INDEX_MODE", "DENSE_RESCORE_FACTOR", "DENSE_NPROBE", "RETRIEVAL_MMR_LAMBDA",
+    "EMBEDDING_BACKEND", "EMBED_BATCHING", "EMBEDDING_CACHE_SIZE", "CHAT_MODE",
+    "CONTEXT_TOKEN_BUDGET", "RELEVANCE_GATE", "ANSWER_CACHE_SIZE", "OMP_NUM_THREADS",
+)
+
+
+# ---- Reports (shared with loadtest.py) ----
+def _git(*args: str) -> str:
+    try:
+        out = subprocess.run(["git", *args], capture_output=True, text=True, timeout=30)
+        return out.stdout.strip() if out.returncode == 0 else ""
+    except Exception:
+        return ""
+
+
+def run_metadata() -> Dict[str, Any]:
+    """Where and on what the numbers were measured (commit, machine, config)."""
+    return {
+        "commit": _git("rev-parse", "--short", "HEAD") or "unknown",
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "env": {k: os.environ[k] for k in _CONFIG_ENV if k in os.environ},
+    }
+
+
+def latency_summary(samples_ms: Sequence[float]) -> Dict[str, float]:
+    a = np.asarray(samples_ms, dtype=np.float64)
+    if a.size == 0:
+        return {"n": 0}
+    return {
+        "n": int(a.size),
+        "mean_ms": round(float(a.mean()), 4),
+        "p50_ms": round(float(np.percentile(a, 50)), 4),
+        "p95_ms": round(float(np.percentile(a, 95)), 4),
+        "p99_ms": round(float(np.percentile(a, 99)), 4),
+        "max_ms": round(float(a.max()), 4),
+        "ops_per_s": round(1000.0 / float(a.mean()), 1) if a.mean() > 0 else 0.0,
+    }
+
+
+def write_report(report: Dict[str, Any], out: Optional[str] = None) -> Path:
+    path = Path(out) if out else RESULTS_DIR / f"{report['kind']}-{report['meta']['commit']}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"[INFO] Report written to {path}")
+    return path
+
+
+def _flatten(obj: Any, prefix: str = "") -> Dict[str, float]:
+    if isinstance(obj, dict):
+        out: Dict[str, float] = {}
+        for k, v in obj.items():
+            out.update(_flatten(v, f"{prefix}/{k}" if prefix else str(k)))
+        return out
+    if isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        return {prefix: float(obj)}
+    return {}
+
+
+def _direction(metric: str) -> int:
+    """+1 higher is better, -1 lower is better, 0 informational."""
+    leaf = metric.rsplit("/", 1)[-1]
+    if leaf.endswith("per_s") or leaf == "rps":
+        return 1
+    if leaf.endswith("_ms") or leaf == "seconds" or leaf.endswith("_mb") or leaf == "error_rate":
+        return -1
+    return 0
+
+
+def compare(base_path: str, new_path: str, threshold: float = 0.15, min_ms: float = 0.05) -> int:
+    """
+    Prints the metrics of `results` that changed by more than `threshold` (relative) and
+    returns how many of them got worse. Latencies below min_ms on both sides are ignored
+    (timer noise).
+    """
+    base, new = (json.loads(Path(p).read_text(encoding="utf-8")) for p in (base_path, new_path))
+    if base.get("kind") != new.get("kind"):
+        print(f"[WARN] Comparing a {base.get('kind')} report with a {new.get('kind')} report")
+    a, b = _flatten(base.get("results", {})), _flatten(new.get("results", {}))
+    print(f"base {base['meta']['commit']} ({base['meta']['timestamp']}) -> "
+          f"new {new['meta']['commit']} ({new['meta']['timestamp']})")
+    regressions = 0
+    for metric in sorted(set(a) & set(b)):
+        sign = _direction(metric)
+        old, cur = a[metric], b[metric]
+        if sign == 0 or old == 0:
+            continue
+        if metric.endswith("_ms") and max(old, cur) < min_ms:
+            continue
+        change = (cur - old) / abs(old)
+        if abs(change) < threshold:
+            continue
+        worse = change * sign < 0
+        regressions += worse
+        print(f"  {'WORSE' if worse else 'better':6} {metric}: {old:g} -> {cur:g} ({change:+.0%})")
+    missing = sorted(set(a) - set(b))
+    if missing:
+        print(f"  ({len(missing)} metrics of the base report are missing from the new one)")
+    print(f"{regressions} regression(s) above {threshold:.0%}")
+    return regressions
+
+
+# ---- Synthetic corpus ----
+def _base_vocabulary(data_dir: str = "data") -> List[str]:
+    # Real words of the knowledge base first, so the analyzer sees plausible tokens
+    words: Dict[str, None] = {}
+    for path in sorted(Path(data_dir).glob("*.md")):
+        for w in path.read_text(encoding="utf-8").lower().split():
+            w = w.strip(".,;:!?()[]*#`\"'")
+            if w.isalpha() and len(w) > 2:
+                words[w] = None
+    return list(words)
+
+
+def synthetic_corpus(n_chunks: int, seed: int = 0, chunks_per_doc: int = 20,
+                     words_per_chunk: Tuple[int, int] = (60, 140)) -> List[Dict[str, Any]]:
+    """
+    n_chunks sections of Zipf-distributed words (vocabulary growing with the corpus,
+    like real text), grouped into documents of chunks_per_doc sections each.
+    """
+    rng = np.random.default_rng(seed)
+    vocab = _base_vocabulary()
+    extra = 2000 + n_chunks // 2 - len(vocab)
+    vocab += [f"term{i:06d}" for i in range(max(extra, 0))]
+    weights = 1.0 / np.arange(1, len(vocab) + 1) ** 1.1
+    weights /= weights.sum()
+
+    lengths = rng.integers(words_per_chunk[0], words_per_chunk[1] + 1, size=n_chunks)
+    words = rng.choice(len(vocab), size=int(lengths.sum()), p=weights)
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    chunks = []
+    for i in range(n_chunks):
+        doc, section = divmod(i, chunks_per_doc)
+        source = f"doc{doc:05d}.md"
+        heading = f"Section {section} " + vocab[words[offsets[i]]].title()
+        body = " ".join(vocab[w] for w in words[offsets[i]:offsets[i + 1]])
+        chunks.append({
+            "source": source,
+            "chunk_id": f"{source}#{section}",
+            "text": f"{heading}\n{body}.",
+            "headings": [heading],
+        })
+    return chunks
+
+
+def synthetic_embeddings(n: int, dim: int = SYNTHETIC_DIM, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed + 1)
+    m = rng.standard_normal((n, dim), dtype=np.float32)
+    m /= np.linalg.norm(m, axis=1, keepdims=True)
+    return m
+
+
+def synthetic_queries(chunks: List[Dict[str, Any]], matrix: np.ndarray, n: int,
+                      seed: int = 0) -> List[Tuple[str, np.ndarray]]:
+    """A few consecutive words of a random chunk + a noisy copy of its embedding."""
+    rng = np.random.default_rng(seed + 2)
+    out = []
+    for i in range(n):
+        row = int(rng.integers(len(chunks)))
+        words = chunks[row]["text"].split("\n", 1)[1].split()
+        start = int(rng.integers(max(1, len(words) - 5)))
+        text = " ".join(words[start:start + int(rng.integers(3, 7))]).rstrip(".") + f" q{i}"
+        vec = matrix[row] + 0.7 * rng.standard_normal(matrix.shape[1]).astype(np.float32) / np.sqrt(matrix.shape[1])
+        out.append((text, (vec / np.linalg.norm(vec)).astype(np.float32)))
+    return out
+
+
+# ---- Timing helpers ----
+def _time_calls(fn: Callable[[Any], Any], args: Sequence[Any], warmup: int) -> Dict[str, float]:
+    for a in args[:warmup]:
+        fn(a)
+    samples = []
+    for a in args:
+        t0 = time.perf_counter()
+        fn(a)
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return latency_summary(samples)
+
+
+def _timed(fn: Callable[[], Any]) -> Tuple[Any, float]:
+    t0 = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t0
+
+
+def _peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:
+        return float("nan")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+# ---- Micro-benchmarks ----
+def bench_build(chunks: List[Dict[str, Any]], matrix: np.ndarray, out_dir: Path) -> Dict[str, Any]:
+    """Index build phases on a synthetic corpus (embeddings given, not computed)."""
+    import build_tfidf
+    from build_index import write_dense_indexes
+    from chunker import chunk_markdown
+    from embedding_model import EMBEDDING_MODEL_NAME
+    from vector_store import VectorStoreWriter
+
+    phases: Dict[str, Dict[str, float]] = {}
+    n = len(chunks)
+
+    def chunk_docs() -> int:
+        docs: Dict[str, List[str]] = {}
+        for c in chunks:
+            heading, body = c["text"].split("\n", 1)
+            docs.setdefault(c["source"], []).append(f"## {heading}\n\n{body}")
+        return sum(len(chunk_markdown("\n\n".join(sections))) for sections in docs.values())
+
+    produced, s = _timed(chunk_docs)
+    phases["chunk"] = {"seconds": round(s, 3), "chunks_out": produced}
+
+    vectors_path = str(out_dir / "vectors.json")
+
+    def store() -> None:
+        with VectorStoreWriter(vectors_path, model_name=EMBEDDING_MODEL_NAME) as writer:
+            for start in range(0, n, 1024):
+                writer.append(chunks[start:start + 1024], matrix[start:start + 1024])
+
+    _, s = _timed(store)
+    phases["store"] = {"seconds": round(s, 3)}
+    _, s = _timed(lambda: write_dense_indexes(vectors_path))
+    phases["dense_indexes"] = {"seconds": round(s, 3)}
+    _, s = _timed(lambda: build_tfidf.build(out_dir, force=True))
+    phases["sparse"] = {"seconds": round(s, 3)}
+
+    total = sum(p["seconds"] for p in phases.values())
+    for p in phases.values():
+        p["chunks_per_s"] = round(n / p["seconds"], 1) if p["seconds"] > 0 else 0.0
+    return {"phases": phases, "seconds": round(total, 3),
+            "chunks_per_s": round(n / total, 1) if total > 0 else 0.0}
+
+
+def bench_queries(retriever, queries: List[Tuple[str, np.ndarray]], vectors_path: str,
+                  warmup: int) -> Dict[str, Any]:
+    from caching import normalize_query
+    from dense_index import IVF_MIN_ROWS, load_dense_index
+    from retriever import DENSE_NPROBE, DENSE_RESCORE_FACTOR, RRF_K, Retriever
+
+    # The encoder is not benchmarked here: every query embedding is served by the LRU
+    for text, vec in queries:
+        retriever._cache_embedding(normalize_query(text), vec)
+    texts = [t for t, _ in queries]
+    ops: Dict[str, Any] = {}
+
+    ops["retrieve"] = _time_calls(lambda q: retriever.retrieve(q, top_k=3), texts, warmup)
+    ops["sparse_search_ids"] = _time_calls(lambda q: retriever._sparse_search_ids(q, pre_k=50), texts, warmup)
+
+    modes = ["exact", "int8", "float16"] + (["ivf"] if len(retriever.chunk_ids) >= IVF_MIN_ROWS else [])
+    for mode in modes:
+        index = load_dense_index(mode, retriever.embeddings_matrix, vectors_path,
+                                 rescore_factor=DENSE_RESCORE_FACTOR, nprobe=DENSE_NPROBE)
+        ops[f"dense_search.{mode}"] = _time_calls(lambda v: index.search(v, 50), [v for _, v in queries], warmup)
+
+    candidates = [
+        {"dense": retriever._dense_search_ids(vec, pre_k=50), "sparse": retriever._sparse_search_ids(text, pre_k=50)}
+        for text, vec in queries
+    ]
+    ops["rrf_scores"] = _time_calls(lambda c: Retriever._rrf_scores(c, k=RRF_K), candidates, warmup)
+
+    retriever.retrieve_many(texts[:warmup], top_k=3)
+    _, s = _timed(lambda: retriever.retrieve_many(texts, top_k=3))
+    ops["retrieve_many"] = {
+        "batch": len(texts),
+        "total_ms": round(s * 1000.0, 3),
+        "per_query_ms": round(s * 1000.0 / len(texts), 4),
+        "queries_per_s": round(len(texts) / s, 1) if s > 0 else 0.0,
+    }
+    return ops
+
+
+def run_micro(sizes: List[int], n_queries: int = 200, warmup: int = 20, seed: int = 0,
+              keep_dir: Optional[str] = None) -> Dict[str, Any]:
+    from retriever import Retriever
+
+    if keep_dir:
+        Path(keep_dir).mkdir(parents=True, exist_ok=True)
+    results: Dict[str, Any] = {}
+    for n in sizes:
+        print(f"[STEP] {n} chunks: generating the synthetic corpus ...")
+        chunks = synthetic_corpus(n, seed=seed)
+        matrix = synthetic_embeddings(n, seed=seed)
+        queries = synthetic_queries(chunks, matrix, n_queries, seed=seed)
+
+        with tempfile.TemporaryDirectory(prefix=f"bench-{n}-", dir=keep_dir) as tmp:
+            out_dir = Path(tmp)
+            print(f"[STEP] {n} chunks: building the index in {out_dir} ...")
+            build = bench_build(chunks, matrix, out_dir)
+            vectors_path = str(out_dir / "vectors.json")
+            retriever, s = _timed(lambda: Retriever(vectors_path))
+            build["phases"]["load"] = {"seconds": round(s, 3),
+                                       **{f"{k}_ms": round(v, 1) for k, v in retriever.load_timings.items()}}
+            print(f"[STEP] {n} chunks: timing {n_queries} queries ...")
+            ops = bench_queries(retriever, queries, vectors_path, warmup)
+            del retriever
+
+        results[str(n)] = {"chunks": n, "build": build, "ops": ops, "peak_rss_mb": round(_peak_rss_mb(), 1)}
+        summary = ", ".join(f"{k} p50 {v['p50_ms']:.3f} ms" for k, v in ops.items() if "p50_ms" in v)
+        print(f"[INFO] {n} chunks: build {build['seconds']} s; {summary}")
+    return {
+        "kind": "micro",
+        "meta": run_metadata(),
+        "params": {"sizes": sizes, "queries": n_queries, "warmup": warmup, "seed": seed,
+                   "dim": SYNTHETIC_DIM, "embeddings": "synthetic"},
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval micro-benchmarks and report comparison.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_micro = sub.add_parser("micro", help="benchmark index build + query path on synthetic corpora")
+    p_micro.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated chunk counts")
+    p_micro.add_argument("--queries", type=int, default=200, help="timed queries per size")
+    p_micro.add_argument("--warmup", type=int, default=20)
+    p_micro.add_argument("--seed", type=int, default=0)
+    p_micro.add_argument("--tmp-dir", default=None, help="where the synthetic indexes are built")
+    p_micro.add_argument("--out", default=None, help=f"default: {RESULTS_DIR}/micro-<commit>.json")
+    p_cmp = sub.add_parser("compare", help="diff two JSON reports (micro or load)")
+    p_cmp.add_argument("base")
+    p_cmp.add_argument("new")
+    p_cmp.add_argument("--threshold", type=float, default=0.15, help="relative change reported (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    if args.cmd == "micro":
+        sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+        report = run_micro(sizes, n_queries=args.queries, warmup=args.warmup, seed=args.seed,
+                           keep_dir=args.tmp_dir)
+        write_report(report, args.out)
+    else:
+        if compare(args.base, args.new, threshold=args.threshold):
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+# bm25_index.py
+#
+# Inverted-index BM25 engine for the sparse branch of hybrid retrieval.
+#
+# The index is three flat arrays (CSR over terms):
+# - indptr[t]:indptr[t+1]  slice of the postings of term t
+# - postings               row ids (int32) of the documents containing t
+# - weights                precomputed BM25 contribution of t in that document (float32)
+#
+# A query only touches the postings of its own terms: cost depends on the matched
+# postings, not on the corpus size. Built by build_tfidf.py, stored as bm25_index.npz.
+# search_many() scores a batch of queries in one vectorized pass (no per-query loop).
+
+from itertools import chain
+from pathlib import Path
+from typing import Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from dense_index import top_k_rows
+
+BM25_INDEX = Path("bm25_index.npz")
+
+DEFAULT_K1 = 1.5
+DEFAULT_B = 0.75
+
+
+class BM25Index:
+    """BM25 over precomputed posting weights (no per-query length normalization needed)."""
+
+    def __init__(self, indptr: np.ndarray, postings: np.ndarray, weights: np.ndarray,
+                 idf: np.ndarray, num_docs: int, k1: float = DEFAULT_K1, b: float = DEFAULT_B):
+        self.indptr = indptr
+        self.postings = postings
+        self.weights = weights
+        self.idf = idf
+        self.num_docs = int(num_docs)
+        self.k1 = float(k1)
+        self.b = float(b)
+
+    @property
+    def num_terms(self) -> int:
+        return self.indptr.shape[0] - 1
+
+    @classmethod
+    def from_counts(cls, counts, k1: float = DEFAULT_K1, b: float = DEFAULT_B) -> "BM25Index":
+        """
+        Builds the index from a [n_docs x n_terms] scipy sparse matrix of raw term counts
+        (column j = term id j of the vocabulary).
+        """
+        X = counts.tocsr().astype(np.float32)
+        n_docs = X.shape[0]
+        doc_len = np.asarray(X.sum(axis=1)).ravel()
+        avgdl = float(doc_len.mean()) if n_docs else 0.0
+
+        # BM25 term-frequency saturation, per (doc, term) entry
+        norm = k1 * (1.0 - b + b * doc_len / (avgdl or 1.0))
+        row_of_entry = np.repeat(np.arange(n_docs), np.diff(X.indptr))
+        tf = X.data
+        X.data = (tf * (k1 + 1.0) / (tf + norm[row_of_entry])).astype(np.float32)
+
+        df = np.diff(X.tocsc().indptr)
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+        # Transpose to term-major (postings lists) and fold idf into the weights
+        T = X.T.tocsr()
+        T.sort_indices()
+        term_of_entry = np.repeat(np.arange(T.shape[0]), np.diff(T.indptr))
+        weights = (T.data * idf[term_of_entry]).astype(np.float32)
+
+        return cls(
+            indptr=T.indptr.astype(np.int64),
+            postings=T.indices.astype(np.int32),
+            weights=weights,
+            idf=idf,
+            num_docs=n_docs,
+            k1=k1,
+            b=b,
+        )
+
+    def save(self, path: Path = BM25_INDEX) -> None:
+        np.savez(
+            path,
+            indptr=self.indptr,
+            postings=self.postings,
+            weights=self.weights,
+            idf=self.idf,
+            params=np.array([self.num_docs, self.k1, self.b], dtype=np.float64),
+        )
+
+    @classmethod
+    def load(cls, path: Path = BM25_INDEX) -> "BM25Index":
+        data = np.load(path)
+        num_docs, k1, b = data["params"].tolist()
+        return cls(data["indptr"], data["postings"], data["weights"], data["idf"],
+                   num_docs=int(num_docs), k1=k1, b=b)
+
+    def search(self, term_ids: Iterable[int], top_k: int = 50) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        term_ids: vocabulary ids of the query terms (repeats count as query term frequency).
+        Returns (row ids, scores) of the best top_k matching documents, best first.
+        """
+        ids = np.fromiter(term_ids, dtype=np.int64)
+        ids = ids[(ids >= 0) & (ids < self.num_terms)]
+        if ids.size == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        terms, qtf = np.unique(ids, return_counts=True)
+
+        # Gather the postings of the query terms only
+        starts, ends = self.indptr[terms], self.indptr[terms + 1]
+        lengths = ends - starts
+        if lengths.sum() == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        sel = np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)])
+        docs = self.postings[sel]
+        contrib = self.weights[sel] * np.repeat(qtf, lengths).astype(np.float32)
+
+        # Sum per matched document (size = matched docs, not corpus size)
+        uniq_docs, inv = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inv, weights=contrib).astype(np.float32)
+
+        k = min(top_k, scores.shape[0])
+        if k < scores.shape[0]:
+            part = np.argpartition(-scores, k - 1)[:k]
+        else:
+            part = np.arange(scores.shape[0])
+        order = part[np.argsort(-scores[part], kind="stable")]
+        return uniq_docs[order].astype(np.int64), scores[order]
+
+    def search_many(self, queries: Sequence[Iterable[int]], top_k: int = 50,
+                    block_cells: int = 1 << 22) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Batched search(): one (row ids, scores) pair per query, same semantics.
+        The postings of every (query, term) pair are gathered at once and summed with a
+        single bincount into a [queries x docs] block (block_cells bounds its size).
+        """
+        queries = [list(q) for q in queries]
+        n, V = self.num_docs, self.num_terms
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+        out: List[Tuple[np.ndarray, np.ndarray]] = []
+        block = max(1, block_cells // max(1, n))
+        for b0 in range(0, len(queries), block):
+            part = queries[b0:b0 + block]
+            lens = [len(q) for q in part]
+            flat = np.fromiter(chain.from_iterable(part), dtype=np.int64, count=sum(lens))
+            row_of = np.repeat(np.arange(len(part), dtype=np.int64), lens)
+            ok = (flat >= 0) & (flat < V)
+            # Unique (query, term) pairs; repeats count as query term frequency
+            keys, qtf = np.unique(row_of[ok] * V + flat[ok], return_counts=True)
+            qrow, terms = keys // V, keys % V
+
+            starts = self.indptr[terms]
+            lengths = self.indptr[terms + 1] - starts
+            total = int(lengths.sum())
+            if total == 0:
+                out.extend([empty] * len(part))
+                continue
+            # Positions of every posting of every pair, without a Python loop
+            first = np.cumsum(lengths) - lengths
+            sel = np.repeat(starts - first, lengths) + np.arange(total)
+            docs = self.postings[sel].astype(np.int64)
+            contrib = self.weights[sel] * np.repeat(qtf, lengths).astype(np.float32)
+
+            scores = np.bincount(np.repeat(qrow, lengths) * n + docs, weights=contrib,
+                                 minlength=len(part) * n).astype(np.float32).reshape(len(part), n)
+            top = top_k_rows(scores, top_k)
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            for r in range(len(part)):
+                matched = top_scores[r] > 0  # only documents containing a query term
+                out.append((top[r][matched], top_scores[r][matched]))
+        return out
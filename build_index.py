@@ -1,10 +1,34 @@
 import os
+import argparse
 import glob
 import json
 import re
-from typing import List, Dict
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+import numpy as np
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 from sentence_transformers import SentenceTransformer
 
+from chunker import chunk_markdown
+from dedup import DEDUP_COSINE, NearDuplicateFilter
+from embedding_model import EMBEDDING_MODEL_NAME
+from dense_index import (
+    IVF_MIN_ROWS, QUANTIZED_MODES, IVFIndex, encode_label_queries, ivf_path, measure_recall, save_quantized,
+)
+from vector_store import VectorStoreWriter, chunk_hash, load_vector_store, save_vector_store, store_exists
+
+# Streaming build knobs (also --batch-size / --threads / --workers):
+# - chunks encoded per model.encode call (and appended to the store per batch)
+BUILD_BATCH_SIZE = int(os.environ.get("BUILD_BATCH_SIZE", "64"))
+# - torch intra-op threads used by the encoder (0 = torch default)
+BUILD_THREADS = int(os.environ.get("BUILD_THREADS", "0"))
+# - processes reading + chunking the markdown files (1 = in-process)
+BUILD_WORKERS = int(os.environ.get("BUILD_WORKERS", str(min(4, os.cpu_count() or 1))))
+# "markdown": heading-aligned, tokenizer-sized chunks (chunker.py);
+# "words": legacy fixed 500-word windows with 50 words of overlap (chunk_text)
+CHUNKER = os.environ.get("CHUNKER", "markdown").strip().lower()
+
 
 def load_documents(data_dir: str = "data") -> List[Dict[str, str]]:
     """
@@ -17,22 +41,25 @@ def load_documents(data_dir: str = "data") -> List[Dict[str, str]]:
     -If a file needs to be excluded in the future (e.g., contains private information),
     the change should be made here.
     """
-    documents = []
+    return [read_document(filepath) for filepath in list_documents(data_dir)]
 
-    pattern = os.path.join(data_dir, "*.md")
-    for filepath in glob.glob(pattern):
-        with open(filepath, "r", encoding="utf-8") as f:
-            text = f.read()
 
-        # basic normalization: remove triple newlines and unnecessary empty lines
-        cleaned = re.sub(r"\n{3,}", "\n\n", text).strip()
+def list_documents(data_dir: str = "data") -> List[str]:
+    # Sorted, so chunk order (and the row order of the store) is reproducible
+    return sorted(glob.glob(os.path.join(data_dir, "*.md")))
 
-        documents.append({
-            "source": os.path.basename(filepath),
-            "text": cleaned,
-        })
 
-    return documents
+def read_document(filepath: str) -> Dict[str, str]:
+    with open(filepath, "r", encoding="utf-8") as f:
+        text = f.read()
+
+    # basic normalization: remove triple newlines and unnecessary empty lines
+    cleaned = re.sub(r"\n{3,}", "\n\n", text).strip()
+
+    return {
+        "source": os.path.basename(filepath),
+        "text": cleaned,
+    }
 
 
 def chunk_text(
@@ -41,7 +68,7 @@ def chunk_text(
     overlap_tokens: int = 50
 ) -> List[str]:
     """
-    Splits the text into overlapping chunks.
+    Splits the text into overlapping chunks (legacy chunker, CHUNKER=words).
 
     Technical notes:
     - max_tokens here is "about words", not actual LLM tokens.
@@ -87,7 +114,8 @@ def build_chunks(documents: List[Dict[str, str]]) -> List[Dict[str, str]]:
     {
       "source": "thesis_project.md",
       "chunk_id": "thesis_project.md#0",
-      "text": "During my internship at NTT Data I..."
+      "text": "Thesis > NTT Data internship\n\nDuring my internship at NTT Data I...",
+      "headings": ["Thesis", "NTT Data internship"]
     }
 
     Technical rationale:
@@ -98,24 +126,60 @@ def build_chunks(documents: List[Dict[str, str]]) -> List[Dict[str, str]]:
     all_chunks = []
 
     for doc in documents:
-        source = doc["source"]
-        text = doc["text"]
+        all_chunks.extend(chunk_document(doc))
+
+    return all_chunks
 
-        chunks = chunk_text(text)
 
-        for i, ch in enumerate(chunks):
-            all_chunks.append({
-                "source": source,
-                "chunk_id": f"{source}#{i}",
-                "text": ch
-            })
+def chunk_document(doc: Dict[str, str]) -> List[Dict[str, Any]]:
+    source = doc["source"]
+    if CHUNKER == "words":
+        pieces = [{"text": ch, "headings": []} for ch in chunk_text(doc["text"])]
+    else:
+        pieces = chunk_markdown(doc["text"])
+    return [
+        {"source": source, "chunk_id": f"{source}#{i}", "text": p["text"], "headings": p["headings"]}
+        for i, p in enumerate(pieces)
+    ]
 
-    return all_chunks
+
+def read_and_chunk(filepath: str) -> List[Dict[str, str]]:
+    """Worker of the streaming build (runs in a child process): one file -> its chunks."""
+    return chunk_document(read_document(filepath))
+
+
+def _bounded_map(executor: Executor, fn: Callable, items: Iterable, window: int) -> Iterator[Any]:
+    """
+    Like executor.map, but in order and with at most `window` tasks in flight,
+    so results (file contents, chunks) never pile up faster than they are consumed.
+    """
+    pending: deque = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def iter_chunks(data_dir: str = "data", workers: int = BUILD_WORKERS) -> Iterator[Dict[str, str]]:
+    """
+    Streams the chunks of every markdown file in data_dir, in file order.
+    Files are read and chunked lazily by a process pool (workers > 1).
+    """
+    paths = list_documents(data_dir)
+    if workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield from read_and_chunk(path)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunks in _bounded_map(pool, read_and_chunk, paths, window=4 * workers):
+            yield from chunks
 
 
 def embed_chunks(
     chunks: List[Dict[str, str]],
-    model_name: str = "sentence-transformers/all-MiniLM-L6-v2"
+    model_name: str = EMBEDDING_MODEL_NAME
 ) -> List[Dict[str, object]]:
     """
     Generates the vector embedding for each chunk.
@@ -160,45 +224,271 @@ def embed_chunks(
     return vector_entries
 
 
-def save_vectors(vectors: List[Dict[str, object]], output_path: str = "vectors.json"):
+def load_previous_embeddings(
+    previous_vectors_path: str,
+    model_name: str = EMBEDDING_MODEL_NAME
+) -> Tuple[Optional[np.ndarray], Dict[str, int], Dict[str, str]]:
     """
-    Saves the list of vectors and metadata in a single JSON file.
-
-    Motivazione tecnica:
-    - This file is a 'mini vector store'.
-    - The retriever will load it for RAG.
+    For incremental builds: (memory-mapped matrix, {content hash -> row},
+    {dropped duplicate hash -> kept chunk hash}) of an existing store, so chunks whose
+    source + text did not change reuse their embedding, and unchanged near-duplicates
+    dropped last time are dropped again without being re-embedded.
+    Returns (None, {}, {}) if there is no store or it was built with another model.
+    Stores written before hashes were recorded work too (hash recomputed from source/text).
     """
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(vectors, f, ensure_ascii=False, indent=2)
+    if not store_exists(previous_vectors_path):
+        return None, {}, {}
+    matrix, meta = load_vector_store(previous_vectors_path, mmap=True)
+    if meta.get("model") != model_name:
+        print(f"[INFO] Previous store was built with {meta.get('model')!r}: full rebuild")
+        return None, {}, {}
+    rows = {
+        c.get("hash") or chunk_hash(c.get("source", ""), c["text"]): row
+        for row, c in enumerate(meta["chunks"])
+    }
+    duplicates = {h: kept for h, kept in meta.get("duplicate_hashes", {}).items() if kept in rows}
+    return matrix, rows, duplicates
 
-    print(f"[INFO] Saved {len(vectors)} vector entries to {output_path}")
 
+def save_vectors(
+    vectors: List[Dict[str, object]],
+    output_path: str = "vectors.json",
+    dtype: str = "float32",
+    write_json: bool = False,
+):
+    """
+    Saves the vectors and metadata as a binary 'mini vector store':
+    vectors.npy (normalized matrix) + vectors_meta.json (texts, sources, chunk ids).
 
-def main():
+    Technical rationale:
+    - The retriever memory-maps vectors.npy instead of parsing JSON floats.
+    - write_json=True also writes the legacy pretty-printed vectors.json.
     """
-    Executes the entire end-to-end pipeline:
-    1. Loads the markdown documents in ./data
-    2. Splits them into chunks
-    3. Calculates the embeddings
-    4. Saves everything in vectors.json
+    matrix_path, meta_path = save_vector_store(
+        vectors, vectors_path=output_path, dtype=dtype, model_name=EMBEDDING_MODEL_NAME
+    )
+    print(f"[INFO] Saved {len(vectors)} vector entries to {matrix_path} + {meta_path}")
+
+    write_dense_indexes(output_path)
+
+    if write_json:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(vectors, f, ensure_ascii=False, indent=2)
+        print(f"[INFO] Saved legacy JSON copy to {output_path}")
+
+
+def write_dense_indexes(output_path: str = "vectors.json"):
+    """Derived dense artifacts of a saved store: quantized copies and (large corpora) IVF."""
+    # Compact copies for DENSE_INDEX_MODE=int8 / float16 (first-pass scan, exact rescoring)
+    matrix, _ = load_vector_store(output_path, mmap=True)
+    for mode in QUANTIZED_MODES:
+        path = save_quantized(matrix, output_path, mode)
+        print(f"[INFO] Saved {mode} index to {path}")
+
+    # ANN index for DENSE_INDEX_MODE=ivf (only worth it on large corpora)
+    path = ivf_path(output_path)
+    if matrix.shape[0] >= IVF_MIN_ROWS:
+        index = IVFIndex.build(matrix)
+        index.save(path)
+        report = measure_recall(index, matrix, encode_label_queries(), k=10)
+        print(f"[INFO] Saved IVF index to {path} (clusters={index.centroids.shape[0]}, "
+              f"nprobe={index.nprobe}, recall@10 vs exact={report['recall_at_k']:.3f} "
+              f"on {report['queries']} {report['query_source']})")
+    elif path.exists():
+        # A stale IVF index from a larger corpus must not be picked up
+        path.unlink()
+
+
+def _load_build_model(model_name: str, threads: int):
+    if threads > 0:
+        import torch
+        torch.set_num_threads(threads)
+    print(f"[INFO] Loading embedding model: {model_name}")
+    return SentenceTransformer(model_name)
+
+
+def _peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:  # not available on Windows
+        return float("nan")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if os.uname().sysname == "Darwin" else peak / 1024
+
+
+def build(
+    data_dir: str = "data",
+    out_dir: str = ".",
+    incremental: bool = False,
+    previous_dir: Optional[str] = None,
+    batch_size: int = BUILD_BATCH_SIZE,
+    threads: int = BUILD_THREADS,
+    workers: int = BUILD_WORKERS,
+    model_name: str = EMBEDDING_MODEL_NAME,
+    dedup: bool = True,
+    dedup_threshold: float = DEDUP_COSINE,
+) -> Dict[str, float]:
     """
+    Executes the entire end-to-end pipeline as a stream, so memory stays bounded by one
+    batch (plus the in-flight files) whatever the corpus size:
+    1. Reads and chunks the markdown documents in data_dir (process pool, lazily)
+    2. Groups the chunks in batches of batch_size
+    3. Calculates the embeddings of each batch (incremental=True: only for chunks that
+       are not in the store in previous_dir, default out_dir)
+    3b. Drops near-duplicates of already kept chunks (dedup=True, see dedup.py)
+    4. Appends each batch to the binary store (out_dir/vectors.npy + vectors_meta.json),
+       then writes the quantized / IVF copies
+
+    Returns a report: chunks, reused/embedded/dropped, duplicates, seconds, chunks_per_s,
+    peak_rss_mb.
+    """
+    t_start = time.perf_counter()
+    output_path = os.path.join(out_dir, "vectors.json")
+
+    previous_matrix, previous_rows, previous_duplicates = None, {}, {}
+    if incremental:
+        previous_path = os.path.join(previous_dir or out_dir, "vectors.json")
+        previous_matrix, previous_rows, previous_duplicates = load_previous_embeddings(previous_path, model_name)
+
+    # Loaded on the first batch that needs encoding: a no-op incremental build skips torch.
+    model = None
+    stats = {"chunks": 0, "reused": 0, "embedded": 0}
+    seen = set()
+    dedup_filter = NearDuplicateFilter(dedup_threshold) if dedup else None
+    if dedup_filter is None:
+        previous_duplicates = {}
+    # Kept chunks of this build that a previous duplicate points to: hash -> chunk_id
+    duplicate_targets = set(previous_duplicates.values())
+    kept_targets: Dict[str, str] = {}
+
+    def drop_known_duplicates(batch: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        # Unchanged near-duplicates of a chunk kept (unchanged) in this build: same texts,
+        # same embeddings, so the same drop as last time, without encoding
+        rest = []
+        for c in batch:
+            target = previous_duplicates.get(c["hash"])
+            if target is not None and target in kept_targets:
+                dedup_filter.drop_known(c, kept_targets[target], target)
+                stats["reused"] += 1
+            else:
+                rest.append(c)
+        return rest
+
+    def flush(batch: List[Dict[str, str]]) -> None:
+        nonlocal model
+        for c in batch:
+            c["hash"] = chunk_hash(c["source"], c["text"])
+        seen.update(c["hash"] for c in batch)
+        deferred: List[Dict[str, str]] = []
+        if previous_duplicates:
+            batch = drop_known_duplicates(batch)
+            # Duplicates of a chunk in this same batch wait until it has been kept (or not)
+            hashes = {c["hash"] for c in batch}
+            deferred = [c for c in batch if previous_duplicates.get(c["hash"]) in hashes]
+            if deferred:
+                batch = [c for c in batch if previous_duplicates.get(c["hash"]) not in hashes]
+            if not batch:
+                return
+
+        hashes = [c["hash"] for c in batch]
+        todo = [i for i, h in enumerate(hashes) if h not in previous_rows]
+        if todo:
+            if model is None:
+                model = _load_build_model(model_name, threads)
+            fresh = model.encode([batch[i]["text"] for i in todo], batch_size=batch_size,
+                                 show_progress_bar=False)
+            embs = np.empty((len(batch), fresh.shape[1]), dtype=np.float32)
+            embs[todo] = fresh
+        else:
+            embs = np.empty((len(batch), previous_matrix.shape[1]), dtype=np.float32)
+        for i, h in enumerate(hashes):
+            row = previous_rows.get(h)
+            if row is not None:
+                embs[i] = previous_matrix[row]
+        stats["embedded"] += len(todo)
+        stats["reused"] += len(batch) - len(todo)
+
+        if dedup_filter is not None:
+            batch, embs = dedup_filter.filter(batch, embs)
+        writer.append(batch, embs)
+        kept_targets.update((c["hash"], c["chunk_id"]) for c in batch if c["hash"] in duplicate_targets)
+        deferred = drop_known_duplicates(deferred)
+        if deferred:
+            flush(deferred)
+
+        before = stats["chunks"]
+        stats["chunks"] += len(batch)
+        if stats["chunks"] // (batch_size * 20) > before // (batch_size * 20):
+            print(f"[INFO] {stats['chunks']} chunks written ...")
+
+    print(f"[STEP 1-3] Reading, chunking and embedding {data_dir}/*.md "
+          f"(batch={batch_size}, workers={workers}, threads={threads or 'default'}) ...")
+    with VectorStoreWriter(output_path, model_name=model_name) as writer:
+        batch: List[Dict[str, str]] = []
+        for chunk in iter_chunks(data_dir, workers=workers):
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+        if dedup_filter is not None:
+            # Dropped chunk_id -> chunk_id of the kept chunk with the same information
+            writer.extra_meta["duplicates"] = dedup_filter.links
+            # Dropped content hash -> kept content hash (lets --incremental skip them)
+            writer.extra_meta["duplicate_hashes"] = dedup_filter.hash_links
+    # Release the previous store's memory map before deriving the new indexes
+    previous_matrix = None
+    print(f"[INFO] Saved {stats['chunks']} vector entries to {writer.matrix_path} + {writer.meta_path}")
+    if incremental:
+        stats["dropped"] = len((set(previous_rows) | set(previous_duplicates)) - seen)
+        print(f"[INFO] Incremental: reused {stats['reused']}, embedded {stats['embedded']} "
+              f"new/changed, dropped {stats['dropped']} deleted chunks")
+    if dedup_filter is not None:
+        d = dedup_filter.report()
+        stats["duplicates"] = d["duplicates_dropped"]
+        print(f"[INFO] Dedup (cosine >= {dedup_threshold}): {d['chunks_in']} -> {d['chunks_kept']} chunks, "
+              f"{d['duplicates_dropped']} near-duplicates removed (index {d['shrink_pct']}% smaller)")
+
+    print("[STEP 4] Writing quantized / IVF copies ...")
+    write_dense_indexes(output_path)
+
+    seconds = time.perf_counter() - t_start
+    report = {
+        **stats,
+        "seconds": round(seconds, 2),
+        "chunks_per_s": round(stats["chunks"] / seconds, 1) if seconds > 0 else 0.0,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }
+    print(f"[DONE] Index build complete: {report['chunks']} chunks in {report['seconds']} s "
+          f"({report['chunks_per_s']} chunks/s), peak RSS {report['peak_rss_mb']} MB")
+    return report
 
-    print("[STEP 1] Loading markdown documents from ./data ...")
-    docs = load_documents(data_dir="data")
-    print(f"[INFO] Loaded {len(docs)} documents")
-
-    print("[STEP 2] Chunking documents ...")
-    chunks = build_chunks(docs)
-    print(f"[INFO] Generated {len(chunks)} chunks")
-
-    print("[STEP 3] Embedding chunks ...")
-    vectors = embed_chunks(chunks)
-    print(f"[INFO] Generated {len(vectors)} embedded vector entries")
-
-    print("[STEP 4] Saving vectors.json ...")
-    save_vectors(vectors, output_path="vectors.json")
 
-    print("[DONE] Index build complete. You can now use vectors.json in your retriever.")
+def main():
+    parser = argparse.ArgumentParser(description="Build the dense vector store from ./data.")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--out-dir", default=".",
+                        help="where to write the artifacts (index_versions.py build uses a new version dir)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="re-embed only new/changed chunks, reusing the existing store")
+    parser.add_argument("--previous-dir", default=None,
+                        help="store to reuse embeddings from with --incremental (default: --out-dir)")
+    parser.add_argument("--batch-size", type=int, default=BUILD_BATCH_SIZE,
+                        help="chunks encoded and appended to the store per batch")
+    parser.add_argument("--threads", type=int, default=BUILD_THREADS,
+                        help="torch threads for the encoder (0 = torch default)")
+    parser.add_argument("--workers", type=int, default=BUILD_WORKERS,
+                        help="processes reading and chunking files (1 = no pool)")
+    parser.add_argument("--no-dedup", action="store_true", help="keep near-duplicate chunks")
+    parser.add_argument("--dedup-threshold", type=float, default=DEDUP_COSINE,
+                        help="embedding cosine above which a chunk is a near-duplicate")
+    args = parser.parse_args()
+    build(data_dir=args.data_dir, out_dir=args.out_dir,
+          incremental=args.incremental, previous_dir=args.previous_dir,
+          batch_size=args.batch_size, threads=args.threads, workers=args.workers,
+          dedup=not args.no_dedup, dedup_threshold=args.dedup_threshold)
 
 
 if __name__ == "__main__":
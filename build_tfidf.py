@@ -1,15 +1,21 @@
 #!/usr/bin/env python3
 # build_tfidf.py
 #
-# Builds a TF-IDF index in parallel to vectors.json (no DB required).
-# It reads the already-chunked texts from vectors.json to guarantee 1:1
-# alignment (same chunk_id, same text) with dense embeddings.
+# Builds a TF-IDF index in parallel to the vector store (no DB required).
+# It reads the already-chunked texts from vectors_meta.json (or the legacy
+# vectors.json) to guarantee 1:1 alignment (same chunk_id, same text) with
+# dense embeddings.
 #
-# Output files:
+# Output files (in the repo root, or in --index-dir for versioned builds):
 # - tfidf_meta.json        (light metadata, row order, and params)
 # - tfidf_matrix.npz       (sparse CSR matrix)
 # - tfidf_vectorizer.pkl   (persisted vectorizer to avoid refit at boot)
+# - bm25_index.npz         (BM25 inverted index: postings as flat arrays, same rows/vocabulary)
+# - sparse_vocab.json      (analyzer config + vocabulary: lets the server analyze queries
+#                           without scikit-learn, see sparse_analyzer.py)
 
+import argparse
+import hashlib
 import json
 from pathlib import Path
 from typing import List, Dict, Any
@@ -17,16 +23,20 @@ from typing import List, Dict, Any
 import joblib
 import numpy as np
 from scipy.sparse import csr_matrix, save_npz
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+
+from bm25_index import BM25_INDEX, BM25Index
+from sparse_analyzer import SPARSE_VOCAB, SparseAnalyzer, check_parity, export_sparse_vocab
 
 VECTORS_JSON = Path("vectors.json")
+VECTORS_META = Path("vectors_meta.json")
 TFIDF_META = Path("tfidf_meta.json")
 TFIDF_MATRIX = Path("tfidf_matrix.npz")
 TFIDF_VECTORIZER = Path("tfidf_vectorizer.pkl")
 
 
 def _load_chunks_from_vectors(vectors_path: Path) -> List[Dict[str, Any]]:
-    """Reads chunks from vectors.json (list or {'chunks': [...]}) and returns them."""
+    """Reads chunks from vectors_meta.json / vectors.json (list or {'chunks': [...]}) and returns them."""
     data = json.loads(vectors_path.read_text(encoding="utf-8"))
     if isinstance(data, dict) and "chunks" in data:
         chunks = data["chunks"]
@@ -51,16 +61,55 @@ def _extract_doc_id_and_text(chunks: List[Dict[str, Any]]):
     return doc_ids, texts
 
 
-def main():
-    # Validates input availability
-    if not VECTORS_JSON.exists():
-        raise SystemExit("vectors.json not found. Run build_index.py first.")
+def corpus_hash(doc_ids: List[str], texts: List[str]) -> str:
+    """Hash of the exact rows (ids + texts, in order) the sparse artifacts are built from."""
+    h = hashlib.sha1()
+    for doc_id, text in zip(doc_ids, texts):
+        h.update(doc_id.encode("utf-8") + b"\0" + text.encode("utf-8") + b"\0")
+    return h.hexdigest()
+
+
+def build_bm25(vectorizer: TfidfVectorizer, corpus: List[str]) -> BM25Index:
+    """
+    BM25 inverted index over the fitted vectorizer's vocabulary (term id = column id),
+    built from raw term counts produced by the very same analyzer.
+    """
+    counter = CountVectorizer(analyzer=vectorizer.build_analyzer(), vocabulary=vectorizer.vocabulary_)
+    return BM25Index.from_counts(counter.transform(corpus))
+
+
+def build(index_dir: Path = Path("."), force: bool = False):
+    """
+    Builds every sparse artifact from the chunks of the vector store in index_dir.
+    If the artifacts there were already built from the very same rows, nothing is
+    rewritten (force=True rebuilds anyway).
+    """
+    index_dir = Path(index_dir)
+    vectors_meta, vectors_json = index_dir / VECTORS_META, index_dir / VECTORS_JSON
+    tfidf_meta, tfidf_matrix = index_dir / TFIDF_META, index_dir / TFIDF_MATRIX
+    tfidf_vectorizer = index_dir / TFIDF_VECTORIZER
+    bm25_path, vocab_path = index_dir / BM25_INDEX, index_dir / SPARSE_VOCAB
+
+    # Validates input availability (binary store metadata first, legacy JSON second)
+    source_path = vectors_meta if vectors_meta.exists() else vectors_json
+    if not source_path.exists():
+        raise SystemExit("vectors_meta.json / vectors.json not found. Run build_index.py first.")
 
     # Loads chunks and extracts corpus
-    chunks = _load_chunks_from_vectors(VECTORS_JSON)
+    chunks = _load_chunks_from_vectors(source_path)
     doc_ids, corpus = _extract_doc_id_and_text(chunks)
     if not corpus:
-        raise SystemExit("No text found in vectors.json chunks.")
+        raise SystemExit(f"No text found in {source_path} chunks.")
+
+    # IDF/BM25 statistics depend on every row, so any change means a full (cheap) refit;
+    # an unchanged chunk set means no work at all.
+    content_hash = corpus_hash(doc_ids, corpus)
+    outputs = (tfidf_meta, tfidf_matrix, tfidf_vectorizer, bm25_path, vocab_path)
+    if not force and all(p.exists() for p in outputs):
+        previous = json.loads(tfidf_meta.read_text(encoding="utf-8"))
+        if previous.get("content_hash") == content_hash:
+            print(f"OK: sparse artifacts in {index_dir} already match {source_path.name}; nothing to do")
+            return
 
     # Builds a simple, robust TF-IDF index.
     # ngram_range (1,2) helps with compound names; English stopwords fit your content.
@@ -74,7 +123,7 @@ def main():
     X: csr_matrix = vectorizer.fit_transform(corpus)
 
     # Persists matrix and light metadata (keeps the matrix out of JSON to avoid huge files)
-    save_npz(TFIDF_MATRIX, X)
+    save_npz(tfidf_matrix, X)
     meta = {
         "schema_version": 1,
         "doc_ids": doc_ids,            # row order of X
@@ -84,16 +133,35 @@ def main():
         "stop_words": "english",
         "max_df": 0.9,
         "min_df": 1,
-        "source": "vectors.json",
+        "source": source_path.name,
+        "content_hash": content_hash,  # lets unchanged rebuilds skip the refit
         "note": "Parallel TF-IDF index for hybrid retrieval.",
     }
-    TFIDF_META.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+    tfidf_meta.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
 
     # Persists the vectorizer to avoid refitting at runtime
-    joblib.dump(vectorizer, TFIDF_VECTORIZER)
+    joblib.dump(vectorizer, tfidf_vectorizer)
+
+    # BM25 posting lists (what the retriever actually scores with)
+    bm25 = build_bm25(vectorizer, corpus)
+    bm25.save(bm25_path)
+
+    # sklearn-free query analysis for the server; refuse to ship it if it diverges
+    export_sparse_vocab(vectorizer, vocab_path)
+    problem = check_parity(vectorizer, SparseAnalyzer.load(vocab_path), corpus)
+    if problem:
+        raise SystemExit(f"{vocab_path} does not reproduce the sklearn analyzer: {problem}")
 
-    print(f"OK: saved {TFIDF_META}, {TFIDF_MATRIX}, {TFIDF_VECTORIZER} "
-          f"(docs={X.shape[0]}, vocab={X.shape[1]})")
+    print(f"OK: saved {tfidf_meta}, {tfidf_matrix}, {tfidf_vectorizer}, {bm25_path}, {vocab_path} "
+          f"(docs={X.shape[0]}, vocab={X.shape[1]}, postings={bm25.postings.shape[0]})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the TF-IDF / BM25 artifacts next to the vector store.")
+    parser.add_argument("--index-dir", default=".", help="directory holding vectors_meta.json")
+    parser.add_argument("--force", action="store_true", help="rebuild even if the chunks did not change")
+    args = parser.parse_args()
+    build(index_dir=Path(args.index_dir), force=args.force)
 
 
 if __name__ == "__main__":
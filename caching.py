@@ -0,0 +1,171 @@
+# caching.py
+#
+# Small in-process caches used on the request path.
+# Pure Python + threading: no external cache server on a single Render instance.
+
+import re
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+import numpy as np
+
+# Only sentence punctuation at the end of the question is folded: symbols inside it are
+# part of the meaning ("C++" / "C#" / "C", ".NET" / "NET", "Node.js").
+_TRAILING_PUNCT_RE = re.compile(r"[\s?!.,;:…]+$", flags=re.UNICODE)
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """
+    Canonical form of a user question used as cache key:
+    Unicode NFKC, case-folded, whitespace collapsed, trailing sentence punctuation removed.
+    "What are your strongest skills?" and "what are your  strongest skills" map to the same key;
+    "Do you know C++?" and "Do you know C?" do not.
+    """
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    text = _SPACE_RE.sub(" ", text).strip()
+    return _TRAILING_PUNCT_RE.sub("", text)
+
+
+class LRUCache:
+    """
+    Thread-safe bounded LRU map with hit/miss counters.
+
+    - max_size <= 0 disables the cache (get always misses, put is a no-op).
+    - Counters are plain ints updated under the same lock as the map.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = int(max_size)
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
+
+
+class SemanticCache:
+    """
+    Answer cache keyed on (normalized) query embeddings instead of exact text.
+
+    - lookup() returns the value stored for the most similar cached query when its
+      cosine similarity is >= threshold and the entry has not expired (ttl_s).
+    - Entries live in a preallocated float32 matrix, so a lookup is one mat-vec.
+    - When full, the least recently used slot is overwritten.
+    - Every entry belongs to an index `version`: a lookup or store with a different
+      version drops the whole cache (answers built on an old index are stale).
+    """
+
+    def __init__(self, max_size: int = 256, ttl_s: float = 3600.0, threshold: float = 0.95):
+        self.max_size = int(max_size)
+        self.ttl_s = float(ttl_s)
+        self.threshold = float(threshold)
+        self.version: Optional[str] = None
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None  # [max_size x dim], allocated on first store
+        self._values: list = [None] * max(self.max_size, 0)
+        self._expires = np.zeros(max(self.max_size, 0), dtype=np.float64)
+        self._last_used = np.zeros(max(self.max_size, 0), dtype=np.float64)
+        self.hits = 0
+        self.misses = 0
+
+    def _reset_locked(self, version: Optional[str]) -> None:
+        self.version = version
+        self._matrix = None
+        self._values = [None] * self.max_size
+        self._expires[:] = 0.0
+        self._last_used[:] = 0.0
+
+    def lookup(self, query_vec: np.ndarray, version: Optional[str] = None) -> Optional[Any]:
+        if self.max_size <= 0:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            if version != self.version:
+                self._reset_locked(version)
+            if self._matrix is None:
+                self.misses += 1
+                return None
+
+            sims = self._matrix @ query_vec
+            sims[self._expires <= now] = -np.inf  # empty or expired slots
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            self._last_used[best] = now
+            self.hits += 1
+            return self._values[best]
+
+    def store(self, query_vec: np.ndarray, value: Any, version: Optional[str] = None) -> None:
+        if self.max_size <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if version != self.version:
+                self._reset_locked(version)
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_size, query_vec.shape[0]), dtype=np.float32)
+
+            # Free/expired slots have the oldest _last_used once cleared, so one argmin covers both.
+            free = self._expires <= now
+            self._last_used[free] = -np.inf
+            slot = int(np.argmin(self._last_used))
+
+            self._matrix[slot] = query_vec
+            self._values[slot] = value
+            self._expires[slot] = now + self.ttl_s
+            self._last_used[slot] = now
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset_locked(self.version)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": int((self._expires > time.monotonic()).sum()) if self.max_size > 0 else 0,
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "version": self.version,
+            }
@@ -0,0 +1,241 @@
+# chunker.py
+#
+# Structure-aware markdown chunker used by build_index.py.
+#
+# The knowledge files are organized by headings (# / ## / ###), so chunks follow them:
+# - a section (with its subsections) that fits the token budget becomes one chunk;
+# - a larger section is split into its paragraphs and subsections, and consecutive small
+#   pieces of the same section are packed back together up to the budget;
+# - a paragraph that alone exceeds the budget is split by lines, then sentences, then words.
+# No fixed overlap is needed: every chunk starts at a structural boundary.
+#
+# Every chunk carries its heading path ("headings": ["CV", "Education", "MSc ..."]) and its
+# text starts with that path as a breadcrumb line, so a paragraph like "GPA: 28 / 30"
+# stays self-describing for the embedding model and the LLM.
+#
+# Sizes are counted with the embedding model's own tokenizer (all-MiniLM-L6-v2 truncates
+# inputs at 256 word pieces, so a larger chunk would be embedded only partially). If the
+# tokenizer cannot be loaded (offline, no cache), a conservative word/punctuation estimate
+# is used instead.
+
+import os
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+from embedding_model import EMBEDDING_MODEL_NAME
+
+# Token budget per chunk, breadcrumb included (the model's window is 256 incl. special tokens)
+CHUNK_MAX_TOKENS = int(os.environ.get("CHUNK_MAX_TOKENS", "200"))
+# A section intro smaller than this is folded into the chunk that follows it
+CHUNK_MIN_TOKENS = int(os.environ.get("CHUNK_MIN_TOKENS", "48"))
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_RULE_RE = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+
+BREADCRUMB_SEP = " > "
+
+
+class TokenCounter:
+    """Counts word pieces of the embedding model's tokenizer (loaded lazily, once)."""
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME):
+        self.model_name = model_name
+        self._tokenizer = None
+        self._failed = False
+
+    def _load(self):
+        if self._tokenizer is None and not self._failed:
+            try:
+                # `tokenizers` (a sentence-transformers dependency) imports in milliseconds,
+                # unlike transformers, which matters in every build worker process
+                from tokenizers import Tokenizer
+                tokenizer = Tokenizer.from_pretrained(self.model_name)
+                tokenizer.no_truncation()
+                self._tokenizer = tokenizer
+            except Exception as e:
+                self._failed = True
+                print(f"[WARN] Tokenizer for {self.model_name} not available ({type(e).__name__}); "
+                      "chunk sizes are estimated from words.")
+        return self._tokenizer
+
+    def __call__(self, text: str) -> int:
+        tokenizer = self._load()
+        if tokenizer is not None:
+            return len(tokenizer.encode(text, add_special_tokens=False).ids)
+        # WordPiece splits rarer words in several pieces: ~1.3 pieces per word, 1 per symbol
+        pieces = _PIECE_RE.findall(text)
+        words = sum(1 for p in pieces if p[0].isalnum() or p[0] == "_")
+        return int(1.3 * words + 0.999) + (len(pieces) - words)
+
+
+_COUNTER: Optional[TokenCounter] = None
+
+
+def count_tokens(text: str) -> int:
+    global _COUNTER
+    if _COUNTER is None:
+        _COUNTER = TokenCounter()
+    return _COUNTER(text)
+
+
+class _Section:
+    def __init__(self, level: int, title: str):
+        self.level = level
+        self.title = title
+        self.blocks: List[str] = []  # paragraphs / lists, in order
+        self.children: List["_Section"] = []
+
+
+def _clean_heading(title: str) -> str:
+    # "**Bold**" / "*italic*" / trailing double-space line breaks add nothing to the path
+    return re.sub(r"[*_`]+", "", title).strip()
+
+
+def parse_sections(text: str) -> _Section:
+    """Markdown -> heading tree. Blank lines and horizontal rules separate blocks."""
+    root = _Section(0, "")
+    stack = [root]
+    para: List[str] = []
+
+    def flush():
+        if para:
+            stack[-1].blocks.append("\n".join(para).strip())
+            para.clear()
+
+    for line in text.splitlines():
+        m = _HEADING_RE.match(line)
+        if m:
+            flush()
+            level = len(m.group(1))
+            while stack[-1].level >= level:
+                stack.pop()
+            node = _Section(level, _clean_heading(m.group(2)))
+            stack[-1].children.append(node)
+            stack.append(node)
+        elif not line.strip() or _RULE_RE.match(line):
+            flush()
+        else:
+            para.append(line.rstrip())
+    flush()
+    return root
+
+
+def _render(section: _Section) -> str:
+    """Body of a section as plain text: its blocks, then each subsection (title + body)."""
+    parts = list(section.blocks)
+    for child in section.children:
+        body = _render(child)
+        parts.append(f"{child.title}\n{body}" if body else child.title)
+    return "\n\n".join(p for p in parts if p)
+
+
+def _split_to_fit(text: str, limit: int, count: Callable[[str], int], level: int = 0) -> List[str]:
+    """Splits an oversize block by lines, then sentences, then words, packing the pieces."""
+    if count(text) <= limit or level > 2:
+        return [text]
+    splitters = [
+        (lambda t: t.split("\n"), "\n"),
+        (lambda t: _SENTENCE_RE.split(t), " "),
+        (lambda t: t.split(), " "),
+    ]
+    for lvl in range(level, len(splitters)):
+        split, joiner = splitters[lvl]
+        parts = [p for p in split(text) if p.strip()]
+        if len(parts) > 1:
+            break
+    else:
+        return [text]
+
+    out: List[str] = []
+    current: List[str] = []
+    used = 0
+    for part in parts:
+        for piece in _split_to_fit(part, limit, count, lvl + 1):
+            n = count(piece)
+            if current and used + n + 1 > limit:
+                out.append(joiner.join(current))
+                current, used = [], 0
+            current.append(piece)
+            used += n + 1
+    if current:
+        out.append(joiner.join(current))
+    return out
+
+
+def _chunk_section(section: _Section, path: List[str], max_tokens: int,
+                   count: Callable[[str], int]) -> List[Tuple[List[str], str]]:
+    """Returns (heading path, body) units of a section, each within the budget."""
+    budget = max(16, max_tokens - count(BREADCRUMB_SEP.join(path)) - 1)
+    whole = _render(section)
+    if not whole:
+        return []
+    if count(whole) <= budget:
+        return [(path, whole)]
+
+    # Items seen from this section: (text as part of this section, own unit, mergeable)
+    items: List[Tuple[str, Tuple[List[str], str], bool]] = []
+    for block in section.blocks:
+        for piece in _split_to_fit(block, budget, count):
+            items.append((piece, (path, piece), True))
+    for child in section.children:
+        units = _chunk_section(child, path + [child.title], max_tokens, count)
+        if len(units) == 1:
+            # The whole subsection fits: it may share a chunk with its small siblings
+            items.append((f"{child.title}\n{units[0][1]}", units[0], True))
+        else:
+            items.extend((body, (p, body), False) for p, body in units)
+
+    # Greedy packing of consecutive mergeable items
+    out: List[Tuple[List[str], str]] = []
+    group: List[Tuple[str, Tuple[List[str], str]]] = []
+    used = 0
+
+    def flush_group():
+        if len(group) == 1:
+            out.append(group[0][1])  # keep the more specific heading path
+        elif group:
+            out.append((path, "\n\n".join(text for text, _ in group)))
+        group.clear()
+
+    for text, unit, mergeable in items:
+        if not mergeable:
+            if group and used < CHUNK_MIN_TOKENS:
+                # e.g. a one-line section intro: keep it with the first subsection chunk
+                sub_path, body = unit
+                relative = BREADCRUMB_SEP.join(sub_path[len(path):])
+                joined = f"{relative}\n{body}" if relative else body
+                if used + count(joined) <= budget:
+                    out.append((path, "\n\n".join([t for t, _ in group] + [joined])))
+                    group.clear()
+                    used = 0
+                    continue
+            flush_group()
+            used = 0
+            out.append(unit)
+            continue
+        n = count(text)
+        if group and used + n + 2 > budget:
+            flush_group()
+            used = 0
+        group.append((text, unit))
+        used += n + 2
+    flush_group()
+    return out
+
+
+def chunk_markdown(text: str, max_tokens: int = CHUNK_MAX_TOKENS,
+                   count: Callable[[str], int] = count_tokens) -> List[Dict[str, object]]:
+    """
+    Splits a markdown document into heading-aligned chunks of at most ~max_tokens
+    (breadcrumb included). Returns [{"text", "headings"}] in document order.
+    """
+    chunks: List[Dict[str, object]] = []
+    for path, body in _chunk_section(parse_sections(text), [], max_tokens, count):
+        breadcrumb = BREADCRUMB_SEP.join(path)
+        chunks.append({
+            "text": f"{breadcrumb}\n\n{body}" if breadcrumb else body,
+            "headings": list(path),
+        })
+    return chunks
@@ -0,0 +1,182 @@
+# context_builder.py
+#
+# Token-budgeted assembly of the retrieved chunks into the LLM context.
+#
+# Input tokens are the main driver of LLM latency and cost, so the context is built
+# against a fixed budget (CONTEXT_TOKEN_BUDGET) instead of concatenating whole chunks:
+# - chunks are taken greedily in fused (retrieval) order;
+# - the first CONTEXT_FULL_CHUNKS chunks go in whole, lower-ranked ones are trimmed
+#   to their CONTEXT_TRIM_SENTENCES most query-relevant sentences (original order kept);
+# - text shared with an adjacent chunk of the same source (chunk overlap) is dropped;
+# - a chunk that does not fit the remaining budget is trimmed until it does, or skipped.
+#
+# Tokens are counted with tiktoken when it is installed, otherwise estimated (~4 chars
+# per token for English/Italian prose), which is enough to keep the prompt size bounded.
+
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "700"))
+CONTEXT_FULL_CHUNKS = int(os.environ.get("CONTEXT_FULL_CHUNKS", "1"))
+CONTEXT_TRIM_SENTENCES = int(os.environ.get("CONTEXT_TRIM_SENTENCES", "3"))
+LLM_TOKENIZER_MODEL = os.environ.get("LLM_TOKENIZER_MODEL", "gpt-4o-mini")
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+_WORD_RE = re.compile(r"\w+")
+# Minimum run of identical words for two adjacent chunks to count as overlapping
+_MIN_OVERLAP_WORDS = 8
+
+# Question words that say nothing about which sentence is relevant (EN + IT)
+_QUERY_STOPWORDS = frozenset("""
+what which who whom whose when where why how are was were does did can could would should
+the and for with your you about tell have has had from that this these those into their them
+any some more most very please know there here
+cosa che chi come quando dove perche quali quale sono sei hai tuo tua tuoi tue della delle
+degli del dei per con una uno gli nel nella questo questa
+""".split())
+
+_ENCODING = None
+
+
+def count_llm_tokens(text: str) -> int:
+    global _ENCODING
+    if _ENCODING is None:
+        try:
+            import tiktoken
+            try:
+                _ENCODING = tiktoken.encoding_for_model(LLM_TOKENIZER_MODEL)
+            except KeyError:
+                _ENCODING = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _ENCODING = False  # not installed: estimate
+    if _ENCODING:
+        return len(_ENCODING.encode(text))
+    return (len(text) + 3) // 4
+
+
+def chunk_header(c: Dict[str, Any]) -> str:
+    return f"[SOURCE: {c['source']} / {c['chunk_id']} | SCORE: {c['score']:.4f}]"
+
+
+def _split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in _SENTENCE_RE.split(text) if s.strip()]
+
+
+def _query_terms(question: str) -> List[str]:
+    # 5-char prefixes: "skills" / "skill", "projects" / "project" match
+    words = (w.lower() for w in _WORD_RE.findall(question))
+    return sorted({w[:5] for w in words if len(w) > 2 and w not in _QUERY_STOPWORDS})
+
+
+def _relevance(sentence: str, terms: List[str]) -> int:
+    prefixes = {w.lower()[:5] for w in _WORD_RE.findall(sentence)}
+    return sum(1 for t in terms if t in prefixes)
+
+
+def trim_to_relevant(text: str, question: str, max_sentences: int) -> str:
+    """Keeps the max_sentences sentences sharing most terms with the question, in order."""
+    sentences = _split_sentences(text)
+    if len(sentences) <= max_sentences:
+        return text
+    terms = _query_terms(question)
+    ranked = sorted(range(len(sentences)), key=lambda i: (-_relevance(sentences[i], terms), i))
+    keep = sorted(ranked[:max_sentences])
+    return " … ".join(sentences[i] for i in keep)
+
+
+def _chunk_position(chunk_id: str) -> Optional[Tuple[str, int]]:
+    source, sep, idx = chunk_id.rpartition("#")
+    if not sep or not idx.isdigit():
+        return None
+    return source, int(idx)
+
+
+def strip_leading_overlap(previous: str, text: str, max_words: int = 200) -> str:
+    """
+    Removes from the start of `text` the words that repeat the end of `previous`
+    (the overlap window between consecutive chunks of the same document).
+    """
+    prev_words = previous.split()[-max_words:]
+    words = text.split()
+    for k in range(min(len(prev_words), len(words)), _MIN_OVERLAP_WORDS - 1, -1):
+        if prev_words[-k:] == words[:k]:
+            return " ".join(words[k:])
+    return text
+
+
+def strip_trailing_overlap(text: str, following: str, max_words: int = 200) -> str:
+    """Removes from the end of `text` the words that `following` starts with."""
+    words = text.split()
+    next_words = following.split()[:max_words]
+    for k in range(min(len(words), len(next_words)), _MIN_OVERLAP_WORDS - 1, -1):
+        if words[-k:] == next_words[:k]:
+            return " ".join(words[:-k])
+    return text
+
+
+def build_context(
+    question: str,
+    chunks: List[Dict[str, Any]],
+    budget: int = CONTEXT_TOKEN_BUDGET,
+    full_chunks: int = CONTEXT_FULL_CHUNKS,
+    trim_sentences: int = CONTEXT_TRIM_SENTENCES,
+) -> Tuple[str, List[Dict[str, Any]], Dict[str, int]]:
+    """
+    chunks: retriever output, best first. Returns (context text, chunks actually included,
+    report {"tokens", "budget", "included", "trimmed", "skipped"}).
+    """
+    parts: List[str] = []
+    included: List[Dict[str, Any]] = []
+    texts_by_pos: Dict[Tuple[str, int], str] = {}
+    used = 0
+    trimmed = skipped = 0
+
+    for rank, c in enumerate(chunks):
+        text = c["text"]
+        pos = _chunk_position(c["chunk_id"])
+        if pos is not None:
+            # Overlap with the neighbours of the same source that are already in
+            before = texts_by_pos.get((pos[0], pos[1] - 1))
+            after = texts_by_pos.get((pos[0], pos[1] + 1))
+            if before:
+                text = strip_leading_overlap(before, text)
+            if after:
+                text = strip_trailing_overlap(text, after)
+
+        was_trimmed = False
+        if rank >= full_chunks:
+            short = trim_to_relevant(text, question, trim_sentences)
+            was_trimmed = short != text
+            text = short
+
+        header = chunk_header(c)
+        cost = count_llm_tokens(f"{header}\n{text}\n\n")
+        n_sentences = max(1, trim_sentences)
+        while used + cost > budget and n_sentences > 0:
+            # Does not fit whole: keep fewer, most relevant sentences
+            short = trim_to_relevant(text, question, n_sentences)
+            cost = count_llm_tokens(f"{header}\n{short}\n\n")
+            if used + cost <= budget:
+                text, was_trimmed = short, True
+                break
+            n_sentences -= 1
+        if used + cost > budget or not text.strip():
+            skipped += 1
+            continue
+
+        parts.append(f"{header}\n{text}")
+        included.append(c)
+        if pos is not None:
+            texts_by_pos[pos] = c["text"]
+        used += cost
+        trimmed += int(was_trimmed)
+
+    report = {
+        "tokens": used,
+        "budget": budget,
+        "included": len(included),
+        "trimmed": trimmed,
+        "skipped": skipped,
+    }
+    return "\n\n".join(parts), included, report
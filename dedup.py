@@ -0,0 +1,114 @@
+# dedup.py
+#
+# Near-duplicate chunk filter for the streaming index build (build_index.py).
+#
+# The knowledge files repeat the same facts (cv.md / about_me.md / skills.md) and the
+# chunker overlaps consecutive chunks, so several rows of the index can carry the same
+# information. Each chunk is compared (embedding cosine) with every chunk kept so far;
+# above DEDUP_COSINE it is dropped from the index and recorded as a link
+# {dropped chunk_id -> kept chunk_id} in vectors_meta.json ("duplicates"), plus
+# {dropped content hash -> kept content hash} ("duplicate_hashes") so an incremental
+# build can drop an unchanged duplicate again without re-embedding it.
+#
+# Cost: one [batch x kept] matrix product per batch, i.e. O(n^2 * dim) over a build:
+# well under a second for tens of thousands of chunks. The kept embeddings are held as
+# float16 (n x dim x 2 bytes) to keep memory bounded on large corpora.
+
+import os
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# Cosine above which two chunks count as the same information (1.0 = exact duplicates only)
+DEDUP_COSINE = float(os.environ.get("DEDUP_COSINE", "0.95"))
+
+
+class NearDuplicateFilter:
+    """
+    Stateful filter: feed the batches in build order, the first occurrence of a piece
+    of information wins.
+    """
+
+    def __init__(self, threshold: float = DEDUP_COSINE):
+        self.threshold = float(threshold)
+        self._kept = None  # float16 [capacity x dim], grown by doubling
+        self._kept_ids: List[str] = []
+        self._kept_hashes: List[str] = []
+        self.links: Dict[str, str] = {}
+        self.hash_links: Dict[str, str] = {}
+        self.seen = 0
+
+    @property
+    def num_kept(self) -> int:
+        return len(self._kept_ids)
+
+    def _append(self, emb: np.ndarray, chunk_id: str, chunk_hash: str = "") -> None:
+        n = self.num_kept
+        if self._kept is None:
+            self._kept = np.zeros((1024, emb.shape[0]), dtype=np.float16)
+        elif n == self._kept.shape[0]:
+            grown = np.zeros((2 * n, self._kept.shape[1]), dtype=np.float16)
+            grown[:n] = self._kept
+            self._kept = grown
+        self._kept[n] = emb
+        self._kept_ids.append(chunk_id)
+        self._kept_hashes.append(chunk_hash)
+
+    def filter(self, chunks: List[Dict[str, str]], embeddings: np.ndarray) -> Tuple[List[Dict[str, str]], np.ndarray]:
+        """
+        Returns the (chunks, embeddings) of the batch that are not near-duplicates of an
+        earlier chunk. Embeddings are L2-normalized here (the store does the same).
+        """
+        embs = np.asarray(embeddings, dtype=np.float32)
+        embs = embs / (np.linalg.norm(embs, axis=1, keepdims=True) + 1e-12)
+        self.seen += len(chunks)
+
+        # Best match among the chunks kept by previous batches, for the whole batch at once
+        n_prev = self.num_kept
+        if n_prev:
+            sims = embs @ self._kept[:n_prev].astype(np.float32).T
+            best = sims.argmax(axis=1)
+            best_sim = sims[np.arange(len(chunks)), best]
+        else:
+            best = np.zeros(len(chunks), dtype=np.int64)
+            best_sim = np.full(len(chunks), -1.0, dtype=np.float32)
+
+        keep: List[int] = []
+        for i, c in enumerate(chunks):
+            match, match_hash = None, None
+            if best_sim[i] >= self.threshold:
+                match, match_hash = self._kept_ids[best[i]], self._kept_hashes[best[i]]
+            elif keep:
+                # Chunks kept earlier in this same batch
+                in_batch = embs[keep] @ embs[i]
+                j = int(in_batch.argmax())
+                if in_batch[j] >= self.threshold:
+                    match, match_hash = chunks[keep[j]]["chunk_id"], chunks[keep[j]].get("hash", "")
+            if match is None:
+                keep.append(i)
+                self._append(embs[i], c["chunk_id"], c.get("hash", ""))
+            else:
+                self._link(c, match, match_hash)
+        return [chunks[i] for i in keep], embs[keep]
+
+    def _link(self, chunk: Dict[str, str], kept_chunk_id: str, kept_hash: str) -> None:
+        self.links[chunk["chunk_id"]] = kept_chunk_id
+        if chunk.get("hash") and kept_hash:
+            self.hash_links[chunk["hash"]] = kept_hash
+
+    def drop_known(self, chunk: Dict[str, str], kept_chunk_id: str, kept_hash: str) -> None:
+        """
+        Records a chunk that a previous build already found to duplicate a chunk kept
+        (unchanged) in this build: same texts, same embeddings, same decision, no encode.
+        """
+        self.seen += 1
+        self._link(chunk, kept_chunk_id, kept_hash)
+
+    def report(self) -> Dict[str, float]:
+        dropped = self.seen - self.num_kept
+        return {
+            "chunks_in": self.seen,
+            "chunks_kept": self.num_kept,
+            "duplicates_dropped": dropped,
+            "shrink_pct": round(100.0 * dropped / self.seen, 1) if self.seen else 0.0,
+        }
@@ -0,0 +1,411 @@
+# dense_index.py
+#
+# Dense search backends used by retriever.py.
+# Every backend exposes search(query_vec, k) -> (row indices, cosine scores), best first.
+#
+# - ExactIndex:     full float32 scan (reference behaviour).
+# - QuantizedIndex: first-pass scan on a compact int8 (per-row scale) or float16 copy,
+#                   then exact float32 rescoring of a shortlist only.
+# - IVFIndex:       inverted-file ANN (spherical k-means clusters, pure NumPy); a query
+#                   scans only the rows of its `nprobe` closest clusters.
+#
+# The full matrix is memory-mapped by the vector store, so in quantized mode only
+# the shortlisted rows of it are ever paged in. A float16 store stays float16: scans
+# widen it block by block (scan_float32), at float16-scan speed (see below).
+#
+# Quantized modes save memory, not time: NumPy has no int8/float16 BLAS, so no compact
+# scan beats the float32 sgemv of ExactIndex. int8 scores straight from the codes
+# (int32 accumulation, no float32 copy) and runs at about exact speed, never faster
+# (50k x 384: ~10 ms vs ~8 ms); float16 has to be widened to float32 block by block
+# and is ~5x slower. Use them when resident memory matters more than latency; use ivf
+# for speed on large corpora.
+
+import argparse
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+# Rows widened to float32 at a time during a float16 scan (~1.5 MB at d=384: stays in L2,
+# ~20% faster than 2048 rows on a 50k x 384 scan).
+SCAN_BLOCK_ROWS = 1024
+
+QUANTIZED_MODES = ("int8", "float16")
+
+# Below this many rows an exact scan is as fast as any ANN structure.
+IVF_MIN_ROWS = 1024
+
+# Default clusters probed per IVF query: a fixed share of n_clusters (which grows as
+# sqrt(n)), so recall holds as the corpus grows; never fewer than IVF_MIN_NPROBE.
+IVF_NPROBE_FRACTION = 0.1
+IVF_MIN_NPROBE = 8
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k largest scores, sorted descending (argpartition, not a full sort)."""
+    n = scores.shape[0]
+    if n == 0 or k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        part = np.argpartition(-scores, k - 1)[:k]
+    else:
+        part = np.arange(n)
+    return part[np.argsort(-scores[part], kind="stable")]
+
+
+def top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Row-wise _top_k of a [m x n] score matrix: [m x min(k, n)] column indices, each
+    row sorted descending (one argpartition over the whole matrix, no full sort).
+    """
+    m, n = scores.shape
+    k = min(k, n)
+    if k <= 0:
+        return np.empty((m, 0), dtype=np.int64)
+    if k < n:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        part = np.tile(np.arange(n), (m, 1))
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1)
+
+
+def scan_float32(matrix: np.ndarray, x: np.ndarray) -> np.ndarray:
+    """
+    matrix @ x in float32 (x: [d] query or [d x m] queries). A float32 matrix goes
+    straight to BLAS; any other dtype (a float16 store or compact copy, usually
+    memory-mapped) is widened SCAN_BLOCK_ROWS rows at a time, never as a whole.
+    """
+    if matrix.dtype == np.float32:
+        return matrix @ x
+    n = matrix.shape[0]
+    out = np.empty((n,) + x.shape[1:], dtype=np.float32)
+    for start in range(0, n, SCAN_BLOCK_ROWS):
+        block = matrix[start:start + SCAN_BLOCK_ROWS].astype(np.float32)
+        out[start:start + block.shape[0]] = block @ x
+    return out
+
+
+class ExactIndex:
+    """Brute-force cosine search on the (normalized) float32 or float16 matrix."""
+
+    name = "exact"
+
+    def __init__(self, matrix: np.ndarray):
+        self.matrix = matrix
+
+    def search(self, query_vec: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        sims = scan_float32(self.matrix, query_vec)
+        idx = _top_k(sims, k)
+        return idx, sims[idx]
+
+
+def quantize_int8(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Symmetric per-row int8 quantization: row ~= codes * scale, scale = max|row| / 127.
+    Returns (codes int8 [n x d], scales float32 [n]).
+    """
+    m = np.asarray(matrix, dtype=np.float32)
+    scales = np.abs(m).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(m / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class QuantizedIndex:
+    """
+    Two-stage search:
+    1) approximate scores on the compact matrix (int8 codes * row scale, or float16),
+    2) exact float32 rescoring of the best `k * rescore_factor` rows.
+
+    With a shortlist a few times larger than k the final top-k matches the exact scan.
+    """
+
+    def __init__(
+        self,
+        compact: np.ndarray,
+        full_matrix: np.ndarray,
+        scales: Optional[np.ndarray] = None,
+        rescore_factor: int = 4,
+    ):
+        self.compact = compact
+        self.scales = scales
+        self.full_matrix = full_matrix
+        self.rescore_factor = max(1, int(rescore_factor))
+        self.name = "int8" if scales is not None else "float16"
+
+    def _approx_scores(self, query_vec: np.ndarray) -> np.ndarray:
+        if self.scales is not None:
+            # int8 query x int8 codes, accumulated in int32 straight from the (memory-mapped)
+            # codes: no float32 copy of the matrix, not even per block
+            q_scale = max(float(np.abs(query_vec).max()), 1e-12) / 127.0
+            q_codes = np.clip(np.rint(query_vec / q_scale), -127, 127).astype(np.int8)
+            out = np.einsum("ij,j->i", self.compact, q_codes, dtype=np.int32).astype(np.float32)
+            out *= self.scales
+            out *= q_scale
+            return out
+        return scan_float32(self.compact, query_vec)
+
+    def search(self, query_vec: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        approx = self._approx_scores(query_vec)
+        shortlist = _top_k(approx, k * self.rescore_factor)
+
+        exact = self.full_matrix[shortlist].astype(np.float32) @ query_vec
+        order = np.argsort(-exact, kind="stable")[:k]
+        return shortlist[order], exact[order]
+
+
+def _spherical_kmeans(
+    X: np.ndarray, n_clusters: int, n_iter: int = 20, seed: int = 0, max_train: int = 65536
+) -> np.ndarray:
+    """
+    k-means on the unit sphere (assignment by max dot product, centroids re-normalized).
+    Trains on at most `max_train` sampled rows. Returns normalized centroids [n_clusters x d].
+    """
+    rng = np.random.default_rng(seed)
+    n = X.shape[0]
+    train = X[np.sort(rng.choice(n, size=min(n, max_train), replace=False))]
+    train = np.asarray(train, dtype=np.float32)
+
+    centroids = train[rng.choice(train.shape[0], size=n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = _assign(train, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, train)
+        counts = np.bincount(assign, minlength=n_clusters)
+        empty = counts == 0
+        if empty.any():
+            # Re-seed empty clusters on random training rows
+            sums[empty] = train[rng.choice(train.shape[0], size=int(empty.sum()), replace=False)]
+        centroids = sums / (np.linalg.norm(sums, axis=1, keepdims=True) + 1e-12)
+    return centroids.astype(np.float32)
+
+
+def default_nprobe(n_clusters: int) -> int:
+    """IVF_NPROBE_FRACTION of the clusters, at least IVF_MIN_NPROBE (and at most all)."""
+    return max(1, min(n_clusters, max(IVF_MIN_NPROBE, int(np.ceil(IVF_NPROBE_FRACTION * n_clusters)))))
+
+
+def _assign(X: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Nearest centroid (max dot) for every row of X, computed in blocks."""
+    out = np.empty(X.shape[0], dtype=np.int64)
+    for start in range(0, X.shape[0], SCAN_BLOCK_ROWS):
+        block = np.asarray(X[start:start + SCAN_BLOCK_ROWS], dtype=np.float32)
+        out[start:start + block.shape[0]] = np.argmax(block @ centroids.T, axis=1)
+    return out
+
+
+class IVFIndex:
+    """
+    Inverted-file index ("IVF-flat"):
+    - rows are grouped by nearest centroid; `order` holds row ids list by list and
+      `offsets[c]:offsets[c+1]` is the slice of cluster c;
+    - a query ranks the centroids, scans the rows of the best `nprobe` clusters exactly
+      (float32) and returns their top-k.
+
+    Cost per query ~ n_clusters + nprobe * n / n_clusters rows, i.e. ~sqrt(n) with the
+    default n_clusters = sqrt(n), instead of n for the exact scan. nprobe None/0 means
+    default_nprobe(n_clusters) (~10% of the rows scanned).
+    """
+
+    name = "ivf"
+
+    def __init__(self, centroids: np.ndarray, order: np.ndarray, offsets: np.ndarray,
+                 full_matrix: np.ndarray, nprobe: Optional[int] = None):
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+        self.full_matrix = full_matrix
+        self.nprobe = max(1, int(nprobe)) if nprobe else default_nprobe(centroids.shape[0])
+
+    @classmethod
+    def build(cls, matrix: np.ndarray, n_clusters: Optional[int] = None, nprobe: Optional[int] = None,
+              seed: int = 0) -> "IVFIndex":
+        n = matrix.shape[0]
+        if n_clusters is None:
+            n_clusters = max(1, int(round(np.sqrt(n))))
+        n_clusters = min(n_clusters, n)
+        centroids = _spherical_kmeans(matrix, n_clusters, seed=seed)
+        assign = _assign(matrix, centroids)
+        order = np.argsort(assign, kind="stable").astype(np.int64)
+        offsets = np.zeros(n_clusters + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assign, minlength=n_clusters))
+        return cls(centroids, order, offsets, matrix, nprobe=nprobe)
+
+    def save(self, path: Path) -> None:
+        np.savez(path, centroids=self.centroids, order=self.order, offsets=self.offsets)
+
+    @classmethod
+    def load(cls, path: Path, full_matrix: np.ndarray, nprobe: Optional[int] = None) -> "IVFIndex":
+        data = np.load(path)
+        return cls(data["centroids"], data["order"], data["offsets"], full_matrix, nprobe=nprobe)
+
+    def search(self, query_vec: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        n_clusters = self.centroids.shape[0]
+        cluster_rank = np.argsort(-(self.centroids @ query_vec))
+
+        # Probe nprobe clusters, widening until at least k candidates are available
+        probe = min(self.nprobe, n_clusters)
+        while True:
+            lists = cluster_rank[:probe]
+            cand = np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in lists])
+            if cand.shape[0] >= k or probe >= n_clusters:
+                break
+            probe = min(n_clusters, probe * 2)
+
+        cand = np.sort(cand)  # ascending row ids: sequential reads from the memory map
+        scores = self.full_matrix[cand].astype(np.float32) @ query_vec
+        top = _top_k(scores, k)
+        return cand[top], scores[top]
+
+
+def encode_label_queries(model_name: Optional[str] = None) -> Optional[np.ndarray]:
+    """
+    The questions of relevance_labels.jsonl encoded by the serving model: held-out,
+    real user-like queries for measure_recall. None if the labels or the model are
+    not available.
+    """
+    from embedding_model import EMBEDDING_MODEL_NAME, get_embedding_model
+    from relevance import LABELS_PATH, load_labels
+
+    try:
+        questions = [item["question"] for item in load_labels(LABELS_PATH)]
+        model = get_embedding_model(model_name or EMBEDDING_MODEL_NAME, device="cpu")
+        vecs = model.encode(questions, show_progress_bar=False, normalize_embeddings=True)
+    except Exception as e:
+        print(f"[WARN] Cannot encode the labeled questions for recall ({type(e).__name__}: {e})")
+        return None
+    return np.asarray(vecs, dtype=np.float32)
+
+
+def measure_recall(index, matrix: np.ndarray, queries: Optional[np.ndarray] = None, k: int = 10,
+                   n_queries: int = 200, seed: int = 0) -> Dict[str, Any]:
+    """
+    recall@k of `index` against the exact scan, on `queries` (normalized [m x d], e.g.
+    encode_label_queries()). Without them, perturbed corpus rows are used: those are
+    near-duplicates of indexed rows and overstate recall ("query_source" says which).
+    Also reports the mean latency of both, in milliseconds.
+    """
+    n, d = matrix.shape
+    source = "queries"
+    if queries is None:
+        rng = np.random.default_rng(seed)
+        rows = np.asarray(matrix[rng.integers(0, n, size=n_queries)], dtype=np.float32)
+        queries = rows + 0.05 * rng.standard_normal((n_queries, d)).astype(np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        source = "perturbed rows (optimistic)"
+    queries = np.asarray(queries, dtype=np.float32)
+    n_queries = queries.shape[0]
+
+    exact = ExactIndex(matrix)
+    hits, t_exact, t_index = 0, 0.0, 0.0
+    for q in queries:
+        t0 = time.perf_counter()
+        truth, _ = exact.search(q, k)
+        t1 = time.perf_counter()
+        got, _ = index.search(q, k)
+        t2 = time.perf_counter()
+        hits += len(set(truth.tolist()) & set(got.tolist()))
+        t_exact += t1 - t0
+        t_index += t2 - t1
+    return {
+        "recall_at_k": hits / float(n_queries * min(k, n)),
+        "exact_ms": 1000.0 * t_exact / n_queries,
+        "index_ms": 1000.0 * t_index / n_queries,
+        "queries": n_queries,
+        "query_source": source,
+    }
+
+
+def ivf_path(vectors_path: str) -> Path:
+    """vectors.json -> vectors.ivf.npz"""
+    p = Path(vectors_path)
+    return p.with_name(f"{p.stem}.ivf.npz")
+
+
+def quantized_paths(vectors_path: str, mode: str) -> Tuple[Path, Path]:
+    """vectors.json -> (vectors.<mode>.npy, vectors.<mode>_scales.npy)."""
+    p = Path(vectors_path)
+    return p.with_name(f"{p.stem}.{mode}.npy"), p.with_name(f"{p.stem}.{mode}_scales.npy")
+
+
+def save_quantized(matrix: np.ndarray, vectors_path: str, mode: str) -> Path:
+    """Writes the compact copy of a (normalized) float32 matrix next to the vector store."""
+    if mode not in QUANTIZED_MODES:
+        raise ValueError(f"mode must be one of {QUANTIZED_MODES}, got {mode!r}")
+    codes_path, scales_path = quantized_paths(vectors_path, mode)
+    if mode == "int8":
+        codes, scales = quantize_int8(matrix)
+        np.save(codes_path, codes)
+        np.save(scales_path, scales)
+    else:
+        np.save(codes_path, np.asarray(matrix, dtype=np.float16))
+    return codes_path
+
+
+def load_dense_index(mode: str, full_matrix: np.ndarray, vectors_path: str,
+                     rescore_factor: int = 4, nprobe: Optional[int] = None):
+    """
+    Returns the backend selected by `mode` ("exact", "int8", "float16", "ivf").
+    Falls back to ExactIndex (with a warning) when the artifacts are missing or do
+    not match the vector store; "ivf" also falls back below IVF_MIN_ROWS rows.
+    """
+    if mode in ("", "exact", "float32"):
+        return ExactIndex(full_matrix)
+    if mode == "ivf":
+        path = ivf_path(vectors_path)
+        if full_matrix.shape[0] < IVF_MIN_ROWS:
+            return ExactIndex(full_matrix)
+        if not path.exists():
+            print(f"[WARN] {path} not found; using exact search. Run build_index.py.")
+            return ExactIndex(full_matrix)
+        index = IVFIndex.load(path, full_matrix, nprobe=nprobe)
+        if index.offsets[-1] != full_matrix.shape[0]:
+            print(f"[WARN] {path} does not match the vector store; using exact search.")
+            return ExactIndex(full_matrix)
+        return index
+    if mode not in QUANTIZED_MODES:
+        print(f"[WARN] Unknown dense index mode {mode!r}; using exact search.")
+        return ExactIndex(full_matrix)
+
+    codes_path, scales_path = quantized_paths(vectors_path, mode)
+    if not codes_path.exists() or (mode == "int8" and not scales_path.exists()):
+        print(f"[WARN] {codes_path} not found; using exact search. Run build_index.py.")
+        return ExactIndex(full_matrix)
+
+    compact = np.load(codes_path, mmap_mode="r")
+    scales = np.load(scales_path) if mode == "int8" else None
+    if compact.shape != full_matrix.shape:
+        print(f"[WARN] {codes_path} does not match the vector store; using exact search.")
+        return ExactIndex(full_matrix)
+    return QuantizedIndex(compact, full_matrix, scales=scales, rescore_factor=rescore_factor)
+
+
+def main():
+    """
+    Builds the IVF index for an existing vector store and checks its recall on the
+    labeled questions (relevance_labels.jsonl) encoded by the serving model:
+      python dense_index.py [vectors.json] [--clusters N] [--nprobe N] [--k 10]
+    """
+    from vector_store import load_vector_store
+
+    parser = argparse.ArgumentParser(description="Build the IVF index and measure recall vs exact search.")
+    parser.add_argument("vectors_path", nargs="?", default="vectors.json")
+    parser.add_argument("--clusters", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, default=None, help="default: ~10%% of the clusters, at least 8")
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    matrix, _ = load_vector_store(args.vectors_path, mmap=True)
+    index = IVFIndex.build(matrix, n_clusters=args.clusters, nprobe=args.nprobe)
+    index.save(ivf_path(args.vectors_path))
+    report = measure_recall(index, matrix, encode_label_queries(), k=args.k)
+    print(f"OK: saved {ivf_path(args.vectors_path)} (clusters={index.centroids.shape[0]}, "
+          f"nprobe={index.nprobe}) recall@{args.k}={report['recall_at_k']:.3f} "
+          f"on {report['queries']} {report['query_source']} "
+          f"exact={report['exact_ms']:.2f}ms ivf={report['index_ms']:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+# embedding_batcher.py
+#
+# Micro-batching dispatcher in front of the query encoder.
+#
+# Every chat request embeds one short query. Under bursty traffic the concurrent
+# batch-of-one forward passes run one at a time and fight for the same cores, while one
+# forward pass over 16 queries costs little more than over one. The dispatcher owns the
+# model calls: callers (sync threads or asyncio tasks) enqueue their text and wait on a
+# future; a single daemon thread drains the queue, encodes up to EMBED_BATCH_MAX texts in
+# one encode() call and hands every caller its own row.
+#
+# Idle latency: a query that arrives while nothing else is going on is encoded at once.
+# The collection window (EMBED_BATCH_WAIT_MS) is only waited for when the encoder is
+# busy, i.e. another query is already queued or a batch finished less than one window ago.
+#
+# Metrics (stats()): batches, queries, batch-size distribution, queue wait (ms, from
+# enqueue to start of the encode call that served it).
+#
+# Self-check (cancelled callers must not stop the dispatcher): python embedding_batcher.py
+
+import asyncio
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, InvalidStateError
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# EMBED_BATCHING=0 encodes every query directly in the calling thread (old behavior)
+EMBED_BATCHING = os.environ.get("EMBED_BATCHING", "1").strip().lower() not in ("0", "false", "no", "off")
+EMBED_BATCH_MAX = int(os.environ.get("EMBED_BATCH_MAX", "32"))
+EMBED_BATCH_WAIT_MS = float(os.environ.get("EMBED_BATCH_WAIT_MS", "3"))
+
+# Batch-size buckets reported by stats() (upper bounds, inclusive)
+_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+# Recent queue waits kept for the percentiles
+_WAIT_SAMPLES = 2048
+
+
+class EmbeddingBatcher:
+    """
+    encode_fn(texts) -> [len(texts) x dim] array, called from the dispatcher thread only.
+    embed() / aembed() return the row of one text.
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str]], np.ndarray],
+                 max_batch: int = EMBED_BATCH_MAX, max_wait_ms: float = EMBED_BATCH_WAIT_MS):
+        self.encode_fn = encode_fn
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait_s = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue: "queue.Queue[Tuple[str, Future, float]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._last_batch_end = 0.0
+
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.queries = 0
+        self.max_batch_seen = 0
+        self._size_counts = [0] * (len(_SIZE_BUCKETS) + 1)
+        self._waits_ms: Deque[float] = deque(maxlen=_WAIT_SAMPLES)
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        self._ensure_thread()
+        fut: Future = Future()
+        self._queue.put((text, fut, time.perf_counter()))
+        return fut
+
+    def embed(self, text: str) -> np.ndarray:
+        """Blocking (worker threads, scripts)."""
+        return self.submit(text).result()
+
+    async def aembed(self, text: str) -> np.ndarray:
+        """Awaitable (event loop): the loop is not blocked while the batch is encoded."""
+        return await asyncio.wrap_future(self.submit(text))
+
+    def _collect(self) -> List[Tuple[str, Future, float]]:
+        batch = [self._queue.get()]
+        # Whatever is already waiting joins for free
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        busy = len(batch) > 1 or (time.perf_counter() - self._last_batch_end) < self.max_wait_s
+        if busy and self.max_wait_s > 0:
+            deadline = batch[0][2] + self.max_wait_s
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+        return batch
+
+    def _run(self) -> None:
+        # Nothing may escape this loop: a dead dispatcher would leave every later caller
+        # waiting forever on a future nobody completes.
+        while True:
+            try:
+                self._run_batch(self._collect())
+            except Exception as e:
+                print("[WARN] embedding batcher: batch failed:", e)
+
+    def _run_batch(self, batch: List[Tuple[str, Future, float]]) -> None:
+        # A caller that gave up (cancelled asyncio task: client disconnect, timeout) has
+        # cancelled its future; drop it. The others move to RUNNING and can no longer be
+        # cancelled, so setting their result below cannot race with a cancel().
+        batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        t0 = time.perf_counter()
+        try:
+            vecs = np.asarray(self.encode_fn([text for text, _, _ in batch]), dtype=np.float32)
+        except Exception as e:
+            for _, fut, _ in batch:
+                _settle(fut, exc=e)
+        else:
+            for i, (_, fut, _) in enumerate(batch):
+                _settle(fut, result=vecs[i])
+        self._last_batch_end = time.perf_counter()
+        self._record(len(batch), [(t0 - t_enq) * 1000.0 for _, _, t_enq in batch])
+
+    def _record(self, size: int, waits_ms: List[float]) -> None:
+        with self._stats_lock:
+            self.batches += 1
+            self.queries += size
+            self.max_batch_seen = max(self.max_batch_seen, size)
+            bucket = next((i for i, b in enumerate(_SIZE_BUCKETS) if size <= b), len(_SIZE_BUCKETS))
+            self._size_counts[bucket] += 1
+            self._waits_ms.extend(waits_ms)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            waits = np.asarray(self._waits_ms, dtype=np.float64)
+            labels = [f"<={b}" for b in _SIZE_BUCKETS] + [f">{_SIZE_BUCKETS[-1]}"]
+            return {
+                "batches": self.batches,
+                "queries": self.queries,
+                "mean_batch_size": (self.queries / self.batches) if self.batches else 0.0,
+                "max_batch_size": self.max_batch_seen,
+                "batch_size_counts": dict(zip(labels, self._size_counts)),
+                "queue_wait_ms": {
+                    "mean": float(waits.mean()) if waits.size else 0.0,
+                    "p50": float(np.percentile(waits, 50)) if waits.size else 0.0,
+                    "p95": float(np.percentile(waits, 95)) if waits.size else 0.0,
+                    "max": float(waits.max()) if waits.size else 0.0,
+                },
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait_s * 1000.0,
+            }
+
+
+def _settle(fut: Future, result: Any = None, exc: Optional[BaseException] = None) -> None:
+    try:
+        if exc is not None:
+            fut.set_exception(exc)
+        else:
+            fut.set_result(result)
+    except InvalidStateError:
+        pass  # already settled: nobody is waiting on it
+
+
+_BATCHERS: Dict[Tuple[str, str], EmbeddingBatcher] = {}
+_BATCHERS_LOCK = threading.Lock()
+
+
+def get_embedding_batcher(model_name: str, device: str = "cpu") -> EmbeddingBatcher:
+    """
+    Process-wide dispatcher for the shared encoder of (model_name, device): every
+    Retriever (index versions included) funnels its queries through the same queue.
+    """
+    key = (model_name, device)
+    batcher = _BATCHERS.get(key)
+    if batcher is None:
+        with _BATCHERS_LOCK:
+            batcher = _BATCHERS.get(key)
+            if batcher is None:
+                from embedding_model import get_embedding_model
+
+                def encode(texts: List[str]) -> np.ndarray:
+                    model = get_embedding_model(model_name, device=device)
+                    return model.encode(texts, batch_size=len(texts), show_progress_bar=False,
+                                        normalize_embeddings=True)
+
+                batcher = EmbeddingBatcher(encode)
+                _BATCHERS[key] = batcher
+    return batcher
+
+
+def embedding_batcher_stats() -> Dict[str, Dict[str, Any]]:
+    return {f"{name}@{device}": b.stats() for (name, device), b in list(_BATCHERS.items())}
+
+
+def self_check() -> None:
+    """
+    Cancels one asyncio waiter in the middle of a batch, then checks that the other
+    callers of that batch and a later embed() are still served.
+    """
+    started, release = threading.Event(), threading.Event()
+
+    def slow_encode(texts: List[str]) -> np.ndarray:
+        started.set()
+        release.wait(5.0)
+        return np.asarray([[float(len(t))] for t in texts], dtype=np.float32)
+
+    batcher = EmbeddingBatcher(slow_encode, max_batch=8, max_wait_ms=50)
+
+    async def scenario() -> None:
+        first = asyncio.ensure_future(batcher.aembed("a"))
+        await asyncio.sleep(0)
+        await asyncio.to_thread(started.wait, 5.0)
+        # Queued behind the running batch: they form the next one
+        waiters = [asyncio.ensure_future(batcher.aembed(t)) for t in ("bb", "ccc", "dddd")]
+        await asyncio.sleep(0.01)
+        waiters[1].cancel()
+        first.cancel()  # cancelled while its batch is being encoded
+        release.set()
+        assert (await waiters[0])[0] == 2.0 and (await waiters[2])[0] == 4.0
+        for task in (first, waiters[1]):
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    asyncio.run(scenario())
+    vec = batcher.submit("eeeee").result(timeout=5.0)
+    assert vec[0] == 5.0 and batcher._thread.is_alive(), "dispatcher died after a cancelled caller"
+    print(f"OK: cancelled callers skipped, dispatcher alive ({batcher.stats()['queries']} queries served)")
+
+
+if __name__ == "__main__":
+    self_check()
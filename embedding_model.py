@@ -0,0 +1,125 @@
+# embedding_model.py
+#
+# Process-wide registry of SentenceTransformer instances.
+# server.py (startup warm-up) and retriever.py (query encoding) both go through
+# get_embedding_model(), so the model is loaded exactly once per process.
+#
+# A load can be *deferred* to a background thread (staged startup): while it is pending,
+# get_embedding_model(wait=False) returns None instead of blocking the caller, and the
+# retriever serves sparse-only results.
+#
+# EMBEDDING_BACKEND picks the query encoder:
+# - "torch" (default): SentenceTransformer;
+# - "onnx" / "onnx-int8": onnx_encoder.OnnxEncoder (onnxruntime, no torch import), from the
+#   model exported by `python onnx_encoder.py export`. If the export is missing or
+#   onnxruntime is not installed, the torch model is used instead.
+
+import os
+import threading
+from typing import Any, Dict, Set, Tuple
+
+# IMPORTANT:
+# Must match the model used in build_index.py.
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch").strip().lower()
+
+_MODELS: Dict[Tuple[str, str], Any] = {}
+_MODELS_LOCK = threading.Lock()
+# Keys whose load was handed to a background thread and has not finished yet
+_PENDING: Set[Tuple[str, str]] = set()
+
+
+def get_embedding_model(model_name: str = EMBEDDING_MODEL_NAME, device: str = "cpu", wait: bool = True):
+    """
+    Returns the shared encoder for (model_name, device), loading it on first use
+    (SentenceTransformer, or OnnxEncoder with the same encode() API).
+    The lock makes concurrent first calls (startup hook vs first request) load it only once.
+
+    wait=False: if a background load is pending, return None immediately instead of blocking.
+    """
+    key = (model_name, device)
+    model = _MODELS.get(key)
+    if model is not None:
+        return model
+    if not wait and key in _PENDING:
+        return None
+
+    with _MODELS_LOCK:
+        model = _MODELS.get(key)
+        if model is None:
+            try:
+                model = _load_model(model_name, device)
+                _MODELS[key] = model
+            finally:
+                # Failed or not, a later caller may retry synchronously
+                _PENDING.discard(key)
+    return model
+
+
+def _load_model(model_name: str, device: str):
+    if EMBEDDING_BACKEND in ("onnx", "onnx-int8") and device == "cpu":
+        model = _load_onnx_model(model_name, int8=EMBEDDING_BACKEND == "onnx-int8")
+        if model is not None:
+            return model
+    elif EMBEDDING_BACKEND != "torch":
+        print(f"[WARN] Unknown EMBEDDING_BACKEND={EMBEDDING_BACKEND!r}; using torch.")
+
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name, device=device)
+
+
+def _load_onnx_model(model_name: str, int8: bool):
+    """OnnxEncoder for model_name, or None (with a warning) if it cannot be used."""
+    try:
+        from onnx_encoder import ONNX_MODEL_DIR, OnnxEncoder, onnx_model_available
+        if not onnx_model_available(ONNX_MODEL_DIR, int8=int8):
+            print(f"[WARN] No exported ONNX model in {ONNX_MODEL_DIR} "
+                  "(run: python onnx_encoder.py export); using torch.")
+            return None
+        encoder = OnnxEncoder(ONNX_MODEL_DIR, int8=int8)
+    except ImportError as e:
+        print(f"[WARN] ONNX backend not available ({e}); using torch.")
+        return None
+    if encoder.model_name != model_name:
+        print(f"[WARN] {ONNX_MODEL_DIR} was exported from {encoder.model_name}, "
+              f"not {model_name}; using torch.")
+        return None
+    print(f"[INFO] Query encoder: onnxruntime ({encoder.model_path.name})")
+    return encoder
+
+
+def defer_embedding_model(model_name: str = EMBEDDING_MODEL_NAME, device: str = "cpu") -> None:
+    """
+    Announces that a background thread is about to load this model: until it finishes,
+    non-waiting callers get None (degraded mode) rather than a multi-second stall.
+    """
+    if (model_name, device) not in _MODELS:
+        _PENDING.add((model_name, device))
+
+
+def cancel_deferred_embedding_model(model_name: str = EMBEDDING_MODEL_NAME, device: str = "cpu") -> None:
+    """
+    Withdraws defer_embedding_model when the background load will not happen (an
+    earlier startup stage failed): the next caller loads the model itself instead of
+    finding it pending forever.
+    """
+    _PENDING.discard((model_name, device))
+
+
+def is_embedding_model_pending(model_name: str = EMBEDDING_MODEL_NAME, device: str = "cpu") -> bool:
+    return (model_name, device) in _PENDING
+
+
+def warm_up_embedding_model(model_name: str = EMBEDDING_MODEL_NAME, device: str = "cpu"):
+    """
+    Loads the shared model and runs one dummy encode, so the first real request
+    does not pay for lazy initialization (tokenizer, kernels, thread pools).
+    """
+    model = get_embedding_model(model_name, device=device)
+    model.encode(["warm-up"], show_progress_bar=False, normalize_embeddings=True)
+    return model
+
+
+def is_embedding_model_loaded(model_name: str = EMBEDDING_MODEL_NAME, device: str = "cpu") -> bool:
+    return (model_name, device) in _MODELS
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# index_versions.py
+#
+# Versioned index artifacts + hot reload support.
+#
+# Layout (INDEX_ROOT, default ./indexes):
+#   indexes/20250101-120000/   vectors.npy, vectors_meta.json, quantized/IVF copies,
+#                              tfidf_*, bm25_index.npz, sparse_vocab.json
+#   indexes/CURRENT            name of the published version (one line)
+#
+# A version directory is never modified after it is published: a rebuild writes a new
+# directory and then replaces CURRENT atomically (os.replace), so a reader sees either
+# the old or the new index, never a half-written one. Without CURRENT the retriever
+# keeps using the flat artifacts in the repo root (legacy layout).
+#
+# Usage:
+#   python index_versions.py build            # build_index + build_tfidf into a new version, publish it
+#                                             # (only new/changed chunks are embedded; --full re-embeds all)
+#   python index_versions.py list
+#   python index_versions.py publish <name>   # e.g. roll back to a previous version
+#
+# The running server picks up a new version through POST /admin/reload or, with
+# INDEX_WATCH_INTERVAL_S > 0, through IndexWatcher (see server.py).
+
+import argparse
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+INDEX_ROOT = Path(os.environ.get("INDEX_ROOT", "indexes"))
+CURRENT_FILE = "CURRENT"
+# Published versions kept on disk by `build` (older ones are deleted)
+KEEP_VERSIONS = int(os.environ.get("INDEX_KEEP_VERSIONS", "3"))
+
+
+def current_index_dir(root: Path = INDEX_ROOT) -> Path:
+    """Directory of the published version, or the repo root if nothing was published."""
+    pointer = root / CURRENT_FILE
+    if pointer.exists():
+        name = pointer.read_text(encoding="utf-8").strip()
+        if name and (root / name).is_dir():
+            return root / name
+        print(f"[WARN] {pointer} points to a missing version {name!r}; using the repo root index.")
+    return Path(".")
+
+
+def current_vectors_path(root: Path = INDEX_ROOT) -> str:
+    # Every artifact of a version sits next to its vectors.json (binary store siblings included)
+    return str(current_index_dir(root) / "vectors.json")
+
+
+def list_versions(root: Path = INDEX_ROOT) -> List[str]:
+    if not root.is_dir():
+        return []
+    return sorted(p.name for p in root.iterdir() if p.is_dir() and not p.name.startswith("."))
+
+
+def new_version_dir(root: Path = INDEX_ROOT) -> Path:
+    """Creates an empty, not yet published version directory (named by UTC timestamp)."""
+    root.mkdir(parents=True, exist_ok=True)
+    base = time.strftime("%Y%m%d-%H%M%S", time.gmtime())
+    name, n = base, 1
+    while (root / name).exists():
+        n += 1
+        name = f"{base}-{n}"
+    path = root / name
+    path.mkdir()
+    return path
+
+
+def publish(version: str, root: Path = INDEX_ROOT) -> Path:
+    """Points CURRENT at `version` atomically."""
+    path = root / version
+    if not (path / "vectors_meta.json").exists():
+        raise FileNotFoundError(f"{path} is not a complete index version (vectors_meta.json missing)")
+    tmp = root / f".{CURRENT_FILE}.tmp"
+    tmp.write_text(version + "\n", encoding="utf-8")
+    os.replace(tmp, root / CURRENT_FILE)
+    return path
+
+
+def prune(keep: int = KEEP_VERSIONS, root: Path = INDEX_ROOT) -> List[str]:
+    """Deletes the oldest versions beyond `keep`, never the published one."""
+    current = current_index_dir(root).name
+    old = [v for v in list_versions(root) if v != current]
+    removed = old[:max(0, len(old) - max(0, keep - 1))]
+    for name in removed:
+        shutil.rmtree(root / name, ignore_errors=True)
+    return removed
+
+
+def index_signature(root: Path = INDEX_ROOT) -> Tuple[str, ...]:
+    """
+    Cheap change detector: the published directory plus mtime/size of the files a
+    rebuild always rewrites (also catches in-place rebuilds of the legacy layout).
+    """
+    index_dir = current_index_dir(root)
+    parts = [str(index_dir.resolve())]
+    for name in ("vectors.npy", "vectors_meta.json", "tfidf_meta.json", "bm25_index.npz"):
+        try:
+            st = os.stat(index_dir / name)
+            parts.append(f"{name}:{st.st_mtime_ns:x}-{st.st_size:x}")
+        except OSError:
+            parts.append(f"{name}:-")
+    return tuple(parts)
+
+
+class IndexWatcher:
+    """
+    Polls index_signature() every `interval_s` seconds in a daemon thread and calls
+    on_change() once a new signature has been stable for two polls (an in-place rebuild
+    writes several files; reloading halfway would load a mixed index).
+    Errors of on_change are logged; the next change triggers a new attempt.
+    """
+
+    def __init__(self, on_change: Callable[[], object], interval_s: float = 5.0, root: Path = INDEX_ROOT):
+        self.on_change = on_change
+        self.interval_s = float(interval_s)
+        self.root = root
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None or self.interval_s <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name="index-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        loaded = index_signature(self.root)
+        candidate = None
+        while not self._stop.wait(self.interval_s):
+            sig = index_signature(self.root)
+            if sig == loaded:
+                candidate = None
+                continue
+            if sig != candidate:
+                # First sighting: wait one more poll for the writer to finish
+                candidate = sig
+                continue
+            try:
+                self.on_change()
+            except Exception as e:
+                print("[WARN] Index reload failed, keeping the previous index:", e)
+            loaded, candidate = sig, None
+
+
+def build_version(data_dir: str = "data", incremental: bool = True, root: Path = INDEX_ROOT) -> Path:
+    """
+    Runs the build into a fresh version directory, publishes it and prunes old ones.
+    incremental=True reuses the embeddings of unchanged chunks from the current version.
+    """
+    import build_index
+    import build_tfidf
+
+    previous_dir = current_index_dir(root)
+    path = new_version_dir(root)
+    try:
+        build_index.build(data_dir=data_dir, out_dir=str(path),
+                          incremental=incremental, previous_dir=str(previous_dir))
+        build_tfidf.build(index_dir=path)
+    except BaseException:
+        # A failed build must not leave a half-written version behind
+        shutil.rmtree(path, ignore_errors=True)
+        raise
+    publish(path.name, root)
+    prune(root=root)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build, list and publish versioned index artifacts.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_build = sub.add_parser("build", help="build a new version from ./data and publish it")
+    p_build.add_argument("--data-dir", default="data")
+    p_build.add_argument("--full", action="store_true", help="re-embed every chunk")
+    sub.add_parser("list", help="list the versions on disk")
+    p_pub = sub.add_parser("publish", help="make an existing version the current one")
+    p_pub.add_argument("version")
+    args = parser.parse_args()
+
+    if args.cmd == "build":
+        path = build_version(data_dir=args.data_dir, incremental=not args.full)
+        print(f"OK: built and published {path}")
+    elif args.cmd == "list":
+        current = current_index_dir().name
+        for name in list_versions():
+            print(("* " if name == current else "  ") + name)
+    elif args.cmd == "publish":
+        print(f"OK: published {publish(args.version)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# loadtest.py
+#
+# End-to-end load generator for POST /api/chat (or /api/chat/stream).
+#
+# For each concurrency level, `concurrency` closed-loop clients send --requests questions
+# in total (cycling the labeled questions of relevance_labels.jsonl) and the report gives
+# requests/s, latency p50/p95/p99 (plus time to first token when streaming), errors and
+# the mean per-stage server time parsed from the Server-Timing header (metrics.py), so a
+# slowdown can be attributed to embed / dense / sparse / llm / ...
+#
+# --spawn starts the whole stack locally and offline: stub_llm.py (OpenAI-compatible, fixed
+# latency + token pacing) and `uvicorn server:app` pointed at it with OPENAI_BASE_URL. The
+# answer cache is disabled there (ANSWER_CACHE_SIZE=0) unless --answer-cache, otherwise
+# every repeated question would skip the LLM.
+#
+# Usage:
+#   python loadtest.py --spawn                                   # 1,4,16,64 clients, 200 requests each
+#   python loadtest.py --spawn --stream --stub-latency-ms 500 --concurrency 8,32
+#   python loadtest.py --url http://127.0.0.1:8000 --requests 500 --out load.json
+#   python benchmark.py compare bench_results/load-<old>.json bench_results/load-<new>.json
+
+import argparse
+import asyncio
+import itertools
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmark import latency_summary, run_metadata, write_report
+from relevance import LABELS_PATH, load_labels
+
+DEFAULT_CONCURRENCY = "1,4,16,64"
+
+
+def load_questions(path: Optional[str] = None, include_offtopic: bool = False) -> List[str]:
+    """Labeled questions (on-topic only by default: off-topic ones never reach the LLM)."""
+    if path and not path.endswith(".jsonl"):
+        return [line.strip() for line in Path(path).read_text(encoding="utf-8").splitlines() if line.strip()]
+    labels = load_labels(Path(path) if path else LABELS_PATH)
+    return [item["question"] for item in labels if include_offtopic or item.get("relevant", True)]
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    """'embed;dur=0.6, llm;dur=812.0' -> {"embed": 0.6, "llm": 812.0}"""
+    out: Dict[str, float] = {}
+    for metric in header.split(","):
+        name, _, params = metric.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                try:
+                    out[name] = float(value)
+                except ValueError:
+                    pass
+    return out
+
+
+async def _send(client: httpx.AsyncClient, url: str, question: str, stream: bool) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    row: Dict[str, Any] = {"ok": False, "status": 0, "ttft_ms": None, "stages": {}}
+    try:
+        if stream:
+            async with client.stream("POST", url + "/api/chat/stream", json={"question": question}) as r:
+                row["status"] = r.status_code
+                row["stages"] = parse_server_timing(r.headers.get("server-timing", ""))
+                failed = r.status_code != 200
+                async for line in r.aiter_lines():
+                    if line.startswith("event: token") and row["ttft_ms"] is None:
+                        row["ttft_ms"] = (time.perf_counter() - t0) * 1000.0
+                    elif line.startswith("event: error"):
+                        failed = True
+                row["ok"] = not failed
+        else:
+            r = await client.post(url + "/api/chat", json={"question": question})
+            row["status"] = r.status_code
+            row["stages"] = parse_server_timing(r.headers.get("server-timing", ""))
+            row["ok"] = r.status_code == 200
+    except Exception as e:
+        row["error"] = type(e).__name__
+    row["latency_ms"] = (time.perf_counter() - t0) * 1000.0
+    return row
+
+
+async def run_level(url: str, questions: List[str], concurrency: int, n_requests: int,
+                    stream: bool = False, warmup: int = 0, timeout_s: float = 120.0) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout_s) as client:
+        for q in questions[:warmup]:
+            await _send(client, url, q, stream)
+
+        counter = itertools.count()
+        rows: List[Dict[str, Any]] = []
+
+        async def worker() -> None:
+            while True:
+                i = next(counter)
+                if i >= n_requests:
+                    return
+                rows.append(await _send(client, url, questions[i % len(questions)], stream))
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - t0
+
+    ok = [r for r in rows if r["ok"]]
+    statuses: Dict[str, int] = {}
+    for r in rows:
+        key = r.get("error") or str(r["status"])
+        statuses[key] = statuses.get(key, 0) + 1
+    stage_totals: Dict[str, List[float]] = {}
+    for r in ok:
+        for name, ms in r["stages"].items():
+            stage_totals.setdefault(name, []).append(ms)
+    result = {
+        "concurrency": concurrency,
+        "requests": len(rows),
+        "errors": len(rows) - len(ok),
+        "error_rate": round((len(rows) - len(ok)) / len(rows), 4) if rows else 0.0,
+        "seconds": round(elapsed, 3),
+        "rps": round(len(ok) / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency": latency_summary([r["latency_ms"] for r in ok]),
+        "statuses": statuses,
+        "server_timing_mean_ms": {k: round(sum(v) / len(v), 2) for k, v in stage_totals.items()},
+    }
+    if stream:
+        result["ttft"] = latency_summary([r["ttft_ms"] for r in ok if r["ttft_ms"] is not None])
+    return result
+
+
+# ---- Local stack (--spawn) ----
+def _wait_until(url: str, timeout_s: float, ready: bool = False) -> bool:
+    deadline = time.time() + timeout_s
+    while time.time() < deadline:
+        try:
+            r = httpx.get(url, timeout=2.0)
+            if r.status_code == 200 or (not ready and r.status_code < 500):
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def spawn_stack(port: int, stub_port: int, stub_args: List[str], answer_cache: bool,
+                ready_timeout_s: float) -> List[subprocess.Popen]:
+    here = Path(__file__).resolve().parent
+    stub = subprocess.Popen([sys.executable, str(here / "stub_llm.py"), "--port", str(stub_port), *stub_args],
+                            cwd=here)
+    env = dict(os.environ)
+    env["OPENAI_BASE_URL"] = f"http://127.0.0.1:{stub_port}/v1"
+    env.setdefault("OPENAI_API_KEY", "stub")
+    if not answer_cache:
+        env["ANSWER_CACHE_SIZE"] = "0"
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "server:app", "--port", str(port),
+                               "--log-level", "warning"], cwd=here, env=env)
+    procs = [stub, server]
+    if not _wait_until(f"http://127.0.0.1:{stub_port}/healthz", 30):
+        stop_stack(procs)
+        raise SystemExit("[WARN] stub_llm.py did not start")
+    if not _wait_until(f"http://127.0.0.1:{port}/readyz", ready_timeout_s, ready=True):
+        # Still loading the embedding model: measured numbers would be sparse-only
+        print(f"[WARN] server not ready after {ready_timeout_s} s (see /readyz); measuring anyway")
+    return procs
+
+
+def stop_stack(procs: List[subprocess.Popen]) -> None:
+    for p in procs:
+        p.terminate()
+    for p in procs:
+        try:
+            p.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            p.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /api/chat and write a JSON report.")
+    parser.add_argument("--url", default=None, help="running server (default with --spawn: http://127.0.0.1:--port)")
+    parser.add_argument("--concurrency", default=DEFAULT_CONCURRENCY, help="comma-separated client counts")
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=5, help="untimed requests before each level")
+    parser.add_argument("--stream", action="store_true", help="use /api/chat/stream (adds time to first token)")
+    parser.add_argument("--questions", default=None, help=".jsonl labels or a text file with one question per line")
+    parser.add_argument("--include-offtopic", action="store_true", help="also send questions labeled off-topic")
+    parser.add_argument("--timeout-s", type=float, default=120.0)
+    parser.add_argument("--out", default=None, help="default: bench_results/load-<commit>.json")
+    spawn = parser.add_argument_group("local stack")
+    spawn.add_argument("--spawn", action="store_true", help="start stub_llm.py + uvicorn server:app")
+    spawn.add_argument("--port", type=int, default=8000)
+    spawn.add_argument("--stub-port", type=int, default=8001)
+    spawn.add_argument("--stub-latency-ms", type=float, default=300.0)
+    spawn.add_argument("--stub-jitter-ms", type=float, default=0.0)
+    spawn.add_argument("--stub-token-ms", type=float, default=20.0)
+    spawn.add_argument("--stub-output-tokens", type=int, default=60)
+    spawn.add_argument("--answer-cache", action="store_true", help="keep the semantic answer cache on")
+    spawn.add_argument("--ready-timeout-s", type=float, default=300.0)
+    args = parser.parse_args()
+
+    if not args.spawn and not args.url:
+        parser.error("give --url of a running server or --spawn")
+    url = (args.url or f"http://127.0.0.1:{args.port}").rstrip("/")
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    questions = load_questions(args.questions, args.include_offtopic)
+    if not questions:
+        raise SystemExit("[WARN] No questions to send")
+
+    params: Dict[str, Any] = {
+        "url": url, "endpoint": "/api/chat/stream" if args.stream else "/api/chat",
+        "concurrency": levels, "requests": args.requests, "warmup": args.warmup,
+        "questions": len(questions), "spawned": args.spawn,
+    }
+    procs: List[subprocess.Popen] = []
+    if args.spawn:
+        stub_args = ["--latency-ms", str(args.stub_latency_ms), "--jitter-ms", str(args.stub_jitter_ms),
+                     "--token-ms", str(args.stub_token_ms), "--output-tokens", str(args.stub_output_tokens)]
+        params["stub"] = {"latency_ms": args.stub_latency_ms, "jitter_ms": args.stub_jitter_ms,
+                          "token_ms": args.stub_token_ms, "output_tokens": args.stub_output_tokens,
+                          "answer_cache": args.answer_cache}
+        procs = spawn_stack(args.port, args.stub_port, stub_args, args.answer_cache, args.ready_timeout_s)
+
+    results: Dict[str, Any] = {}
+    try:
+        for c in levels:
+            res = asyncio.run(run_level(url, questions, c, args.requests, stream=args.stream,
+                                        warmup=args.warmup, timeout_s=args.timeout_s))
+            results[f"concurrency_{c}"] = res
+            lat = res["latency"]
+            print(f"[INFO] c={c}: {res['rps']} req/s, p50 {lat.get('p50_ms', 0):.1f} ms, "
+                  f"p95 {lat.get('p95_ms', 0):.1f} ms, p99 {lat.get('p99_ms', 0):.1f} ms, "
+                  f"errors {res['errors']}/{res['requests']}")
+    finally:
+        if procs:
+            stop_stack(procs)
+
+    write_report({"kind": "load", "meta": run_metadata(), "params": params, "results": results}, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# onnx_encoder.py
+#
+# ONNX Runtime query encoder (EMBEDDING_BACKEND=onnx / onnx-int8).
+#
+# Serving only has to embed one short query per request, but SentenceTransformer pulls in
+# all of torch for it (hundreds of MB of RSS, seconds of import on a cold instance).
+# This module exports all-MiniLM-L6-v2 once to ONNX (optionally int8, dynamic quantization
+# of the weights) and encodes with onnxruntime + the `tokenizers` package only:
+#   tokenize (same tokenizer.json, truncation at max_seq_length) -> transformer (ONNX)
+#   -> mean pooling over the attention mask -> L2 normalization,
+# i.e. the same pipeline as the sentence-transformers model (Transformer, Pooling(mean),
+# Normalize). OnnxEncoder.encode() has the SentenceTransformer.encode() signature used in
+# this repo, so the retriever and the warm-up do not know which backend they run on.
+#
+# The index is still built with sentence-transformers (build_index.py); `parity` checks
+# that the ONNX embeddings match the stored ones before switching the backend.
+#
+# Usage (build machine, needs torch + sentence-transformers + onnx):
+#   python onnx_encoder.py export                 # -> onnx_model/model.onnx + model.int8.onnx
+#   python onnx_encoder.py export --no-quantize
+#   python onnx_encoder.py parity [--int8] [--samples 64]
+
+import argparse
+import inspect
+import json
+import os
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from embedding_model import EMBEDDING_MODEL_NAME
+
+ONNX_MODEL_DIR = Path(os.environ.get("ONNX_MODEL_DIR", "onnx_model"))
+# 0 = onnxruntime default (all physical cores)
+ONNX_THREADS = int(os.environ.get("ONNX_THREADS", "0"))
+
+MODEL_FILE = "model.onnx"
+MODEL_INT8_FILE = "model.int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+META_FILE = "encoder_meta.json"
+
+# Minimum cosine between ONNX and stored embeddings for `parity` to pass
+PARITY_MIN_COSINE = {"fp32": 0.999, "int8": 0.98}
+
+
+class OnnxEncoder:
+    """
+    Drop-in replacement for SentenceTransformer.encode() on onnxruntime (CPU).
+    Thread-safe: InferenceSession.run and Tokenizer.encode_batch can be called concurrently.
+    """
+
+    def __init__(self, model_dir: Path = ONNX_MODEL_DIR, int8: bool = False, threads: int = ONNX_THREADS):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_dir = Path(model_dir)
+        meta = json.loads((model_dir / META_FILE).read_text(encoding="utf-8"))
+        self.model_name = meta["model_name"]
+        self.max_seq_length = int(meta["max_seq_length"])
+        self.dim = int(meta["dim"])
+        self.model_path = model_dir / (MODEL_INT8_FILE if int8 else MODEL_FILE)
+
+        self.tokenizer = Tokenizer.from_file(str(model_dir / TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=self.max_seq_length)
+        pad_id = self.tokenizer.token_to_id("[PAD]") or 0
+        self.tokenizer.enable_padding(pad_id=pad_id, pad_token="[PAD]")
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            opts.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(str(self.model_path), sess_options=opts,
+                                            providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer.encode_batch(texts)
+        input_ids = np.asarray([e.ids for e in encoded], dtype=np.int64)
+        attention_mask = np.asarray([e.attention_mask for e in encoded], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.asarray([e.type_ids for e in encoded], dtype=np.int64)
+        hidden = self.session.run(None, feeds)[0]  # [batch x seq x dim]
+
+        # Mean pooling over the real tokens (sentence-transformers Pooling, mode "mean")
+        mask = attention_mask[:, :, None].astype(np.float32)
+        summed = (hidden * mask).sum(axis=1)
+        return summed / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self, sentences, batch_size: int = 32, show_progress_bar: bool = False,
+               normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        # Length-sorted batches pad less (same trick as SentenceTransformer.encode)
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            idx = order[start:start + batch_size]
+            out[idx] = self._encode_batch([texts[i] for i in idx])
+        if normalize_embeddings:
+            out /= np.clip(np.linalg.norm(out, axis=1, keepdims=True), 1e-12, None)
+        return out[0] if single else out
+
+
+def onnx_model_available(model_dir: Path = ONNX_MODEL_DIR, int8: bool = False) -> bool:
+    model_dir = Path(model_dir)
+    model_file = MODEL_INT8_FILE if int8 else MODEL_FILE
+    return all((model_dir / f).exists() for f in (model_file, TOKENIZER_FILE, META_FILE))
+
+
+def export(model_name: str = EMBEDDING_MODEL_NAME, out_dir: Path = ONNX_MODEL_DIR,
+           quantize: bool = True, opset: int = 14) -> Path:
+    """
+    Exports the transformer of the sentence-transformers model (pooling and normalization
+    are done in numpy by OnnxEncoder) plus its tokenizer. quantize=True also writes the
+    dynamic int8 copy (weights int8, activations quantized on the fly).
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    st = SentenceTransformer(model_name, device="cpu")
+    transformer = st[0]
+    pooling = getattr(st[1], "pooling_mode_mean_tokens", True) if len(st) > 1 else True
+    if not pooling:
+        raise ValueError(f"{model_name} does not use mean pooling; OnnxEncoder would not match it")
+
+    class _Wrapper(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask,
+                              token_type_ids=token_type_ids).last_hidden_state
+
+    model = _Wrapper(transformer.auto_model).eval()
+    dummy = transformer.tokenizer(["a dummy query", "export"], padding=True, return_tensors="pt")
+    args = (dummy["input_ids"], dummy["attention_mask"], dummy["token_type_ids"])
+    axes = {0: "batch", 1: "seq"}
+    kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        kwargs["dynamo"] = False  # TorchScript exporter: stable dynamic axes for BERT
+    with torch.no_grad():
+        torch.onnx.export(
+            model, args, str(out_dir / MODEL_FILE),
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={"input_ids": axes, "attention_mask": axes, "token_type_ids": axes,
+                          "last_hidden_state": axes},
+            opset_version=opset,
+            **kwargs,
+        )
+    print(f"[INFO] Exported {out_dir / MODEL_FILE}")
+
+    # tokenizer.json (fast tokenizer) is all OnnxEncoder needs
+    transformer.tokenizer.save_pretrained(str(out_dir))
+    meta = {
+        "model_name": model_name,
+        "max_seq_length": int(st.max_seq_length),
+        "dim": int(st.get_sentence_embedding_dimension()),
+        "pooling": "mean",
+        "opset": opset,
+    }
+    (out_dir / META_FILE).write_text(json.dumps(meta, indent=2), encoding="utf-8")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(str(out_dir / MODEL_FILE), str(out_dir / MODEL_INT8_FILE),
+                         weight_type=QuantType.QInt8)
+        print(f"[INFO] Quantized {out_dir / MODEL_INT8_FILE}")
+    for name in (MODEL_FILE, MODEL_INT8_FILE):
+        if (out_dir / name).exists():
+            print(f"[INFO] {name}: {(out_dir / name).stat().st_size / 1e6:.1f} MB")
+    return out_dir
+
+
+def parity(vectors_path: Optional[str] = None, model_dir: Path = ONNX_MODEL_DIR,
+           int8: bool = False, samples: int = 64) -> dict:
+    """
+    Re-encodes `samples` chunk texts of the index with OnnxEncoder and compares them with
+    the sentence-transformers embeddings stored at build time (cosine per chunk).
+    """
+    from index_versions import current_vectors_path
+    from vector_store import load_vector_store, store_exists
+
+    vectors_path = vectors_path or current_vectors_path()
+    if store_exists(vectors_path):
+        matrix, meta = load_vector_store(vectors_path, mmap=True)
+        texts = [c["text"] for c in meta["chunks"]]
+    else:
+        # Legacy vectors.json: [{"text", "embedding", ...}]
+        with open(vectors_path, "r", encoding="utf-8") as f:
+            items = json.load(f)
+        matrix = np.asarray([it["embedding"] for it in items], dtype=np.float32)
+        texts = [it["text"] for it in items]
+
+    rows = np.linspace(0, len(texts) - 1, num=min(samples, len(texts)), dtype=np.int64)
+    encoder = OnnxEncoder(model_dir, int8=int8)
+    t0 = time.perf_counter()
+    got = encoder.encode([texts[i] for i in rows], normalize_embeddings=True)
+    encode_ms = (time.perf_counter() - t0) * 1000.0 / len(rows)
+
+    stored = np.asarray(matrix[rows], dtype=np.float32)
+    stored /= np.clip(np.linalg.norm(stored, axis=1, keepdims=True), 1e-12, None)
+    cos = (got * stored).sum(axis=1)
+    mode = "int8" if int8 else "fp32"
+    return {
+        "mode": mode,
+        "samples": int(len(rows)),
+        "mean_cosine": float(cos.mean()),
+        "min_cosine": float(cos.min()),
+        "encode_ms_per_text": round(encode_ms, 2),
+        "passed": bool(cos.min() >= PARITY_MIN_COSINE[mode]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export / check the ONNX query encoder.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_exp = sub.add_parser("export", help="export the embedding model to ONNX")
+    p_exp.add_argument("--model", default=EMBEDDING_MODEL_NAME)
+    p_exp.add_argument("--out-dir", default=str(ONNX_MODEL_DIR))
+    p_exp.add_argument("--no-quantize", action="store_true", help="skip the int8 copy")
+    p_par = sub.add_parser("parity", help="compare ONNX embeddings with the stored index")
+    p_par.add_argument("--vectors", default=None, help="default: the published index")
+    p_par.add_argument("--model-dir", default=str(ONNX_MODEL_DIR))
+    p_par.add_argument("--int8", action="store_true")
+    p_par.add_argument("--samples", type=int, default=64)
+    args = parser.parse_args()
+
+    if args.cmd == "export":
+        export(args.model, Path(args.out_dir), quantize=not args.no_quantize)
+    else:
+        report = parity(args.vectors, Path(args.model_dir), int8=args.int8, samples=args.samples)
+        print(json.dumps(report, indent=2))
+        if not report["passed"]:
+            raise SystemExit(f"[WARN] Parity check failed (min cosine < {PARITY_MIN_COSINE[report['mode']]})")
+
+
+if __name__ == "__main__":
+    main()
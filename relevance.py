@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# relevance.py
+#
+# Relevance gate in front of the LLM.
+#
+# When the retrieved chunks do not cover the question, SYSTEM_PROMPT makes the model
+# answer with a fixed sentence anyway: paying a completion (or a full agent run) for it
+# is pure latency and cost, and off-topic or abusive traffic would be billed the same.
+# The gate looks at the relevance signals exposed by Retriever.retrieve:
+#   - "dense_score"  cosine query/chunk (calibrated by the labeled set below);
+#   - "fused_score"  RRF score in [0, 1].
+# If no retrieved chunk reaches RELEVANCE_MIN_COSINE (and RELEVANCE_MIN_FUSED), the
+# canned reply is returned in the user's language without calling the LLM.
+# In degraded startup (sparse-only retrieval, no cosine) a question passes as soon
+# as one chunk shares a term with it.
+#
+# Tuning: relevance_labels.jsonl holds questions labeled relevant / not relevant for
+# this corpus. The gate ships disabled (RELEVANCE_GATE=1 enables it) until the sweep has
+# been run with the production embedding model.
+#   python relevance.py                 # sweeps the cosine threshold, prints precision/recall
+#   python relevance.py --labels my.jsonl --top-k 3
+
+import argparse
+import json
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Off by default: RELEVANCE_MIN_COSINE has not been calibrated against the production
+# model yet. Run `python relevance.py` with it, set the threshold from the sweep, then
+# RELEVANCE_GATE=1. While off, every question calls the LLM (the model still applies
+# the rule of the prompt).
+RELEVANCE_GATE = os.environ.get("RELEVANCE_GATE", "0").strip().lower() in ("1", "true", "yes", "on")
+# Minimum dense cosine of the best chunk (placeholder until calibrated; re-tune after a model change)
+RELEVANCE_MIN_COSINE = float(os.environ.get("RELEVANCE_MIN_COSINE", "0.30"))
+# Minimum normalized RRF score of that chunk (0.0 = not used)
+RELEVANCE_MIN_FUSED = float(os.environ.get("RELEVANCE_MIN_FUSED", "0.0"))
+
+LABELS_PATH = Path(__file__).resolve().parent / "relevance_labels.jsonl"
+
+# Same sentence as SYSTEM_PROMPT (agent.py), in the languages the assistant mirrors
+CANNED_REPLIES = {
+    "en": "I haven’t publicly shared that information yet.",
+    "it": "Non ho ancora condiviso pubblicamente questa informazione.",
+}
+
+_WORD_RE = re.compile(r"[^\W\d_]+", flags=re.UNICODE)
+_IT_WORDS = frozenset("""
+il lo la le gli un una di da del della delle dei degli nel nella che chi cosa come quando
+dove perché perche quale quali sono sei hai tuo tua tuoi tue mi ti ci si non per
+con su anche ma più piu molto questo questa quello ciao parlami dimmi raccontami studi
+lavori progetti esperienze competenze
+""".split())
+_EN_WORDS = frozenset("""
+the a an of to in on at for with what which who how when where why is are was were do does
+did have has you your yours me my about tell and or not can could would please hi hello
+""".split())
+
+
+def detect_language(text: str) -> str:
+    """'it' or 'en' from function-word counts (the assistant only mirrors these two)."""
+    words = [w.lower() for w in _WORD_RE.findall(text or "")]
+    it = sum(1 for w in words if w in _IT_WORDS)
+    en = sum(1 for w in words if w in _EN_WORDS)
+    return "it" if it > en else "en"
+
+
+def canned_reply(question: str) -> str:
+    return CANNED_REPLIES[detect_language(question)]
+
+
+def best_scores(chunks: List[Dict[str, Any]]) -> Dict[str, Optional[float]]:
+    dense = [c["dense_score"] for c in chunks if c.get("dense_score") is not None]
+    fused = [c.get("fused_score", 0.0) for c in chunks]
+    return {
+        "dense": max(dense) if dense else None,
+        "fused": max(fused) if fused else None,
+    }
+
+
+def gate_enabled() -> bool:
+    """Whether is_relevant can reject anything (callers skip the pre-retrieval otherwise)."""
+    return RELEVANCE_GATE
+
+
+def is_relevant(
+    chunks: List[Dict[str, Any]],
+    min_cosine: float = RELEVANCE_MIN_COSINE,
+    min_fused: float = RELEVANCE_MIN_FUSED,
+) -> bool:
+    """True if at least one retrieved chunk passes the thresholds (always True with the gate off)."""
+    if not gate_enabled():
+        return True
+    for c in chunks:
+        dense = c.get("dense_score")
+        if dense is not None and dense < min_cosine:
+            continue
+        if c.get("fused_score", 0.0) < min_fused:
+            continue
+        return True
+    return False
+
+
+def load_labels(path: Path = LABELS_PATH) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def sweep(retriever, labels: List[Dict[str, Any]], top_k: int = 3) -> Dict[str, Any]:
+    """
+    Best dense cosine of every labeled question, then precision/recall of the
+    "relevant" class for every candidate threshold.
+    """
+    rows = []
+    for item in labels:
+        chunks = retriever.retrieve(item["question"], top_k=top_k)
+        rows.append({**item, "best_cosine": best_scores(chunks)["dense"]})
+    if any(r["best_cosine"] is None for r in rows):
+        raise RuntimeError("Dense retrieval not available (embedding model not loaded).")
+
+    n_pos = sum(1 for r in rows if r["relevant"])
+    table = []
+    for t in sorted({round(r["best_cosine"], 3) for r in rows}):
+        tp = sum(1 for r in rows if r["relevant"] and r["best_cosine"] >= t)
+        fp = sum(1 for r in rows if not r["relevant"] and r["best_cosine"] >= t)
+        tn = sum(1 for r in rows if not r["relevant"] and r["best_cosine"] < t)
+        table.append({
+            "threshold": t,
+            "precision": tp / (tp + fp) if tp + fp else 1.0,
+            "recall": tp / n_pos if n_pos else 1.0,
+            "accuracy": (tp + tn) / len(rows),
+        })
+    # A false "not shared yet" on a real question is worse than one LLM call wasted:
+    # recommend the highest threshold that still lets every relevant question through.
+    full_recall = [r for r in table if r["recall"] >= 1.0]
+    recommended = max(full_recall, key=lambda r: r["threshold"]) if full_recall else None
+    return {"rows": rows, "table": table, "recommended": recommended}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune RELEVANCE_MIN_COSINE on a labeled question set.")
+    parser.add_argument("--labels", default=str(LABELS_PATH))
+    parser.add_argument("--top-k", type=int, default=3)
+    args = parser.parse_args()
+
+    from retriever import get_retriever
+
+    result = sweep(get_retriever(), load_labels(Path(args.labels)), top_k=args.top_k)
+    for r in sorted(result["rows"], key=lambda r: r["best_cosine"]):
+        mark = "+" if r["relevant"] else "-"
+        print(f"{mark} {r['best_cosine']:.3f}  {r['question']}")
+    print()
+    print("threshold  precision  recall  accuracy")
+    for r in result["table"]:
+        print(f"{r['threshold']:9.3f}  {r['precision']:9.2f}  {r['recall']:6.2f}  {r['accuracy']:8.2f}")
+    rec = result["recommended"]
+    if rec:
+        print(f"\nRecommended RELEVANCE_MIN_COSINE={rec['threshold']:.3f} "
+              f"(precision {rec['precision']:.2f}, current {RELEVANCE_MIN_COSINE})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,101 +1,203 @@
 import os
 
 # retriever.py
+import asyncio
 import json
-from typing import List, Dict, Any
+import time
+import threading
+from typing import List, Dict, Any, Optional, Tuple
 import numpy as np
 
-# Optional TF-IDF imports are guarded to avoid hard failures if artifacts are missing
+# scikit-learn / scipy / joblib are NOT imported here: the BM25 branch only needs
+# plain arrays + sparse_analyzer. They are imported lazily for legacy TF-IDF artifacts.
 from pathlib import Path
-try:
-    import joblib
-    from scipy.sparse import load_npz
-    from sklearn.preprocessing import normalize as _sk_normalize
-except Exception:
-    joblib = None
-    load_npz = None
-    _sk_normalize = None
-
-# IMPORTANT:
-# Must match the model used in build_index.py.
-EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+from bm25_index import BM25_INDEX, BM25Index
+from sparse_analyzer import SPARSE_VOCAB, SparseAnalyzer
+from caching import LRUCache, normalize_query
+from embedding_batcher import EMBED_BATCHING, get_embedding_batcher
+from embedding_model import EMBEDDING_MODEL_NAME, get_embedding_model, is_embedding_model_pending
+from dense_index import load_dense_index, scan_float32, top_k_rows
+from index_versions import current_vectors_path
+from metrics import stage
+from vector_store import load_vector_store, store_exists, store_paths
+
+# Bounded LRU in front of the query encoder (0 disables it).
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", "1024"))
+
+# Dense backend: "exact" (float32 scan), "int8" / "float16" (compact first pass
+# + float32 rescoring of DENSE_RESCORE_FACTOR x k candidates), or "ivf" (ANN over
+# DENSE_NPROBE clusters, 0 = ~10% of them and at least 8; exact scan below
+# dense_index.IVF_MIN_ROWS chunks).
+DENSE_INDEX_MODE = os.environ.get("DENSE_INDEX_MODE", "exact").strip().lower()
+DENSE_RESCORE_FACTOR = int(os.environ.get("DENSE_RESCORE_FACTOR", "4"))
+DENSE_NPROBE = int(os.environ.get("DENSE_NPROBE", "0"))
+
+# MMR diversity for the final top-k: 1.0 = pure relevance (off), lower values trade
+# relevance for chunks that differ from the ones already selected (0.7 is a good start).
+RETRIEVAL_MMR_LAMBDA = float(os.environ.get("RETRIEVAL_MMR_LAMBDA", "1.0"))
+# Fused candidates MMR picks from (x top_k)
+MMR_POOL_FACTOR = 4
+# Reciprocal Rank Fusion constant
+RRF_K = 60
+# retrieve_many: queries scored per block so that a [block x chunks] score matrix
+# stays around this many cells (4M float32 = 16 MB)
+BATCH_BLOCK_CELLS = 1 << 22
 
 # ---- Singleton cache to avoid reloading model and vectors on every request ----
 _RETRIEVER_SINGLETON = None
+_RETRIEVER_LOCK = threading.Lock()
+# Serializes reloads (two concurrent reloads would build the same index twice)
+_RELOAD_LOCK = threading.Lock()
+
+
+def _file_fingerprint(*paths: Path) -> str:
+    """mtime/size fingerprint of the index files (changes on every rebuild)."""
+    parts = []
+    for p in paths:
+        st = os.stat(p)
+        parts.append(f"{st.st_mtime_ns:x}-{st.st_size:x}")
+    return ":".join(parts)
 
 
 class Retriever:
     """
     Semantic retriever for CV Assistant.
 
-    - Loads vectors.json once.
-    - Loads SentenceTransformer model once.
+    - Loads the binary vector store (vectors.npy, memory-mapped) once;
+      falls back to the legacy vectors.json if the store is missing.
+    - Every other artifact (quantized/IVF copies, TF-IDF/BM25) is read from the same
+      directory as vectors_path, so one instance = one immutable index version.
+    - Uses the process-wide SentenceTransformer from embedding_model (never a second copy),
+      resolved lazily: while a background load is pending, retrieval is sparse-only.
     - Uses float32 and normalized vectors to reduce RAM and CPU.
     - (Optional) Loads TF-IDF artifacts and performs hybrid fusion (RRF) without
       changing the public API or output format.
     """
 
     def __init__(self, vectors_path: str = "vectors.json"):
-        from sentence_transformers import SentenceTransformer
-
-        if not os.path.exists(vectors_path):
-            raise FileNotFoundError(f"Cannot find {vectors_path}. Run build_index.py first.")
-
-        with open(vectors_path, "r", encoding="utf-8") as f:
-            self.index: List[Dict[str, Any]] = json.load(f)
-
-        # Matrix of float32 embeddings (dense)
-        embs = np.asarray([entry["embedding"] for entry in self.index], dtype=np.float32)
-
-        # Normalize (cosine = dot)
-        norms = np.linalg.norm(embs, axis=1, keepdims=True) + 1e-12
-        self.embeddings_matrix = (embs / norms).astype(np.float32)
-
-        # Cache text/metadata to avoid repeated lookups
-        self.texts = [e["text"] for e in self.index]
-        self.sources = [e.get("source", "") for e in self.index]
-        self.chunk_ids = [e.get("chunk_id", "") for e in self.index]
+        # Per-stage load time (ms), reported by the staged startup
+        self.load_timings: Dict[str, float] = {}
+        t0 = time.perf_counter()
+        self.index_dir = Path(vectors_path).parent
+
+        if store_exists(vectors_path):
+            self._load_binary_store(vectors_path)
+        elif os.path.exists(vectors_path):
+            self._load_json_store(vectors_path)
+        else:
+            raise FileNotFoundError(f"Cannot find {vectors_path} (or its .npy store). Run build_index.py first.")
 
         # Fast map: chunk_id -> dense index position
         self._id2idx = {cid: i for i, cid in enumerate(self.chunk_ids) if cid}
 
-        # CPU-only model (must match build_index.py)
-        self.model = SentenceTransformer(EMBEDDING_MODEL_NAME, device="cpu")
+        t1 = time.perf_counter()
+        self.load_timings["vectors"] = (t1 - t0) * 1000.0
+
+        # Dense search backend (exact or quantized with exact rescoring)
+        self.dense_index = load_dense_index(
+            DENSE_INDEX_MODE, self.embeddings_matrix, vectors_path,
+            rescore_factor=DENSE_RESCORE_FACTOR, nprobe=DENSE_NPROBE,
+        )
+        t2 = time.perf_counter()
+        self.load_timings["dense_index"] = (t2 - t1) * 1000.0
+
+        # Query embeddings keyed on normalized text: repeated questions skip torch.
+        self._embedding_cache = LRUCache(max_size=EMBEDDING_CACHE_SIZE)
 
         # ---- Optional TF-IDF state (loaded if artifacts exist) ----
         self._tfidf_available = False
         self._tfidf_doc_ids: List[str] = []
         self._tfidf_X_norm = None
         self._tfidf_vectorizer = None
+        self._sk_normalize = None
+        # BM25 inverted index + sklearn-free analyzer (preferred sparse engine)
+        self._bm25 = None
+        self._sparse_analyzer = None
 
         self._maybe_load_tfidf_artifacts()
+        self.load_timings["sparse_index"] = (time.perf_counter() - t2) * 1000.0
+
+    @property
+    def model(self):
+        # CPU-only model (must match build_index.py), shared with server.py.
+        # Loads synchronously on first use unless a background load is pending.
+        return get_embedding_model(EMBEDDING_MODEL_NAME, device="cpu", wait=False)
+
+    def dense_available(self) -> bool:
+        """False only while the embedding model is still loading in the background."""
+        return not is_embedding_model_pending(EMBEDDING_MODEL_NAME, device="cpu")
+
+    def _load_binary_store(self, vectors_path: str) -> None:
+        """
+        Preferred path: vectors.npy is memory-mapped (zero-copy, pages shared across
+        workers) and only the compact metadata JSON is parsed.
+        """
+        matrix, meta = load_vector_store(vectors_path, mmap=True)
+        # A float16 store stays memory-mapped as float16 (half the page cache, shared
+        # across workers); dense_index.scan_float32 widens it per block when scanning.
+        if not meta.get("normalized", False):
+            matrix = (matrix / (np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12)).astype(np.float32)
+        self.embeddings_matrix = matrix
+
+        chunks = meta["chunks"]
+        self.texts = [c["text"] for c in chunks]
+        self.sources = [c.get("source", "") for c in chunks]
+        self.chunk_ids = [c.get("chunk_id", "") for c in chunks]
+        if chunks and "hash" not in chunks[0]:
+            # Written before content hashes / heading chunks: not what build_index.py makes now
+            print(f"[WARN] {vectors_path} predates the current build pipeline "
+                  "(no content hashes); rebuild it with build_index.py + build_tfidf.py")
+
+        # Changes whenever the index is rebuilt; caches built on it key on this.
+        self.index_version = _file_fingerprint(*store_paths(vectors_path))
+
+    def _load_json_store(self, vectors_path: str) -> None:
+        """Legacy path: pretty-printed vectors.json with inline embeddings."""
+        with open(vectors_path, "r", encoding="utf-8") as f:
+            index: List[Dict[str, Any]] = json.load(f)
+
+        # Matrix of float32 embeddings (dense)
+        embs = np.asarray([entry["embedding"] for entry in index], dtype=np.float32)
+
+        # Normalize (cosine = dot)
+        norms = np.linalg.norm(embs, axis=1, keepdims=True) + 1e-12
+        self.embeddings_matrix = (embs / norms).astype(np.float32)
+
+        # Cache text/metadata to avoid repeated lookups
+        self.texts = [e["text"] for e in index]
+        self.sources = [e.get("source", "") for e in index]
+        self.chunk_ids = [e.get("chunk_id", "") for e in index]
+
+        self.index_version = _file_fingerprint(Path(vectors_path))
 
     def _maybe_load_tfidf_artifacts(self) -> None:
         """
-        Loads TF-IDF artifacts if present. If anything is missing or dependencies are absent,
-        it silently disables the sparse branch (fallback to dense-only).
+        Loads the sparse artifacts if present:
+        - preferred: bm25_index.npz + sparse_vocab.json (plain arrays, no scikit-learn);
+        - legacy: tfidf_matrix.npz + tfidf_vectorizer.pkl (TF-IDF cosine, needs scikit-learn).
+        If anything is missing or dependencies are absent, it silently disables the
+        sparse branch (fallback to dense-only).
         """
         try:
-            if joblib is None or load_npz is None or _sk_normalize is None:
-                # Dependencies not available: skip TF-IDF
-                return
-
-            meta_path = Path("tfidf_meta.json")
-            mat_path = Path("tfidf_matrix.npz")
-            vec_path = Path("tfidf_vectorizer.pkl")
-            if not (meta_path.exists() and mat_path.exists() and vec_path.exists()):
+            meta_path = self.index_dir / "tfidf_meta.json"
+            if not meta_path.exists():
                 return
 
-            # Load metadata
+            # Load metadata (row order shared by every sparse artifact)
             meta = json.loads(meta_path.read_text(encoding="utf-8"))
             self._tfidf_doc_ids = meta.get("doc_ids", [])
 
-            # Load matrix and pre-normalize rows for cosine
-            X = load_npz(mat_path)  # CSR matrix [n_docs x vocab]
-            self._tfidf_X_norm = _sk_normalize(X, copy=False)
-
-            # Load vectorizer
-            self._tfidf_vectorizer = joblib.load(vec_path)
+            bm25_path, vocab_path = self.index_dir / BM25_INDEX, self.index_dir / SPARSE_VOCAB
+            if bm25_path.exists() and vocab_path.exists():
+                bm25 = BM25Index.load(bm25_path)
+                analyzer = SparseAnalyzer.load(vocab_path)
+                if bm25.num_docs != len(self._tfidf_doc_ids) or bm25.num_terms != len(analyzer.terms):
+                    raise ValueError("bm25_index.npz / sparse_vocab.json do not match tfidf_meta.json")
+                self._bm25 = bm25
+                self._sparse_analyzer = analyzer
+            else:
+                self._load_legacy_tfidf()
 
             # Sanity: ensure TF-IDF doc_ids exist in dense space (best effort)
             # (If a doc_id is missing, it will simply be skipped at search time.)
@@ -106,91 +208,390 @@ class Retriever:
             self._tfidf_doc_ids = []
             self._tfidf_X_norm = None
             self._tfidf_vectorizer = None
+            self._bm25 = None
+            self._sparse_analyzer = None
+
+    def _load_legacy_tfidf(self) -> None:
+        """TF-IDF cosine over the pickled vectorizer (raises if artifacts/deps are missing)."""
+        import joblib
+        from scipy.sparse import load_npz
+        from sklearn.preprocessing import normalize as _sk_normalize
+
+        # Load matrix and pre-normalize rows for cosine
+        X = load_npz(self.index_dir / "tfidf_matrix.npz")  # CSR matrix [n_docs x vocab]
+        self._tfidf_X_norm = _sk_normalize(X, copy=False)
+        self._sk_normalize = _sk_normalize
+
+        # Load vectorizer
+        self._tfidf_vectorizer = joblib.load(self.index_dir / "tfidf_vectorizer.pkl")
 
     def _embed_text(self, text: str) -> np.ndarray:
-        # Returns normalized float32 vector
-        vec = self.model.encode([text], show_progress_bar=False, normalize_embeddings=True)
-        return np.asarray(vec[0], dtype=np.float32)
+        # Returns normalized float32 vector (read-only: it may be shared via the cache)
+        key = normalize_query(text)
+        cached = self._embedding_cache.get(key)
+        if cached is not None:
+            return cached
+
+        if EMBED_BATCHING:
+            # Concurrent queries share one encode() call (embedding_batcher.py)
+            vec = get_embedding_batcher(EMBEDDING_MODEL_NAME, device="cpu").embed(text)
+        else:
+            vec = self.model.encode([text], show_progress_bar=False, normalize_embeddings=True)[0]
+        return self._cache_embedding(key, vec)
+
+    def _cache_embedding(self, key: str, vec: np.ndarray) -> np.ndarray:
+        # Own copy: a batched row would otherwise keep the whole batch array alive
+        out = np.array(vec, dtype=np.float32)
+        out.setflags(write=False)
+        self._embedding_cache.put(key, out)
+        return out
+
+    async def a_embed_query(self, query: str) -> np.ndarray:
+        """
+        Async twin of embed_query: awaits the batcher instead of holding a worker
+        thread while the batch is encoded. Fills the same LRU as the sync path.
+        """
+        key = normalize_query(query)
+        cached = self._embedding_cache.get(key)
+        if cached is not None:
+            return cached
+        if not EMBED_BATCHING:
+            return await asyncio.to_thread(self._embed_text, query)
+        vec = await get_embedding_batcher(EMBEDDING_MODEL_NAME, device="cpu").aembed(query)
+        return self._cache_embedding(key, vec)
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Public access to the (cached) normalized query embedding."""
+        return self._embed_text(query)
+
+    def embedding_cache_stats(self) -> Dict[str, Any]:
+        return self._embedding_cache.stats()
 
     def _dense_search_ids(self, query_vec: np.ndarray, pre_k: int = 50) -> List[str]:
         """
         Returns a list of doc_ids (chunk_ids) ranked by dense cosine similarity.
         """
-        sims = self.embeddings_matrix @ query_vec  # dense cosine
-        idx = np.argsort(-sims)[:pre_k]
+        idx, _ = self.dense_index.search(query_vec, pre_k)
         return [self.chunk_ids[i] for i in idx]
 
-    def _sparse_search_ids(self, query: str, pre_k: int = 50) -> List[str]:
+    def _sparse_search(self, query: str, pre_k: int = 50) -> Tuple[List[str], List[float]]:
         """
-        Returns a list of doc_ids (chunk_ids) ranked by TF-IDF cosine similarity.
-        If TF-IDF is not available, returns an empty list.
+        Returns doc_ids (chunk_ids) ranked by BM25 (inverted index), or by TF-IDF cosine
+        similarity with legacy artifacts, and their sparse scores.
+        If the sparse branch is not available, returns empty lists.
         """
         if not self._tfidf_available or not query:
-            return []
+            return [], []
 
-        q = self._tfidf_vectorizer.transform([query])
-        q = _sk_normalize(q)  # cosine in TF-IDF space
-        scores = (q @ self._tfidf_X_norm.T).toarray().ravel()
-        if scores.size == 0:
-            return []
+        if self._bm25 is not None:
+            # Only the postings of the query terms are touched
+            idx, scores = self._bm25.search(self._sparse_analyzer.term_ids(query), top_k=pre_k)
+        else:
+            q = self._tfidf_vectorizer.transform([query])
+            q = self._sk_normalize(q)  # cosine in TF-IDF space
+            all_scores = (q @ self._tfidf_X_norm.T).toarray().ravel()
+            if all_scores.size == 0:
+                return [], []
+            # Same top-k selection as retrieve_many; documents sharing no term with
+            # the query get no sparse rank (as with BM25, which only returns matches)
+            idx = top_k_rows(all_scores[None, :], pre_k)[0]
+            idx = idx[all_scores[idx] > 0]
+            scores = all_scores[idx]
 
-        idx = np.argsort(-scores)[:pre_k]
         out_ids: List[str] = []
-        for i in idx:
+        out_scores: List[float] = []
+        for i, score in zip(idx, scores):
             # Map TF-IDF row i -> its doc_id, then ensure it exists in dense index
             doc_id = self._tfidf_doc_ids[i] if i < len(self._tfidf_doc_ids) else None
             if doc_id and doc_id in self._id2idx:
                 out_ids.append(doc_id)
-        return out_ids
+                out_scores.append(float(score))
+        return out_ids, out_scores
+
+    def _sparse_search_ids(self, query: str, pre_k: int = 50) -> List[str]:
+        return self._sparse_search(query, pre_k)[0]
 
     @staticmethod
-    def _rrf_fuse(orderings: Dict[str, List[str]], k: int = 60) -> List[str]:
+    def _rrf_scores(orderings: Dict[str, List[str]], k: int = 60) -> Dict[str, float]:
         """
-        Reciprocal Rank Fusion over doc_id lists.
-        Returns a fused list of doc_ids sorted by fused score.
+        Reciprocal Rank Fusion scores, divided by the best attainable one (rank 1 in
+        every ordering), so 1.0 = top of every list whatever the number of lists.
         """
         from collections import defaultdict
         scores = defaultdict(float)
-        for _, ranked in orderings.items():
+        lists = [ranked for ranked in orderings.values() if ranked]
+        for ranked in lists:
             for rank, doc_id in enumerate(ranked, start=1):
                 scores[doc_id] += 1.0 / (k + rank)
-        return [doc_id for doc_id, _ in sorted(scores.items(), key=lambda x: x[1], reverse=True)]
+        best = len(lists) / (k + 1.0)
+        return {doc_id: s / best for doc_id, s in scores.items()}
+
+    def _retrieve_sparse_only(self, query: str, top_k: int) -> List[Dict[str, Any]]:
+        """
+        Degraded mode while the dense model warms up: BM25/TF-IDF ranking only.
+        Same output shape; "score" is 0.0 and "dense_score" None because no dense
+        cosine is available. Documents sharing no term with the query are left out.
+        """
+        ids, sparse_scores = self._sparse_search(query, pre_k=top_k)
+        fused = self._rrf_scores({"sparse": ids}, k=RRF_K)
+        out: List[Dict[str, Any]] = []
+        for doc_id, sparse_score in zip(ids, sparse_scores):
+            if sparse_score <= 0.0:
+                continue
+            i = self._id2idx[doc_id]
+            out.append({
+                "text": self.texts[i],
+                "source": self.sources[i],
+                "chunk_id": self.chunk_ids[i],
+                "score": 0.0,
+                "dense_score": None,
+                "fused_score": fused[doc_id],
+            })
+        return out
+
+    def _mmr_select(self, q: np.ndarray, candidate_ids: List[str], top_k: int, lam: float) -> List[str]:
+        """
+        Maximal Marginal Relevance over the fused candidates: each pick maximizes
+        lam * cos(query, d) - (1 - lam) * max cos(d, already picked),
+        so near-identical chunks do not fill every slot.
+        """
+        rows = [self._id2idx[d] for d in candidate_ids if d in self._id2idx]
+        if len(rows) <= 1:
+            return [self.chunk_ids[i] for i in rows]
+        cand = np.asarray(self.embeddings_matrix[rows], dtype=np.float32)
+        relevance = cand @ q
+        redundancy = np.full(len(rows), -np.inf, dtype=np.float32)
+        available = np.ones(len(rows), dtype=bool)
+        picked: List[int] = []
+        for _ in range(min(top_k, len(rows))):
+            mmr = lam * relevance - (1.0 - lam) * redundancy if picked else relevance
+            j = int(np.where(available, mmr, -np.inf).argmax())
+            picked.append(j)
+            available[j] = False
+            redundancy = np.maximum(redundancy, cand @ cand[j])
+        return [self.chunk_ids[rows[j]] for j in picked]
+
+    def retrieve(self, query: str, top_k: int = 3, mmr_lambda: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Hybrid top_k. mmr_lambda < 1.0 (default RETRIEVAL_MMR_LAMBDA) re-ranks the fused
+        candidates with MMR for diversity; 1.0 keeps the plain fused order.
+
+        Every item carries two relevance signals (used by relevance.py to gate the LLM):
+        - "dense_score": exact float32 cosine query/chunk (same value as "score");
+        - "fused_score": RRF score in [0, 1], 1.0 = ranked first by every branch.
+        """
+        lam = RETRIEVAL_MMR_LAMBDA if mmr_lambda is None else float(mmr_lambda)
+        if not self.dense_available():
+            with stage("sparse"):
+                return self._retrieve_sparse_only(query, top_k)
 
-    def retrieve(self, query: str, top_k: int = 3) -> List[Dict[str, Any]]:
-        # 1) Dense ranking (as before)
-        q = self._embed_text(query)
-        sims = self.embeddings_matrix @ q
-        dense_idx = np.argsort(-sims)  # keep full order once for scoring
-        dense_order_ids = [self.chunk_ids[i] for i in dense_idx[:50]]
+        # 1) Dense ranking (exact or quantized backend)
+        with stage("embed"):
+            q = self._embed_text(query)
+        with stage("dense"):
+            dense_order_ids = self._dense_search_ids(q, pre_k=50)
 
         # 2) Optional sparse ranking (TF-IDF)
-        sparse_order_ids = self._sparse_search_ids(query, pre_k=50)
+        with stage("sparse"):
+            sparse_order_ids = self._sparse_search_ids(query, pre_k=50)
 
         # 3) Fusion → list of final doc_ids
-        if sparse_order_ids:
-            fused_ids = self._rrf_fuse({"dense": dense_order_ids, "sparse": sparse_order_ids}, k=60)
-            final_ids = fused_ids[:top_k]
-        else:
-            final_ids = dense_order_ids[:top_k]
+        with stage("fusion"):
+            fused_scores = self._rrf_scores({"dense": dense_order_ids, "sparse": sparse_order_ids}, k=RRF_K)
+            if sparse_order_ids:
+                fused_ids = [d for d, _ in sorted(fused_scores.items(), key=lambda x: x[1], reverse=True)]
+            else:
+                fused_ids = dense_order_ids
+            if lam < 1.0:
+                final_ids = self._mmr_select(q, fused_ids[:top_k * MMR_POOL_FACTOR], top_k, lam)
+            else:
+                final_ids = fused_ids[:top_k]
 
         # 4) Build output in the exact same shape as before.
-        #    Score remains the dense cosine score for compatibility.
+        #    Score remains the exact float32 dense cosine, computed for the final rows only.
         out: List[Dict[str, Any]] = []
         for doc_id in final_ids:
             i = self._id2idx.get(doc_id)
             if i is None:
                 continue
+            cosine = float(self.embeddings_matrix[i] @ q)
             out.append({
                 "text": self.texts[i],
                 "source": self.sources[i],
                 "chunk_id": self.chunk_ids[i],
-                "score": float(sims[i]),  # keep dense cosine score for stability
+                "score": cosine,  # keep dense cosine score for stability
+                "dense_score": cosine,
+                "fused_score": fused_scores.get(doc_id, 0.0),
             })
         return out
 
+    # ---- Batched retrieval (offline evaluation, cache warming, /api/retrieve/batch) ----
+
+    def _embed_many(self, queries: List[str]) -> np.ndarray:
+        """[len(queries) x dim] normalized embeddings: cached ones from the LRU, the rest in one encode()."""
+        keys = [normalize_query(q) for q in queries]
+        vecs: Dict[str, np.ndarray] = {}
+        missing: Dict[str, str] = {}
+        for key, q in zip(keys, queries):
+            if key in vecs or key in missing:
+                continue
+            cached = self._embedding_cache.get(key)
+            if cached is not None:
+                vecs[key] = cached
+            else:
+                missing[key] = q
+        if missing:
+            fresh = self.model.encode(list(missing.values()), batch_size=64,
+                                      show_progress_bar=False, normalize_embeddings=True)
+            for key, vec in zip(missing, fresh):
+                vecs[key] = self._cache_embedding(key, vec)
+        return np.stack([vecs[key] for key in keys]).astype(np.float32, copy=False)
+
+    def _sparse_row_map(self) -> np.ndarray:
+        """Sparse row id -> dense row id (-1 if the chunk is not in the dense index)."""
+        if getattr(self, "_sparse_rows", None) is None:
+            self._sparse_rows = np.asarray(
+                [self._id2idx.get(d, -1) for d in self._tfidf_doc_ids], dtype=np.int64)
+        return self._sparse_rows
+
+    def _sparse_search_many(self, queries: List[str], pre_k: int) -> List[np.ndarray]:
+        """Batched _sparse_search: per query, the dense row ids of its sparse ranking."""
+        if not self._tfidf_available:
+            return [np.empty(0, dtype=np.int64) for _ in queries]
+        if self._bm25 is not None:
+            ranked = [idx for idx, _ in self._bm25.search_many(
+                [self._sparse_analyzer.term_ids(q) if q else [] for q in queries], top_k=pre_k)]
+        else:
+            # Legacy TF-IDF: one sparse [queries x vocab] @ [vocab x docs] product
+            Q = self._sk_normalize(self._tfidf_vectorizer.transform(queries))
+            S = (Q @ self._tfidf_X_norm.T).toarray().astype(np.float32)
+            top = top_k_rows(S, pre_k)
+            ranked = [top[r][S[r, top[r]] > 0] if q else np.empty(0, dtype=np.int64)
+                      for r, q in enumerate(queries)]
+        rows = self._sparse_row_map()
+        out = []
+        for idx in ranked:
+            idx = idx[idx < rows.shape[0]]
+            mapped = rows[idx]
+            out.append(mapped[mapped >= 0])
+        return out
 
-def get_retriever(vectors_path: str = "vectors.json") -> Retriever:
+    def retrieve_many(self, queries: List[str], top_k: int = 3, mmr_lambda: Optional[float] = None,
+                      pre_k: int = 50) -> List[List[Dict[str, Any]]]:
+        """
+        retrieve() for a batch of queries, vectorized: one encode() call, one
+        [queries x chunks] matrix product for dense (exact cosine, whatever DENSE_INDEX_MODE),
+        one batched BM25/TF-IDF pass, and RRF computed on [queries x candidates] arrays.
+        Same item shape and ranking as retrieve() (ties broken the same way: dense first).
+        """
+        if not queries:
+            return []
+        lam = RETRIEVAL_MMR_LAMBDA if mmr_lambda is None else float(mmr_lambda)
+        if not self.dense_available():
+            return [self._retrieve_sparse_only(q, top_k) for q in queries]
+
+        Q = self._embed_many(queries)
+        sparse_ranked = self._sparse_search_many(queries, pre_k)
+        n = len(self.chunk_ids)
+        take = top_k * MMR_POOL_FACTOR if lam < 1.0 else top_k
+        block = max(1, BATCH_BLOCK_CELLS // max(1, n))
+        results: List[List[Dict[str, Any]]] = []
+
+        for b0 in range(0, len(queries), block):
+            b1 = min(len(queries), b0 + block)
+            m = b1 - b0
+            D = scan_float32(self.embeddings_matrix, Q[b0:b1].T).T  # [m x n] dense cosines
+            dense_top = top_k_rows(D, pre_k)                  # [m x p] best first
+            p = dense_top.shape[1]
+
+            # Sparse rankings padded to a rectangle (-1 = no entry)
+            p2 = max([len(sparse_ranked[r]) for r in range(b0, b1)] + [0])
+            sparse_top = np.full((m, p2), -1, dtype=np.int64)
+            for r in range(m):
+                ranked = sparse_ranked[b0 + r]
+                sparse_top[r, :len(ranked)] = ranked
+            valid = sparse_top >= 0
+            rows = np.arange(m)[:, None]
+
+            # RRF scores and insertion order (dense ranks first, then sparse-only docs),
+            # accumulated in [m x n] scratch arrays indexed by chunk row
+            fused = np.zeros((m, n), dtype=np.float64)
+            fused[rows, dense_top] += 1.0 / (RRF_K + 1.0 + np.arange(p))
+            r_idx, c_idx = np.nonzero(valid)
+            fused[r_idx, sparse_top[r_idx, c_idx]] += 1.0 / (RRF_K + 1.0 + c_idx)
+            first_seen = np.full((m, n), np.iinfo(np.int64).max, dtype=np.int64)
+            first_seen[rows, dense_top] = np.arange(p)
+            s_docs = sparse_top[r_idx, c_idx]
+            first_seen[r_idx, s_docs] = np.minimum(first_seen[r_idx, s_docs], p + c_idx)
+
+            # Candidates = dense top + sparse top (sparse duplicates of dense docs masked)
+            cand = np.concatenate([dense_top, np.where(valid, sparse_top, 0)], axis=1)
+            cand_ok = np.concatenate([np.ones((m, p), dtype=bool), valid], axis=1)
+            cand_seen = first_seen[rows, cand]
+            cand_ok[:, p:] &= cand_seen[:, p:] >= p
+            cand_score = np.where(cand_ok, fused[rows, cand], -np.inf)
+            order = np.lexsort((cand_seen, -cand_score), axis=-1)[:, :take]
+            best = cand[rows, order]
+            best_ok = np.take_along_axis(cand_ok, order, axis=1)
+            n_lists = 1.0 + (valid.any(axis=1))       # lists that actually ranked something
+            norm = n_lists / (RRF_K + 1.0)
+
+            for r in range(m):
+                picked = best[r][best_ok[r]]
+                if lam < 1.0:
+                    ids = self._mmr_select(Q[b0 + r], [self.chunk_ids[i] for i in picked], top_k, lam)
+                    picked = [self._id2idx[d] for d in ids]
+                out: List[Dict[str, Any]] = []
+                for i in picked:
+                    cosine = float(D[r, i])
+                    out.append({
+                        "text": self.texts[i],
+                        "source": self.sources[i],
+                        "chunk_id": self.chunk_ids[i],
+                        "score": cosine,
+                        "dense_score": cosine,
+                        "fused_score": float(fused[r, i] / norm[r]),
+                    })
+                results.append(out)
+        return results
+
+
+def get_retriever(vectors_path: Optional[str] = None) -> Retriever:
+    """
+    Process-wide Retriever. vectors_path=None means the published index version
+    (index_versions.current_vectors_path(), the repo root if none was published).
+    Callers should keep the returned object for a whole request: a reload swaps the
+    singleton, but in-flight requests finish on the instance they already hold.
+    """
     global _RETRIEVER_SINGLETON
     if _RETRIEVER_SINGLETON is None:
-        _RETRIEVER_SINGLETON = Retriever(vectors_path=vectors_path)
+        # Startup thread and early requests may race here: build it once
+        with _RETRIEVER_LOCK:
+            if _RETRIEVER_SINGLETON is None:
+                _RETRIEVER_SINGLETON = Retriever(vectors_path=vectors_path or current_vectors_path())
     return _RETRIEVER_SINGLETON
+
+
+def reload_retriever(vectors_path: Optional[str] = None) -> Retriever:
+    """
+    Builds a Retriever for the published index next to the live one, then swaps it in
+    (a single reference assignment, atomic for readers). The embedding model is the
+    shared instance from embedding_model, so only the index artifacts are read.
+    If loading fails, the exception propagates and the old index stays live.
+    """
+    global _RETRIEVER_SINGLETON
+    with _RELOAD_LOCK:
+        new = Retriever(vectors_path=vectors_path or current_vectors_path())
+        old = _RETRIEVER_SINGLETON
+        if old is not None:
+            # Query embeddings do not depend on the index: keep the warm cache
+            new._embedding_cache = old._embedding_cache
+        with _RETRIEVER_LOCK:
+            _RETRIEVER_SINGLETON = new
+    print(f"[INFO] Index reloaded from {new.index_dir} (version {new.index_version}, "
+          f"{len(new.chunk_ids)} chunks)")
+    return new
+
+
+def is_retriever_loaded() -> bool:
+    return _RETRIEVER_SINGLETON is not None
@@ -1,17 +1,29 @@
 import os
-from typing import List, Optional, Union
+import json
+import time
+import asyncio
+from typing import Any, Dict, List, Optional, Union
 
-from fastapi import FastAPI, HTTPException, Response
+from fastapi import FastAPI, Header, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv, find_dotenv
-from sentence_transformers import SentenceTransformer
 
 # ---- Env ----
 load_dotenv(find_dotenv(), override=True)
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
     print("[WARN] OPENAI_API_KEY not found. Set it before running the server.")
+# Enables POST /admin/reload, GET /admin/stats and POST /api/retrieve/batch (sent as the
+# X-Admin-Token header); unset = endpoints disabled.
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+# > 0: poll the published index every N seconds and hot-reload it when it changes.
+INDEX_WATCH_INTERVAL_S = float(os.environ.get("INDEX_WATCH_INTERVAL_S", "0"))
+# Limits of POST /api/retrieve/batch (one request = one vectorized pass over the index)
+RETRIEVE_BATCH_MAX = int(os.environ.get("RETRIEVE_BATCH_MAX", "1000"))
+RETRIEVE_TOP_K_MAX = 20
+RETRIEVE_QUERY_MAX_CHARS = int(os.environ.get("RETRIEVE_QUERY_MAX_CHARS", "2000"))
 
 class SourceItem(BaseModel):
     source: str
@@ -24,23 +36,80 @@ class ChatQuery(BaseModel):
 class ChatResponse(BaseModel):
     answer: str
     sources: Optional[List[SourceItem]] = None
+    # Only with ?timings=true: per-stage durations (ms) of this request
+    timings_ms: Optional[Dict[str, float]] = None
+
+class RetrieveBatchQuery(BaseModel):
+    queries: List[str]
+    top_k: int = 3
+    include_text: bool = False
+
+class RetrievedChunk(SourceItem):
+    dense_score: Optional[float] = None
+    fused_score: float = 0.0
+    text: Optional[str] = None
+
+class RetrieveBatchResult(BaseModel):
+    query: str
+    chunks: List[RetrievedChunk]
+
+class RetrieveBatchResponse(BaseModel):
+    results: List[RetrieveBatchResult]
+    index_version: str
+    took_ms: float
 
 # ---- Dynamic import of the agent after load_dotenv ----
 try:
-    from agent import answer_question 
+    from agent import a_answer_question, a_stream_answer, answer_cache_stats, get_llm_client, close_llm_client
 except Exception as e:
     print("[WARN] agent.py not available or with errors:", e)
-    def answer_question(q: str):
-        raise RuntimeError("agent.answer_question not available")
+    async def a_answer_question(q: str):
+        raise RuntimeError("agent.a_answer_question not available")
+    async def a_stream_answer(q: str):
+        raise RuntimeError("agent.a_stream_answer not available")
+        yield  # pragma: no cover (makes this an async generator)
+    def answer_cache_stats():
+        return {}
+    def get_llm_client():
+        return None
+    async def close_llm_client():
+        return None
+
+from embedding_batcher import embedding_batcher_stats
+from embedding_model import is_embedding_model_loaded
+from index_versions import IndexWatcher
+from metrics import ServerTimingMiddleware, current_timings, record_error, register_collector, render
+from retriever import get_retriever, is_retriever_loaded, reload_retriever
+from staged_startup import StagedStartup
 
 # ---- App ----
 app = FastAPI()
-app.state.embedder = None
+
+_STARTUP = StagedStartup()
+_WATCHER = IndexWatcher(on_change=reload_retriever, interval_s=INDEX_WATCH_INTERVAL_S)
 
 @app.on_event("startup")
 def load_model_once():
-    if app.state.embedder is None:
-        app.state.embedder = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+    # Returns immediately: the index, then the shared embedding model and its warm-up,
+    # load in a background thread. The port opens (and /healthz answers) right away;
+    # until the model is ready, /api/chat serves sparse-only retrieval.
+    _STARTUP.start()
+
+@app.on_event("startup")
+def watch_index():
+    # No-op unless INDEX_WATCH_INTERVAL_S > 0
+    _WATCHER.start()
+
+@app.on_event("startup")
+def build_llm_client_once():
+    # One pooled client for the whole process, shared by every request.
+    if OPENAI_API_KEY:
+        get_llm_client()
+
+@app.on_event("shutdown")
+async def close_llm_pool():
+    _WATCHER.stop()
+    await close_llm_client()
 
 # ---- CORS (GitHub Pages) ----
 # Your site origin: https://kaj04.github.io  (no path)
@@ -53,10 +122,42 @@ app.add_middleware(
     max_age=86400,                                      # preflight cache (optional)
 )
 
+# ---- Instrumentation ----
+# Server-Timing header + request/error counters on the API routes (see metrics.py)
+app.add_middleware(ServerTimingMiddleware, paths=["/api/chat", "/api/chat/stream", "/api/retrieve/batch"])
+
+def _collect_cache_metrics():
+    # Read at scrape time from the counters the caches and the batcher already keep
+    if is_retriever_loaded():
+        retriever = get_retriever()
+        emb = retriever.embedding_cache_stats()
+        yield ("embedding_cache_hits_total", "counter", "Query embedding cache hits.", {}, emb["hits"])
+        yield ("embedding_cache_misses_total", "counter", "Query embedding cache misses.", {}, emb["misses"])
+        yield ("index_chunks", "gauge", "Chunks in the loaded index.",
+               {"version": retriever.index_version}, len(retriever.chunk_ids))
+    ans = answer_cache_stats() or {}
+    if "hits" in ans:
+        yield ("answer_cache_hits_total", "counter", "Semantic answer cache hits.", {}, ans["hits"])
+        yield ("answer_cache_misses_total", "counter", "Semantic answer cache misses.", {}, ans["misses"])
+    for model, b in embedding_batcher_stats().items():
+        yield ("embed_batches_total", "counter", "Encoder calls made by the embedding batcher.",
+               {"model": model}, b["batches"])
+        yield ("embed_batched_queries_total", "counter", "Queries encoded by the embedding batcher.",
+               {"model": model}, b["queries"])
+        for q in ("p50", "p95"):
+            yield ("embed_queue_wait_ms", "gauge", "Embedding batcher queue wait (recent requests).",
+                   {"model": model, "quantile": q}, b["queue_wait_ms"][q])
+
+register_collector(_collect_cache_metrics)
+
 @app.options("/api/chat")
 def options_chat():
     return Response(status_code=200)
 
+@app.options("/api/chat/stream")
+def options_chat_stream():
+    return Response(status_code=200)
+
 # ---- Routes ----
 @app.get("/")
 def root():
@@ -66,13 +167,131 @@ def root():
 def health():
     return {"status": "healthy"}
 
-@app.post("/api/chat", response_model=ChatResponse)
-def chat(q: ChatQuery):
+@app.get("/readyz")
+def ready(response: Response):
+    # Liveness is /healthz; readiness means the model and the index are in memory.
+    # "degraded" (503): the index is up and chat answers with sparse-only retrieval.
+    checks = {
+        "embedding_model": is_embedding_model_loaded(),
+        "index": is_retriever_loaded(),
+    }
+    is_ready = all(checks.values())
+    if not is_ready:
+        response.status_code = 503
+    startup = _STARTUP.snapshot()
+    if is_ready:
+        status = "ready"
+    elif startup["status"] in ("degraded", "failed"):
+        status = startup["status"]
+    else:
+        status = "loading"
+    return {"status": status, "checks": checks, "startup": startup}
+
+@app.post("/admin/reload")
+async def admin_reload(x_admin_token: str = Header(default="")):
+    """
+    Hot-swaps the retriever onto the published index version (index_versions.py build).
+    The new index loads in a worker thread while requests keep being served by the old
+    one; requests already running finish on the old version.
+    """
+    if not ADMIN_TOKEN or x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="forbidden")
+    previous = get_retriever().index_version if is_retriever_loaded() else None
+    try:
+        retriever = await asyncio.to_thread(reload_retriever)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"reload failed, previous index kept: {e}")
+    return {
+        "status": "reloaded",
+        "index_dir": str(retriever.index_dir),
+        "index_version": retriever.index_version,
+        "previous_version": previous,
+        "chunks": len(retriever.chunk_ids),
+        "load_timings_ms": {k: round(v, 1) for k, v in retriever.load_timings.items()},
+    }
+
+@app.get("/admin/stats")
+def admin_stats(x_admin_token: str = Header(default="")):
+    """Cache and embedding micro-batching counters (batch sizes, queue wait)."""
+    if not ADMIN_TOKEN or x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="forbidden")
+    return {
+        "embedding_batcher": embedding_batcher_stats(),
+        "embedding_cache": get_retriever().embedding_cache_stats() if is_retriever_loaded() else None,
+        "answer_cache": answer_cache_stats(),
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text format: stage/request latency histograms, tokens, caches, batcher."""
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/api/chat", response_model=ChatResponse, response_model_exclude_unset=True)
+async def chat(q: ChatQuery, timings: bool = False):
     try:
-        result = answer_question(q.question)
-        return {
-            "answer": result["answer"],
-            "sources": result.get("sources", []),
-        }
+        result = await a_answer_question(q.question)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        # detail = {"error", "stage", "message"}: the stage that failed (embed, llm, ...)
+        raise HTTPException(status_code=500, detail=record_error("/api/chat", e))
+    body = {
+        "answer": result["answer"],
+        "sources": result.get("sources", []),
+    }
+    if timings and current_timings() is not None:
+        body["timings_ms"] = current_timings().as_dict()
+    return body
+
+
+@app.post("/api/retrieve/batch", response_model=RetrieveBatchResponse, response_model_exclude_none=True)
+async def retrieve_batch(q: RetrieveBatchQuery, x_admin_token: str = Header(default="")):
+    """
+    Retrieval only (no LLM) for many questions at once: offline evaluation, cache
+    warming. Scored by Retriever.retrieve_many in one vectorized pass.
+    Admin only: one request can keep the encoder busy for seconds.
+    """
+    if not ADMIN_TOKEN or x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="forbidden")
+    if not q.queries or len(q.queries) > RETRIEVE_BATCH_MAX:
+        raise HTTPException(status_code=422, detail=f"queries must hold 1..{RETRIEVE_BATCH_MAX} strings")
+    if not 1 <= q.top_k <= RETRIEVE_TOP_K_MAX:
+        raise HTTPException(status_code=422, detail=f"top_k must be in 1..{RETRIEVE_TOP_K_MAX}")
+    if any(len(query) > RETRIEVE_QUERY_MAX_CHARS for query in q.queries):
+        raise HTTPException(status_code=422, detail=f"queries must be at most {RETRIEVE_QUERY_MAX_CHARS} characters")
+    retriever = get_retriever()
+    t0 = time.perf_counter()
+    try:
+        ranked = await asyncio.to_thread(retriever.retrieve_many, q.queries, q.top_k)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=record_error("/api/retrieve/batch", e))
+    took_ms = (time.perf_counter() - t0) * 1000.0
+    results = []
+    for query, chunks in zip(q.queries, ranked):
+        if not q.include_text:
+            chunks = [{k: v for k, v in c.items() if k != "text"} for c in chunks]
+        results.append({"query": query, "chunks": chunks})
+    return {"results": results, "index_version": retriever.index_version, "took_ms": round(took_ms, 1)}
+
+
+def _sse(event: str, data: Any) -> str:
+    # One Server-Sent Event; data is always JSON so token deltas keep their newlines.
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/api/chat/stream")
+async def chat_stream(q: ChatQuery):
+    """
+    Same answer as /api/chat, streamed as SSE: `sources`, then `token`* and `done`
+    (with timings). Failures after the stream has started arrive as an `error` event.
+    """
+    async def events():
+        try:
+            async for ev in a_stream_answer(q.question):
+                yield _sse(ev["event"], ev["data"])
+        except Exception as e:
+            err = record_error("/api/chat/stream", e)
+            yield _sse("error", {"detail": str(e), "error": err["error"], "stage": err["stage"]})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
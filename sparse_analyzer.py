@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# sparse_analyzer.py
+#
+# Dependency-free query analyzer for the sparse (BM25) branch.
+#
+# build_tfidf.py exports the fitted TfidfVectorizer's analysis settings and vocabulary
+# to sparse_vocab.json; at serving time this module re-implements sklearn's "word"
+# analyzer (lowercase -> token_pattern -> stop words -> word n-grams) on top of it,
+# so scikit-learn, scipy and joblib are only needed to *build* the index.
+#
+# Parity check against the sklearn vectorizer (needs scikit-learn):
+#   python sparse_analyzer.py
+
+import argparse
+import json
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+SPARSE_VOCAB = Path("sparse_vocab.json")
+SCHEMA_VERSION = 1
+
+
+class SparseAnalyzer:
+    """
+    Same output as TfidfVectorizer(analyzer="word", ...).build_analyzer() for the
+    settings this repo uses (no custom preprocessor/tokenizer, strip_accents=None).
+    """
+
+    def __init__(self, token_pattern: str, lowercase: bool, stop_words: List[str],
+                 ngram_range: List[int], terms: List[str]):
+        self.token_pattern = token_pattern
+        self._findall = re.compile(token_pattern).findall
+        self.lowercase = bool(lowercase)
+        self.stop_words = frozenset(stop_words)
+        self.ngram_range = (int(ngram_range[0]), int(ngram_range[1]))
+        self.terms = terms
+        self.vocabulary: Dict[str, int] = {t: i for i, t in enumerate(terms)}
+
+    @classmethod
+    def load(cls, path: Path = SPARSE_VOCAB) -> "SparseAnalyzer":
+        cfg = json.loads(Path(path).read_text(encoding="utf-8"))
+        return cls(
+            token_pattern=cfg["token_pattern"],
+            lowercase=cfg["lowercase"],
+            stop_words=cfg["stop_words"],
+            ngram_range=cfg["ngram_range"],
+            terms=cfg["terms"],
+        )
+
+    def __call__(self, doc: str) -> List[str]:
+        if self.lowercase:
+            doc = doc.lower()
+        tokens = [w for w in self._findall(doc) if w not in self.stop_words]
+
+        min_n, max_n = self.ngram_range
+        if max_n == 1:
+            return tokens
+        # As sklearn: unigrams first (if min_n == 1), then n-grams over the filtered tokens
+        out = list(tokens) if min_n == 1 else []
+        n_tokens = len(tokens)
+        for n in range(max(min_n, 2), min(max_n + 1, n_tokens + 1)):
+            for i in range(n_tokens - n + 1):
+                out.append(" ".join(tokens[i:i + n]))
+        return out
+
+    def term_ids(self, doc: str) -> List[int]:
+        """Vocabulary ids of the analyzed terms (out-of-vocabulary terms dropped)."""
+        vocab = self.vocabulary
+        return [vocab[t] for t in self(doc) if t in vocab]
+
+
+def export_sparse_vocab(vectorizer, path: Path = SPARSE_VOCAB) -> Path:
+    """
+    Writes the analysis config + vocabulary (terms ordered by column id) of a fitted
+    sklearn TfidfVectorizer/CountVectorizer. Called by build_tfidf.py.
+    """
+    params = vectorizer.get_params()
+    unsupported = {
+        k: params[k] for k in ("analyzer", "preprocessor", "tokenizer", "strip_accents")
+        if params[k] not in (None, "word")
+    }
+    if unsupported:
+        raise ValueError(f"SparseAnalyzer does not support these vectorizer settings: {unsupported}")
+
+    stop_words = vectorizer.get_stop_words() or []
+    terms = [""] * len(vectorizer.vocabulary_)
+    for term, idx in vectorizer.vocabulary_.items():
+        terms[idx] = term
+
+    cfg: Dict[str, Any] = {
+        "schema_version": SCHEMA_VERSION,
+        "token_pattern": params["token_pattern"],
+        "lowercase": bool(params["lowercase"]),
+        "stop_words": sorted(stop_words),
+        "ngram_range": list(params["ngram_range"]),
+        "terms": terms,
+    }
+    Path(path).write_text(json.dumps(cfg, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+    return Path(path)
+
+
+def check_parity(vectorizer, analyzer: SparseAnalyzer, texts: List[str]) -> Optional[str]:
+    """
+    Compares SparseAnalyzer with the sklearn analyzer on `texts`.
+    Returns None if the token streams and vocabulary ids are identical, else a description.
+    """
+    reference = vectorizer.build_analyzer()
+    if analyzer.vocabulary != vectorizer.vocabulary_:
+        return "vocabulary differs from the sklearn vectorizer"
+    for text in texts:
+        expected, got = reference(text), analyzer(text)
+        if expected != got:
+            return f"token mismatch on {text[:60]!r}: sklearn={expected[:8]} ... ours={got[:8]} ..."
+    return None
+
+
+PARITY_QUERIES = [
+    "What did you build at NTT Data?",
+    "What are your strongest skills?",
+    "What motivates you?",
+    "Quali sono le tue competenze in Machine Learning?",
+    "C++, Python & SQL -- e-mail: francesco@example.com (2023/2024)",
+    "  Über naïve CAFÉ façade—résumé  ",
+    "",
+    "a I x",
+]
+
+
+def main():
+    import joblib
+
+    parser = argparse.ArgumentParser(description="Check SparseAnalyzer parity with the sklearn vectorizer.")
+    parser.add_argument("--vectorizer", default="tfidf_vectorizer.pkl")
+    parser.add_argument("--meta", default="vectors_meta.json")
+    args = parser.parse_args()
+
+    vectorizer = joblib.load(args.vectorizer)
+    analyzer = SparseAnalyzer.load(SPARSE_VOCAB)
+    texts = list(PARITY_QUERIES)
+    if Path(args.meta).exists():
+        meta = json.loads(Path(args.meta).read_text(encoding="utf-8"))
+        texts += [c["text"] for c in meta.get("chunks", [])]
+
+    problem = check_parity(vectorizer, analyzer, texts)
+    if problem:
+        raise SystemExit(f"PARITY FAILED: {problem}")
+    print(f"OK: SparseAnalyzer matches the sklearn analyzer on {len(texts)} texts "
+          f"(vocab={len(analyzer.terms)})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# staged_startup.py
+#
+# Background, staged loading of the heavy serving state.
+#
+# The startup hook used to block until the SentenceTransformer and the index were in
+# memory, so the port opened (and /healthz answered) only after several seconds, and
+# Render could mark the cold instance as failed. Now the hook only starts this loader:
+#
+#   1. index            vectors + dense backend + BM25   (fast, numpy/mmap only)
+#   2. embedding_model  SentenceTransformer load         (slow, torch)
+#   3. warmup           one dummy encode                 (tokenizer, kernels, thread pools)
+#
+# As soon as stage 1 is done the service is "degraded": requests are answered with
+# sparse-only retrieval. After stage 3 it is "ready" (hybrid retrieval). /readyz reports
+# the current status and the duration of every stage.
+
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from embedding_model import (
+    EMBEDDING_MODEL_NAME,
+    cancel_deferred_embedding_model,
+    defer_embedding_model,
+    get_embedding_model,
+    warm_up_embedding_model,
+)
+from retriever import get_retriever
+
+STAGES = ("index", "embedding_model", "warmup")
+
+
+class StagedStartup:
+    """
+    Runs the startup stages in a daemon thread.
+    status: pending -> degraded (index loaded) -> ready, or failed (see `error`).
+    """
+
+    def __init__(self, vectors_path: Optional[str] = None, device: str = "cpu"):
+        # None: the published index version (see index_versions.py)
+        self.vectors_path = vectors_path
+        self.device = device
+        self.status = "pending"
+        self.error: Optional[str] = None
+        self.stage_ms: Dict[str, float] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        # Before the thread exists, so the first request already sees "model pending"
+        # and goes sparse-only instead of loading the model synchronously.
+        defer_embedding_model(EMBEDDING_MODEL_NAME, device=self.device)
+        self._thread = threading.Thread(target=self._run, name="staged-startup", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        try:
+            retriever = self._stage("index", lambda: get_retriever(vectors_path=self.vectors_path))
+            for name, ms in retriever.load_timings.items():
+                print(f"[INFO] startup: index/{name} {ms:.0f} ms")
+            self.status = "degraded"
+
+            self._stage("embedding_model", lambda: get_embedding_model(EMBEDDING_MODEL_NAME, device=self.device))
+            self._stage("warmup", lambda: warm_up_embedding_model(EMBEDDING_MODEL_NAME, device=self.device))
+            self.status = "ready"
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(e)
+            print("[WARN] Staged startup failed:", e)
+        finally:
+            # If a stage failed before the model loaded, nothing will clear the pending
+            # mark: drop it so a later request loads the model (no retry otherwise).
+            cancel_deferred_embedding_model(EMBEDDING_MODEL_NAME, device=self.device)
+
+    def _stage(self, name: str, fn) -> Any:
+        t0 = time.perf_counter()
+        result = fn()
+        self.stage_ms[name] = (time.perf_counter() - t0) * 1000.0
+        print(f"[INFO] startup: {name} {self.stage_ms[name]:.0f} ms")
+        return result
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until all stages ran (scripts/tests). Returns False on timeout."""
+        if self._thread is None:
+            return False
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def snapshot(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            "status": self.status,
+            "stages_ms": {k: round(v, 1) for k, v in self.stage_ms.items()},
+        }
+        if self.error:
+            out["error"] = self.error
+        return out
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# stub_llm.py
+#
+# Local OpenAI-compatible stub server for load tests and benchmarks (no API key, no
+# network, no cost). Point the service at it with
+#   OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=stub uvicorn server:app
+#
+# Endpoints (enough for datapizza's OpenAIClient and plain OpenAI SDK users):
+# - POST /v1/responses          Responses API, JSON or SSE stream (what agent.py uses)
+# - POST /v1/chat/completions   Chat Completions API, JSON or SSE stream
+# - GET  /v1/models, /healthz
+#
+# Timing model (all configurable, see --help):
+#   time to first token = --latency-ms (+ uniform jitter of --jitter-ms)
+#   then one token every --token-ms, --output-tokens tokens in total
+# A non-streamed request returns after the same total time. Usage is reported like the
+# real API (input tokens ~ characters / 4), so the /metrics token counters move too.
+#
+# Agent mode (CHAT_MODE=agent): when the request offers tools and has no tool result yet,
+# the stub calls the first tool with the user's question, then answers on the next turn.
+#
+# Usage:
+#   python stub_llm.py                          # 127.0.0.1:8001, 300 ms TTFT, 20 ms/token
+#   python stub_llm.py --latency-ms 0 --token-ms 0 --port 9000
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+STUB_LATENCY_MS = float(os.environ.get("STUB_LATENCY_MS", "300"))
+STUB_JITTER_MS = float(os.environ.get("STUB_JITTER_MS", "0"))
+STUB_TOKEN_MS = float(os.environ.get("STUB_TOKEN_MS", "20"))
+STUB_OUTPUT_TOKENS = int(os.environ.get("STUB_OUTPUT_TOKENS", "60"))
+
+_ANSWER_WORDS = (
+    "Thanks for asking! Based on my CV, I worked on retrieval systems, data pipelines and "
+    "backend services, mostly in Python. I enjoy turning research prototypes into reliable "
+    "products and I am always happy to share more details about any of my projects."
+).split()
+
+
+class StubConfig:
+    def __init__(self, latency_ms: float = STUB_LATENCY_MS, jitter_ms: float = STUB_JITTER_MS,
+                 token_ms: float = STUB_TOKEN_MS, output_tokens: int = STUB_OUTPUT_TOKENS):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.token_ms = token_ms
+        self.output_tokens = max(1, int(output_tokens))
+
+    def first_token_delay_s(self) -> float:
+        return (self.latency_ms + random.uniform(0.0, self.jitter_ms)) / 1000.0
+
+    def tokens(self) -> List[str]:
+        # One "token" per word (with its leading space), cycling the canned answer
+        words = [_ANSWER_WORDS[i % len(_ANSWER_WORDS)] for i in range(self.output_tokens)]
+        return [w if i == 0 else " " + w for i, w in enumerate(words)]
+
+
+CONFIG = StubConfig()
+STATS = {"requests": 0, "streamed": 0, "tool_calls": 0}
+
+app = FastAPI()
+
+
+def _estimate_tokens(payload: Any) -> int:
+    return max(1, len(json.dumps(payload, ensure_ascii=False)) // 4)
+
+
+def _last_user_text(messages: Any) -> str:
+    if isinstance(messages, str):
+        return messages
+    for item in reversed(messages or []):
+        if item.get("role") != "user":
+            continue
+        content = item.get("content")
+        if isinstance(content, str):
+            return content
+        for part in content or []:
+            if isinstance(part, dict) and part.get("text"):
+                return part["text"]
+    return ""
+
+
+def _tool_to_call(body: Dict[str, Any]) -> Dict[str, Any]:
+    """First offered tool, unless the conversation already holds a tool result."""
+    tools = body.get("tools") or []
+    items = body.get("input") if "input" in body else body.get("messages")
+    if not tools or not isinstance(items, list):
+        return {}
+    if any(isinstance(i, dict) and (i.get("type") == "function_call_output" or i.get("role") == "tool")
+           for i in items):
+        return {}
+    tool = tools[0].get("function", tools[0])  # chat completions nest it under "function"
+    params = (tool.get("parameters") or {}).get("properties") or {}
+    arg = next(iter(params), "question")
+    return {"name": tool["name"], "arguments": json.dumps({arg: _last_user_text(items)})}
+
+
+async def _paced_tokens() -> AsyncIterator[str]:
+    await asyncio.sleep(CONFIG.first_token_delay_s())
+    for i, token in enumerate(CONFIG.tokens()):
+        if i and CONFIG.token_ms > 0:
+            await asyncio.sleep(CONFIG.token_ms / 1000.0)
+        yield token
+
+
+def _sse(data: Dict[str, Any], event: str = "") -> str:
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {json.dumps(data)}\n\n"
+
+
+# ---- Responses API ----
+def _response_object(body: Dict[str, Any], text: str, output_tokens: int, call: Dict[str, Any]) -> Dict[str, Any]:
+    if call:
+        output = [{
+            "type": "function_call", "id": "fc_" + uuid.uuid4().hex[:12], "call_id": "call_" + uuid.uuid4().hex[:12],
+            "name": call["name"], "arguments": call["arguments"], "status": "completed",
+        }]
+    else:
+        output = [{
+            "type": "message", "id": "msg_" + uuid.uuid4().hex[:12], "role": "assistant", "status": "completed",
+            "content": [{"type": "output_text", "text": text, "annotations": []}],
+        }]
+    input_tokens = _estimate_tokens(body.get("input"))
+    return {
+        "id": "resp_" + uuid.uuid4().hex[:12],
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": body.get("model", "stub"),
+        "status": "completed",
+        "output": output,
+        "parallel_tool_calls": True,
+        "tool_choice": body.get("tool_choice", "auto"),
+        "tools": body.get("tools") or [],
+        "usage": {
+            "input_tokens": input_tokens,
+            "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens": output_tokens,
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": input_tokens + output_tokens,
+        },
+    }
+
+
+@app.post("/v1/responses")
+async def responses(request: Request):
+    body = await request.json()
+    STATS["requests"] += 1
+    call = _tool_to_call(body)
+    if call:
+        STATS["tool_calls"] += 1
+
+    if not body.get("stream"):
+        await asyncio.sleep(CONFIG.first_token_delay_s() + CONFIG.token_ms * (CONFIG.output_tokens - 1) / 1000.0)
+        tokens = [] if call else CONFIG.tokens()
+        return _response_object(body, "".join(tokens), len(tokens) or 1, call)
+
+    STATS["streamed"] += 1
+
+    async def events():
+        seq = 0
+        item_id = "msg_" + uuid.uuid4().hex[:12]
+        tokens: List[str] = []
+        if call:
+            await asyncio.sleep(CONFIG.first_token_delay_s())
+        else:
+            async for token in _paced_tokens():
+                tokens.append(token)
+                yield _sse({"type": "response.output_text.delta", "item_id": item_id, "output_index": 0,
+                            "content_index": 0, "delta": token, "logprobs": [], "sequence_number": seq},
+                           "response.output_text.delta")
+                seq += 1
+        final = _response_object(body, "".join(tokens), len(tokens) or 1, call)
+        yield _sse({"type": "response.completed", "response": final, "sequence_number": seq}, "response.completed")
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+# ---- Chat Completions API ----
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    STATS["requests"] += 1
+    call = _tool_to_call(body)
+    if call:
+        STATS["tool_calls"] += 1
+    cid, created, model = "chatcmpl-" + uuid.uuid4().hex[:12], int(time.time()), body.get("model", "stub")
+    prompt_tokens = _estimate_tokens(body.get("messages"))
+
+    def tool_calls() -> List[Dict[str, Any]]:
+        return [{"id": "call_" + uuid.uuid4().hex[:12], "type": "function",
+                 "function": {"name": call["name"], "arguments": call["arguments"]}}]
+
+    if not body.get("stream"):
+        await asyncio.sleep(CONFIG.first_token_delay_s() + CONFIG.token_ms * (CONFIG.output_tokens - 1) / 1000.0)
+        tokens = [] if call else CONFIG.tokens()
+        message = {"role": "assistant", "content": None if call else "".join(tokens)}
+        if call:
+            message["tool_calls"] = tool_calls()
+        return {
+            "id": cid, "object": "chat.completion", "created": created, "model": model,
+            "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if call else "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens) or 1,
+                      "total_tokens": prompt_tokens + (len(tokens) or 1)},
+        }
+
+    STATS["streamed"] += 1
+
+    async def events():
+        def chunk(delta: Dict[str, Any], finish=None) -> str:
+            return _sse({"id": cid, "object": "chat.completion.chunk", "created": created, "model": model,
+                         "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]})
+        if call:
+            await asyncio.sleep(CONFIG.first_token_delay_s())
+            yield chunk({"role": "assistant", "tool_calls": [{"index": 0, **tool_calls()[0]}]})
+            yield chunk({}, "tool_calls")
+        else:
+            first = True
+            async for token in _paced_tokens():
+                yield chunk({"role": "assistant", "content": token} if first else {"content": token})
+                first = False
+            yield chunk({}, "stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/v1/models")
+def models():
+    return {"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model", "owned_by": "stub"}]}
+
+
+@app.get("/healthz")
+def health():
+    return {"status": "healthy", **STATS}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub LLM server for load tests.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=STUB_LATENCY_MS, help="time to first token")
+    parser.add_argument("--jitter-ms", type=float, default=STUB_JITTER_MS, help="uniform extra first-token delay")
+    parser.add_argument("--token-ms", type=float, default=STUB_TOKEN_MS, help="delay between streamed tokens")
+    parser.add_argument("--output-tokens", type=int, default=STUB_OUTPUT_TOKENS, help="tokens per answer")
+    args = parser.parse_args()
+
+    CONFIG.__init__(args.latency_ms, args.jitter_ms, args.token_ms, args.output_tokens)
+    import uvicorn
+    print(f"[INFO] Stub LLM on http://{args.host}:{args.port}/v1 (first token {args.latency_ms} ms "
+          f"+ {args.jitter_ms} ms jitter, {args.output_tokens} tokens x {args.token_ms} ms)")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
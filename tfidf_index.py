@@ -2,15 +2,17 @@
 #
 # Loads the TF-IDF artifacts and exposes a simple search() method.
 # It is intentionally minimal to avoid coupling with the rest of the codebase.
+# Scores with the BM25 inverted index when bm25_index.npz + sparse_vocab.json exist
+# (no scikit-learn needed), TF-IDF cosine over the pickled vectorizer otherwise.
 
 from pathlib import Path
 from typing import List, Tuple
 import json
 
 import numpy as np
-from scipy.sparse import load_npz
-from sklearn.preprocessing import normalize
-import joblib
+
+from bm25_index import BM25_INDEX, BM25Index
+from sparse_analyzer import SPARSE_VOCAB, SparseAnalyzer
 
 TFIDF_META = Path("tfidf_meta.json")
 TFIDF_MATRIX = Path("tfidf_matrix.npz")
@@ -21,29 +23,42 @@ class TfidfSearcher:
     """Lightweight TF-IDF searcher built on top of the saved artifacts."""
 
     def __init__(self) -> None:
-        self.available = (
-            TFIDF_META.exists() and
-            TFIDF_MATRIX.exists() and
-            TFIDF_VECTORIZER.exists()
+        use_bm25 = BM25_INDEX.exists() and SPARSE_VOCAB.exists()
+        self.available = TFIDF_META.exists() and (
+            use_bm25 or (TFIDF_MATRIX.exists() and TFIDF_VECTORIZER.exists())
         )
+        self._X_norm = None
+        self._vectorizer = None
+        self._bm25 = None
+        self._analyzer = None
         if not self.available:
             self.doc_ids = []
-            self._X_norm = None
-            self._vectorizer = None
             return
 
         meta = json.loads(TFIDF_META.read_text(encoding="utf-8"))
         self.doc_ids = meta.get("doc_ids", [])
-        X = load_npz(TFIDF_MATRIX)  # CSR matrix [n_docs x vocab]
-        self._X_norm = normalize(X, copy=False)  # pre-normalized for cosine
-        self._vectorizer = joblib.load(TFIDF_VECTORIZER)
+        if use_bm25:
+            self._bm25 = BM25Index.load(BM25_INDEX)
+            self._analyzer = SparseAnalyzer.load(SPARSE_VOCAB)
+        else:
+            import joblib
+            from scipy.sparse import load_npz
+            from sklearn.preprocessing import normalize
+
+            X = load_npz(TFIDF_MATRIX)  # CSR matrix [n_docs x vocab]
+            self._X_norm = normalize(X, copy=False)  # pre-normalized for cosine
+            self._normalize = normalize
+            self._vectorizer = joblib.load(TFIDF_VECTORIZER)
 
     def search(self, query: str, top_k: int = 50) -> List[Tuple[str, float]]:
         """Returns a list of (doc_id, score) sorted by descending similarity."""
         if not self.available or not query:
             return []
+        if self._bm25 is not None:
+            idx, bm25_scores = self._bm25.search(self._analyzer.term_ids(query), top_k=top_k)
+            return [(self.doc_ids[i], float(s)) for i, s in zip(idx, bm25_scores)]
         q = self._vectorizer.transform([query])
-        q = normalize(q)  # cosine in TF-IDF space
+        q = self._normalize(q)  # cosine in TF-IDF space
         scores = (q @ self._X_norm.T).toarray().ravel()
         if scores.size == 0:
             return []
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# vector_store.py
+#
+# Binary vector store used by build_index.py and retriever.py.
+#
+# On disk (next to each other):
+# - vectors.npy        contiguous [n_chunks x dim] matrix, L2-normalized rows (float32 or float16)
+# - vectors_meta.json  compact metadata: model, dim, dtype and per-chunk source / chunk_id / text /
+#                      hash (content hash, lets build_index.py --incremental reuse embeddings) /
+#                      headings (markdown heading path of the chunk, when known)
+#
+# np.load(..., mmap_mode="r") opens the matrix without parsing or copying it, so boot time
+# and RSS no longer depend on JSON parsing, and several worker processes share the same
+# page-cache pages. A float16 matrix is served as float16 too (half the page cache):
+# exact scans widen it block by block, ~5x slower than float32.
+#
+# Usage (convert a legacy pretty-printed vectors.json):
+#   python vector_store.py vectors.json [--dtype float16]
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+SCHEMA_VERSION = 1
+SUPPORTED_DTYPES = ("float32", "float16")
+
+
+def chunk_hash(source: str, text: str) -> str:
+    """Content hash of a chunk: same source and text -> same embedding."""
+    return hashlib.sha1(f"{source}\0{text}".encode("utf-8")).hexdigest()
+
+
+def store_paths(vectors_path: str) -> Tuple[Path, Path]:
+    """
+    Maps the historical "vectors.json" name to its binary siblings:
+    vectors.json -> (vectors.npy, vectors_meta.json).
+    """
+    p = Path(vectors_path)
+    return p.with_suffix(".npy"), p.with_name(f"{p.stem}_meta.json")
+
+
+def store_exists(vectors_path: str) -> bool:
+    matrix_path, meta_path = store_paths(vectors_path)
+    return matrix_path.exists() and meta_path.exists()
+
+
+class VectorStoreWriter:
+    """
+    Appends batches of chunks + embeddings to a binary store without ever holding the
+    whole matrix (or all the texts) in memory: rows go to a raw temp file, chunk metadata
+    to a JSON-lines temp file, and close() assembles vectors.npy / vectors_meta.json and
+    swaps them in with os.replace (readers memory-mapping the old files are unaffected).
+
+        with VectorStoreWriter("vectors.json", model_name=...) as writer:
+            writer.append(chunks, embeddings)   # any number of times
+
+    Rows are L2-normalized here, so the retriever can use them as-is (cosine = dot).
+    """
+
+    def __init__(self, vectors_path: str = "vectors.json", dtype: str = "float32", model_name: str = ""):
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"dtype must be one of {SUPPORTED_DTYPES}, got {dtype!r}")
+        self.dtype = np.dtype(dtype)
+        self.model_name = model_name
+        self.matrix_path, self.meta_path = store_paths(vectors_path)
+        self._rows_path = self.matrix_path.with_name(self.matrix_path.name + ".rows.tmp")
+        self._chunks_path = self.meta_path.with_name(self.meta_path.name + ".chunks.tmp")
+        self._rows = open(self._rows_path, "wb")
+        self._chunks = open(self._chunks_path, "w", encoding="utf-8")
+        self.num_chunks = 0
+        self.dim = 0
+        # Extra top-level fields for vectors_meta.json (e.g. build_index's "duplicates")
+        self.extra_meta: Dict[str, Any] = {}
+
+    def append(self, chunks: List[Dict[str, Any]], embeddings) -> None:
+        embs = np.asarray(embeddings, dtype=np.float32)
+        if embs.ndim != 2:
+            embs = embs.reshape(len(chunks), -1)
+        if embs.shape[0] != len(chunks):
+            raise ValueError(f"{len(chunks)} chunks but {embs.shape[0]} embeddings")
+        if embs.shape[0] == 0:
+            return
+        if self.dim and embs.shape[1] != self.dim:
+            raise ValueError(f"embedding dim changed from {self.dim} to {embs.shape[1]}")
+        self.dim = int(embs.shape[1])
+
+        embs = embs / (np.linalg.norm(embs, axis=1, keepdims=True) + 1e-12)
+        self._rows.write(np.ascontiguousarray(embs.astype(self.dtype)).tobytes())
+        for c in chunks:
+            entry = {
+                "source": c.get("source", ""),
+                "chunk_id": c.get("chunk_id", ""),
+                "text": c["text"],
+                "hash": c.get("hash") or chunk_hash(c.get("source", ""), c["text"]),
+            }
+            if c.get("headings"):
+                entry["headings"] = c["headings"]
+            self._chunks.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self.num_chunks += len(chunks)
+
+    def close(self) -> Tuple[Path, Path]:
+        self._rows.close()
+        self._chunks.close()
+
+        tmp_matrix = self.matrix_path.with_name(self.matrix_path.name + ".tmp")
+        with open(tmp_matrix, "wb") as out, open(self._rows_path, "rb") as rows:
+            np.lib.format.write_array_header_1_0(out, {
+                "descr": np.lib.format.dtype_to_descr(self.dtype),
+                "fortran_order": False,
+                "shape": (self.num_chunks, self.dim),
+            })
+            shutil.copyfileobj(rows, out, 1 << 20)
+
+        meta = {
+            "schema_version": SCHEMA_VERSION,
+            "model": self.model_name,
+            "num_chunks": self.num_chunks,
+            "dim": self.dim,
+            "dtype": self.dtype.name,
+            "normalized": True,
+            **self.extra_meta,
+        }
+        # No indentation: the texts dominate the size, pretty-printing only adds noise.
+        head = json.dumps(meta, ensure_ascii=False, separators=(",", ":"))
+        tmp_meta = self.meta_path.with_name(self.meta_path.name + ".tmp")
+        with open(tmp_meta, "w", encoding="utf-8") as out, open(self._chunks_path, "r", encoding="utf-8") as lines:
+            out.write(head[:-1] + ',"chunks":[')
+            for i, line in enumerate(lines):
+                out.write(("," if i else "") + line.rstrip("\n"))
+            out.write("]}")
+
+        os.replace(tmp_matrix, self.matrix_path)
+        os.replace(tmp_meta, self.meta_path)
+        self._remove_temp_files()
+        return self.matrix_path, self.meta_path
+
+    def abort(self) -> None:
+        self._rows.close()
+        self._chunks.close()
+        self._remove_temp_files()
+
+    def _remove_temp_files(self) -> None:
+        for p in (self._rows_path, self._chunks_path):
+            if p.exists():
+                p.unlink()
+
+    def __enter__(self) -> "VectorStoreWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def save_vector_store(
+    vectors: List[Dict[str, Any]],
+    vectors_path: str = "vectors.json",
+    dtype: str = "float32",
+    model_name: str = "",
+) -> Tuple[Path, Path]:
+    """
+    Writes entries shaped like build_index.embed_chunks output
+    ({"source", "chunk_id", "text", "embedding"}) as a binary store in one go.
+    """
+    with VectorStoreWriter(vectors_path, dtype=dtype, model_name=model_name) as writer:
+        writer.append(vectors, [v["embedding"] for v in vectors])
+    return writer.matrix_path, writer.meta_path
+
+
+def load_vector_store(vectors_path: str = "vectors.json", mmap: bool = True) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """
+    Returns (matrix, meta). With mmap=True the matrix is a read-only memory map.
+    """
+    matrix_path, meta_path = store_paths(vectors_path)
+    meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    matrix = np.load(matrix_path, mmap_mode="r" if mmap else None)
+    if matrix.shape[0] != len(meta.get("chunks", [])):
+        raise ValueError(
+            f"{matrix_path} has {matrix.shape[0]} rows but {meta_path} lists "
+            f"{len(meta.get('chunks', []))} chunks. Rebuild the index."
+        )
+    return matrix, meta
+
+
+def convert_json_store(vectors_path: str = "vectors.json", dtype: str = "float32", model_name: str = "") -> Tuple[Path, Path]:
+    """Converts a legacy vectors.json (list of entries with "embedding") to the binary store."""
+    with open(vectors_path, "r", encoding="utf-8") as f:
+        vectors = json.load(f)
+    return save_vector_store(vectors, vectors_path=vectors_path, dtype=dtype, model_name=model_name)
+
+
+def main():
+    from embedding_model import EMBEDDING_MODEL_NAME
+
+    parser = argparse.ArgumentParser(description="Convert vectors.json to the binary vector store.")
+    parser.add_argument("vectors_path", nargs="?", default="vectors.json")
+    parser.add_argument("--dtype", choices=SUPPORTED_DTYPES, default="float32")
+    args = parser.parse_args()
+
+    matrix_path, meta_path = convert_json_store(args.vectors_path, dtype=args.dtype, model_name=EMBEDDING_MODEL_NAME)
+    print(f"OK: saved {matrix_path} ({matrix_path.stat().st_size} bytes) "
+          f"and {meta_path} ({meta_path.stat().st_size} bytes)")
+
+    from dense_index import QUANTIZED_MODES, save_quantized
+    matrix, _ = load_vector_store(args.vectors_path, mmap=True)
+    for mode in QUANTIZED_MODES:
+        path = save_quantized(matrix, args.vectors_path, mode)
+        print(f"OK: saved {path} ({path.stat().st_size} bytes)")
+
+
+if __name__ == "__main__":
+    main()